@@ -0,0 +1,155 @@
+from pydantic import BaseModel
+from typing import Literal
+from dotenv import load_dotenv
+import os
+
+load_dotenv(override=True)
+
+COST_BASIS_METHOD = os.getenv("COST_BASIS_METHOD", "fifo").strip().lower()
+TOLERANCE = 1e-6
+
+
+class Lot(BaseModel):
+    seq: int = 0
+    quantity: int
+    price: float
+    timestamp: str
+
+
+class Position(BaseModel):
+    symbol: str
+    quantity: int = 0
+    cost_basis: float = 0.0
+    realized_pnl: float = 0.0
+    next_lot: int = 0
+    first_lot: int = 0
+    # The open lots, oldest first; read from the database, only the oldest ones a sell uses up are loaded,
+    # and None means none were loaded
+    lots: list[Lot] | None = []
+
+    def average_cost(self) -> float:
+        return self.cost_basis / self.quantity if self.quantity else 0.0
+
+    def report(self, price: float) -> dict:
+        market_value = price * self.quantity
+        return {
+            "quantity": self.quantity,
+            "average_cost": self.average_cost(),
+            "cost_basis": self.cost_basis,
+            "market_value": market_value,
+            "realized_profit_loss": self.realized_pnl,
+            "unrealized_profit_loss": market_value - self.cost_basis,
+        }
+
+    def changes(self) -> dict:
+        """
+        The position with only its first and last lots, the only ones a single trade can add or change:
+        a buy appends the last, and a sell uses up lots from the front, leaving the first partly used.
+        Every lot numbered before first_lot has been used up.
+        """
+        edges = self.lots[:1] + self.lots[1:][-1:]
+        return {**self.model_dump(exclude={"lots"}), "lots": [lot.model_dump() for lot in edges]}
+
+
+class Book(BaseModel):
+    """
+    The running accounting state of an account: open lots, cost basis and realized P&L per symbol,
+    plus the net amount spent on trades. Each transaction is applied once as it happens,
+    so reporting does not need to go back over the trade history.
+    Sells consume lots first-in first-out, or with the "average" method, from one lot at the average cost.
+    """
+
+    method: Literal["fifo", "average"] = COST_BASIS_METHOD
+    net_spend: float = 0.0
+    realized_pnl: float = 0.0
+    transaction_count: int = 0
+    positions: dict[str, Position] = {}
+
+    def _buy(self, position: Position, quantity: int, price: float, timestamp: str) -> None:
+        position.quantity += quantity
+        position.cost_basis += quantity * price
+        seq = position.next_lot
+        position.next_lot += 1
+        if self.method == "average":
+            position.lots = [Lot(seq=seq, quantity=position.quantity, price=position.average_cost(), timestamp=timestamp)]
+            position.first_lot = seq
+        else:
+            position.lots.append(Lot(seq=seq, quantity=quantity, price=price, timestamp=timestamp))
+
+    def _sell(self, position: Position, quantity: int, price: float) -> float:
+        """Remove quantity from the position's lots and return the cost of what was sold"""
+        if self.method == "average":
+            cost = position.average_cost() * quantity
+        else:
+            cost = 0.0
+            remaining = quantity
+            while remaining and position.lots:
+                lot = position.lots[0]
+                used = min(lot.quantity, remaining)
+                cost += used * lot.price
+                lot.quantity -= used
+                remaining -= used
+                if lot.quantity == 0:
+                    position.lots.pop(0)
+                    position.first_lot = lot.seq + 1
+        position.quantity -= quantity
+        position.cost_basis = max(position.cost_basis - cost, 0.0) if position.quantity else 0.0
+        if self.method == "average" and position.lots:
+            position.lots[0].quantity = position.quantity
+        realized = quantity * price - cost
+        position.realized_pnl += realized
+        return realized
+
+    def apply(self, transaction) -> None:
+        """Apply a transaction: anything with symbol, quantity (negative for a sell), price and timestamp"""
+        position = self.positions.setdefault(transaction.symbol, Position(symbol=transaction.symbol))
+        if transaction.quantity > 0:
+            self._buy(position, transaction.quantity, transaction.price, transaction.timestamp)
+        else:
+            self.realized_pnl += self._sell(position, -transaction.quantity, transaction.price)
+        self.net_spend += transaction.quantity * transaction.price
+        self.transaction_count += 1
+
+    def totals(self) -> dict:
+        """The account-wide figures of the book, without its positions"""
+        return self.model_dump(exclude={"positions"})
+
+    @classmethod
+    def replay(cls, transactions, method: str = COST_BASIS_METHOD) -> "Book":
+        book = cls(method=method)
+        for transaction in transactions:
+            book.apply(transaction)
+        return book
+
+    def unrealized_pnl(self, prices: dict[str, float]) -> float:
+        return sum(
+            prices.get(symbol, 0.0) * position.quantity - position.cost_basis
+            for symbol, position in self.positions.items()
+            if position.quantity
+        )
+
+    def position_report(self, prices: dict[str, float]) -> dict[str, dict]:
+        return {
+            symbol: position.report(prices.get(symbol, 0.0))
+            for symbol, position in self.positions.items()
+            if position.quantity
+        }
+
+    def verify(self, transactions) -> list[str]:
+        """Replay the transactions from scratch and list every way this book differs from the result"""
+        expected = Book.replay(transactions, self.method)
+        differences = []
+        if expected.transaction_count != self.transaction_count:
+            differences.append(f"transaction count {self.transaction_count} != {expected.transaction_count}")
+        if abs(expected.net_spend - self.net_spend) > TOLERANCE:
+            differences.append(f"net spend {self.net_spend} != {expected.net_spend}")
+        if abs(expected.realized_pnl - self.realized_pnl) > TOLERANCE:
+            differences.append(f"realized P&L {self.realized_pnl} != {expected.realized_pnl}")
+        for symbol in set(expected.positions) | set(self.positions):
+            actual = self.positions.get(symbol, Position(symbol=symbol))
+            replayed = expected.positions.get(symbol, Position(symbol=symbol))
+            if actual.quantity != replayed.quantity or abs(actual.cost_basis - replayed.cost_basis) > TOLERANCE:
+                differences.append(
+                    f"{symbol}: {actual.quantity} at cost {actual.cost_basis} != {replayed.quantity} at cost {replayed.cost_basis}"
+                )
+        return differences
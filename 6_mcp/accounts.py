@@ -1,14 +1,58 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 import json
+import os
 from dotenv import load_dotenv
-from datetime import datetime
-from market import get_share_price
-from database import write_account, read_account, write_log
+from market import get_share_price, get_share_prices, market_now
+from accounting import Book, Lot
+from database import (
+    write_account,
+    read_account,
+    read_accounts,
+    read_recent_transactions,
+    write_account_state,
+    write_book,
+    read_books,
+    read_book_lots,
+    record_trade,
+    read_transactions,
+    write_portfolio_snapshot,
+    read_portfolio_series,
+    rebuild_account,
+    read_account_events,
+    write_log,
+    VersionConflict,
+    DuplicateTrade,
+)
 
 load_dotenv(override=True)
 
 INITIAL_BALANCE = 10_000.0
 SPREAD = 0.002
+UPDATE_ATTEMPTS = 5
+REPORT_TRANSACTIONS = int(os.getenv("REPORT_TRANSACTIONS", "50"))
+
+# The fields an accounts snapshot can include; the priced ones need current share prices
+
+SNAPSHOT_FIELDS = [
+    "balance",
+    "strategy",
+    "holdings",
+    "total_portfolio_value",
+    "total_profit_loss",
+    "positions",
+    "total_realized_profit_loss",
+    "total_unrealized_profit_loss",
+    "transactions",
+    "portfolio_value_time_series",
+]
+PRICED_FIELDS = {"total_portfolio_value", "total_profit_loss", "positions", "total_unrealized_profit_loss"}
+BOOK_FIELDS = {"total_profit_loss", "positions", "total_realized_profit_loss", "total_unrealized_profit_loss"}
+DEFAULT_SNAPSHOT_FIELDS = ["balance", "holdings", "total_portfolio_value", "total_profit_loss"]
+
+
+def market_timestamp() -> str:
+    """ The market's current time, the one clock that stamps transactions, portfolio values and ledger events. """
+    return market_now().strftime("%Y-%m-%d %H:%M:%S")
 
 
 class Transaction(BaseModel):
@@ -30,8 +74,10 @@ class Account(BaseModel):
     balance: float
     strategy: str
     holdings: dict[str, int]
-    transactions: list[Transaction]
-    portfolio_value_time_series: list[tuple[str, float]]
+    _transactions: list[Transaction] | None = PrivateAttr(default=None)
+    _portfolio_value_time_series: list[tuple[str, float]] | None = PrivateAttr(default=None)
+    _book: Book | None = PrivateAttr(default=None)
+    _version: int = PrivateAttr(default=0)
 
     @classmethod
     def get(cls, name: str):
@@ -42,41 +88,117 @@ class Account(BaseModel):
                 "balance": INITIAL_BALANCE,
                 "strategy": "",
                 "holdings": {},
-                "transactions": [],
-                "portfolio_value_time_series": []
             }
-            write_account(name, fields)
-        return cls(**fields)
-    
+            fields["version"] = write_account(name, fields, market_timestamp())
+        return cls.from_fields(fields)
+
+    @classmethod
+    def from_fields(cls, fields: dict):
+        """ Build an account from what read_account returns. """
+        fields = dict(fields)
+        version = fields.pop("version", 0)
+        account = cls(**fields)
+        account._version = version
+        return account
+
+    def refresh(self):
+        """ Reload the account from the database, dropping anything cached, after another writer has changed it. """
+        fields = read_account(self.name)
+        self._version = fields.pop("version", 0)
+        for key, value in fields.items():
+            setattr(self, key, value)
+        self._book = None
+        self._transactions = None
+        self._portfolio_value_time_series = None
+
+    @property
+    def transactions(self) -> list[Transaction]:
+        """ All transactions, loaded from the database the first time they are needed. """
+        if self._transactions is None:
+            self._transactions = [Transaction(**row) for row in read_transactions(self.name)]
+        return self._transactions
+
+    @property
+    def portfolio_value_time_series(self) -> list[tuple[str, float]]:
+        """ The whole portfolio value history, downsampled to a bounded number of points, loaded when first needed. """
+        if self._portfolio_value_time_series is None:
+            self._portfolio_value_time_series = self.get_portfolio_value_series()
+        return self._portfolio_value_time_series
+
+    def get_portfolio_value_series(self, start: str | None = None, end: str | None = None, max_points: int | None = None):
+        """ The portfolio value between two datetimes as at most max_points (datetime, value) points. """
+        kwargs = {"max_points": max_points} if max_points else {}
+        return [tuple(row) for row in read_portfolio_series(self.name, start, end, **kwargs)]
+
+    @property
+    def book(self) -> Book:
+        """
+        The accounting book, read without its lots the first time it is needed,
+        or rebuilt from the transactions once if the account doesn't have one stored yet.
+        """
+        if self._book is None:
+            stored = read_books([self.name]).get(self.name)
+            if stored:
+                self._book = Book(**stored)
+            else:
+                self._book = Book.replay(self.transactions)
+                write_book(self.name, self._book.model_dump())
+        return self._book
     
-    def save(self):
-        write_account(self.name.lower(), self.model_dump())
+    def save(self, event_type: str = "update", event_data: dict | None = None):
+        """ Save the balance, strategy and holdings, raising VersionConflict if the account changed since it was read. """
+        self._version = write_account_state(
+            self.name, self.balance, self.strategy, self.holdings, self._version, event_type, event_data,
+            market_timestamp(),
+        )
+
+    def update(self, change, event_type: str = "update", event_data: dict | None = None) -> None:
+        """ Apply change() and save, re-reading the account and applying it again if another writer got there first. """
+        for _ in range(UPDATE_ATTEMPTS):
+            change()
+            try:
+                self.save(event_type, event_data)
+                return
+            except VersionConflict:
+                self.refresh()
+        raise VersionConflict(f"Gave up updating account {self.name} after {UPDATE_ATTEMPTS} conflicting writes")
 
     def reset(self, strategy: str):
         self.balance = INITIAL_BALANCE
         self.strategy = strategy
         self.holdings = {}
-        self.transactions = []
-        self.portfolio_value_time_series = []
-        self.save()
+        self._transactions = []
+        self._portfolio_value_time_series = []
+        self._book = Book()
+        self._version = write_account(self.name, {
+            **self.model_dump(),
+            "transactions": [],
+            "portfolio_value_time_series": [],
+            "book": self._book.model_dump(),
+        }, market_timestamp())
 
     def deposit(self, amount: float):
         """ Deposit funds into the account. """
         if amount <= 0:
             raise ValueError("Deposit amount must be positive.")
-        self.balance += amount
+
+        def change():
+            self.balance += amount
+
+        self.update(change, "deposit", {"amount": amount})
         print(f"Deposited ${amount}. New balance: ${self.balance}")
-        self.save()
 
     def withdraw(self, amount: float):
         """ Withdraw funds from the account, ensuring it doesn't go negative. """
-        if amount > self.balance:
-            raise ValueError("Insufficient funds for withdrawal.")
-        self.balance -= amount
+        def change():
+            if amount > self.balance:
+                raise ValueError("Insufficient funds for withdrawal.")
+            self.balance -= amount
+
+        self.update(change, "withdraw", {"amount": amount})
         print(f"Withdrew ${amount}. New balance: ${self.balance}")
-        self.save()
 
-    def buy_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+    def buy_shares(self, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None) -> str:
         """ Buy shares of a stock if sufficient funds are available. """
         price = get_share_price(symbol)
         buy_price = price * (1 + SPREAD)
@@ -86,57 +208,87 @@ class Account(BaseModel):
             raise ValueError("Insufficient funds to buy shares.")
         elif price==0:
             raise ValueError(f"Unrecognized symbol {symbol}")
-        
-        # Update holdings
-        self.holdings[symbol] = self.holdings.get(symbol, 0) + quantity
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
-        transaction = Transaction(symbol=symbol, quantity=quantity, price=buy_price, timestamp=timestamp, rationale=rationale)
-        self.transactions.append(transaction)
-        
-        # Update balance
-        self.balance -= total_cost
-        self.save()
+
+        if not self.trade(symbol, quantity, buy_price, rationale, idempotency_key):
+            return "Already completed. Latest details:\n" + self.report()
         write_log(self.name, "account", f"Bought {quantity} of {symbol}")
         return "Completed. Latest details:\n" + self.report()
 
-    def sell_shares(self, symbol: str, quantity: int, rationale: str) -> str:
+    def sell_shares(self, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None) -> str:
         """ Sell shares of a stock if the user has enough shares. """
         if self.holdings.get(symbol, 0) < quantity:
             raise ValueError(f"Cannot sell {quantity} shares of {symbol}. Not enough shares held.")
         
         price = get_share_price(symbol)
         sell_price = price * (1 - SPREAD)
-        total_proceeds = sell_price * quantity
-        
-        # Update holdings
-        self.holdings[symbol] -= quantity
-        
-        # If shares are completely sold, remove from holdings
-        if self.holdings[symbol] == 0:
-            del self.holdings[symbol]
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        # Record transaction
-        transaction = Transaction(symbol=symbol, quantity=-quantity, price=sell_price, timestamp=timestamp, rationale=rationale)  # negative quantity for sell
-        self.transactions.append(transaction)
-
-        # Update balance
-        self.balance += total_proceeds
-        self.save()
+        if not self.trade(symbol, -quantity, sell_price, rationale, idempotency_key):  # negative quantity for sell
+            return "Already completed. Latest details:\n" + self.report()
         write_log(self.name, "account", f"Sold {quantity} of {symbol}")
         return "Completed. Latest details:\n" + self.report()
 
-    def calculate_portfolio_value(self):
+    def trade(self, symbol: str, quantity: int, price: float, rationale: str, idempotency_key: str | None = None) -> bool:
+        """
+        Record a trade of quantity shares (negative for a sell) at price as one database transaction,
+        that only commits if nobody else changed the account since it was read; otherwise the account is
+        re-read, the trade checked again against the fresh balance and holdings, and retried.
+        Returns False, without trading, if a trade with the same idempotency key was already recorded.
+        """
+        for _ in range(UPDATE_ATTEMPTS):
+            if quantity > 0 and quantity * price > self.balance:
+                raise ValueError("Insufficient funds to buy shares.")
+            if quantity < 0 and self.holdings.get(symbol, 0) < -quantity:
+                raise ValueError(f"Cannot sell {-quantity} shares of {symbol}. Not enough shares held.")
+            # Only the lots the trade uses are loaded: none for a buy, which appends one, and the oldest for a sell.
+            # The book is changed in place, and dropped to be read again if the trade is not recorded
+            book = self.book
+            position = book.positions.get(symbol)
+            if position is not None and position.lots is None:
+                position.lots = [] if quantity > 0 else [Lot(**lot) for lot in read_book_lots(self.name, symbol, -quantity)]
+            timestamp = market_timestamp()
+            transaction = Transaction(symbol=symbol, quantity=quantity, price=price, timestamp=timestamp, rationale=rationale)
+            book.apply(transaction)
+            balance = self.balance - transaction.total()
+            held = self.holdings.get(symbol, 0) + quantity
+            try:
+                self._version = record_trade(
+                    self.name, balance, symbol, held, transaction.model_dump(), book.totals(),
+                    book.positions[symbol].changes(), self._version, idempotency_key,
+                )
+            except VersionConflict:
+                self.refresh()
+                continue
+            except DuplicateTrade:
+                self.refresh()
+                return False
+            except BaseException:
+                self._book = None
+                raise
+            self.balance = balance
+            if held:
+                self.holdings[symbol] = held
+            else:
+                self.holdings.pop(symbol, None)
+            book.positions[symbol].lots = None
+            if self._transactions is not None:
+                self._transactions.append(transaction)
+            return True
+        raise VersionConflict(f"Gave up trading {symbol} for account {self.name} after {UPDATE_ATTEMPTS} conflicting writes")
+
+    def get_prices(self) -> dict[str, float]:
+        """ Look up the current price of every holding in one batch. """
+        return get_share_prices(list(self.holdings))
+
+    def calculate_portfolio_value(self, prices: dict[str, float] | None = None):
         """ Calculate the total value of the user's portfolio. """
+        prices = self.get_prices() if prices is None else prices
         total_value = self.balance
         for symbol, quantity in self.holdings.items():
-            total_value += get_share_price(symbol) * quantity
+            total_value += prices[symbol] * quantity
         return total_value
 
     def calculate_profit_loss(self, portfolio_value: float):
         """ Calculate profit or loss from the initial spend. """
-        initial_spend = sum(transaction.total() for transaction in self.transactions)
-        return portfolio_value - initial_spend - self.balance
+        return portfolio_value - self.book.net_spend - self.balance
 
     def get_holdings(self):
         """ Report the current holdings of the user. """
@@ -144,21 +296,65 @@ class Account(BaseModel):
 
     def get_profit_loss(self):
         """ Report the user's profit or loss at any point in time. """
-        return self.calculate_profit_loss()
+        return self.calculate_profit_loss(self.calculate_portfolio_value())
+
+    def get_positions(self, prices: dict[str, float] | None = None) -> dict[str, dict]:
+        """ Report quantity, cost basis and realized and unrealized profit or loss for each holding. """
+        prices = self.get_prices() if prices is None else prices
+        return self.book.position_report(prices)
 
-    def list_transactions(self):
-        """ List all transactions made by the user. """
-        return [transaction.model_dump() for transaction in self.transactions]
+    def as_of(self, timestamp: str) -> dict | None:
+        """ The balance, strategy and holdings of the account as they were at the given datetime, from the ledger. """
+        return rebuild_account(self.name, timestamp)
+
+    def list_events(self, after_id: int = 0, limit: int = 1000) -> list[dict]:
+        """ A page of the account's ledger of opens, resets, deposits, withdrawals, trades and strategy changes. """
+        return read_account_events(self.name, after_id, limit)
+
+    def verify_ledger(self) -> list[str]:
+        """ Check the stored balance, strategy and holdings against the state rebuilt from the ledger. """
+        rebuilt = rebuild_account(self.name) or {}
+        differences = []
+        if abs(rebuilt.get("balance", 0.0) - self.balance) > 1e-6:
+            differences.append(f"balance {self.balance} != {rebuilt.get('balance')}")
+        if rebuilt.get("strategy") != self.strategy:
+            differences.append("strategy differs")
+        if rebuilt.get("holdings") != self.holdings:
+            differences.append(f"holdings {self.holdings} != {rebuilt.get('holdings')}")
+        return differences
+
+    def verify_book(self) -> list[str]:
+        """ Check the incrementally maintained book against a full replay of the transactions. """
+        return self.book.verify(self.transactions)
+
+    def list_transactions(self, limit: int | None = None, offset: int = 0):
+        """ List all transactions made by the user, or a page of the most recent ones if a limit is given. """
+        if limit is None:
+            return [transaction.model_dump() for transaction in self.transactions]
+        return read_transactions(self.name, limit=limit, offset=offset)
     
     def report(self) -> str:
-        """ Return a json string representing the account.  """
-        portfolio_value = self.calculate_portfolio_value()
-        self.portfolio_value_time_series.append((datetime.now().strftime("%Y-%m-%d %H:%M:%S"), portfolio_value))
-        self.save()
+        """
+        Return a json string representing the account, with its most recent transactions and how many there are.
+        The transactions are the last REPORT_TRANSACTIONS of the history, the first being number transactions_start
+        counting from 0, so a reader can fetch the older ones with read_transactions.
+        """
+        prices = self.get_prices()
+        portfolio_value = self.calculate_portfolio_value(prices)
+        point = (market_timestamp(), portfolio_value)
+        write_portfolio_snapshot(self.name, *point)
+        self._portfolio_value_time_series = None
         pnl = self.calculate_profit_loss(portfolio_value)
         data = self.model_dump()
+        data["transactions"] = self.list_transactions(limit=REPORT_TRANSACTIONS)
+        data["transaction_count"] = self.book.transaction_count
+        data["transactions_start"] = data["transaction_count"] - len(data["transactions"])
+        data["portfolio_value_time_series"] = self.portfolio_value_time_series
         data["total_portfolio_value"] = portfolio_value
         data["total_profit_loss"] = pnl
+        data["positions"] = self.get_positions(prices)
+        data["total_realized_profit_loss"] = self.book.realized_pnl
+        data["total_unrealized_profit_loss"] = self.book.unrealized_pnl(prices)
         write_log(self.name, "account", f"Retrieved account details")
         return json.dumps(data)
     
@@ -169,11 +365,65 @@ class Account(BaseModel):
     
     def change_strategy(self, strategy: str) -> str:
         """ At your discretion, if you choose to, call this to change your investment strategy for the future """
-        self.strategy = strategy
-        self.save()
+        self.update(lambda: setattr(self, "strategy", strategy), "strategy")
         write_log(self.name, "account", f"Changed strategy")
         return "Changed strategy"
 
+
+def get_accounts_snapshot(
+    names: list[str] | None = None,
+    fields: list[str] | None = None,
+    transactions_limit: int | None = None,
+    max_points: int | None = None,
+) -> dict[str, dict]:
+    """
+    Report on several accounts, all of them by default, reading them with one query and pricing
+    every holding across all of them with one batched price lookup.
+    Only the requested fields are computed: transactions (the most recent transactions_limit of them, or all)
+    and the portfolio value series (at most max_points) are left out unless asked for.
+    """
+    fields = DEFAULT_SNAPSHOT_FIELDS if fields is None else fields
+    unknown = set(fields) - set(SNAPSHOT_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown snapshot fields {sorted(unknown)}; choose from {SNAPSHOT_FIELDS}")
+    accounts = {name: Account.from_fields(row) for name, row in read_accounts(names).items()}
+    if BOOK_FIELDS & set(fields):
+        for name, book in read_books(list(accounts)).items():
+            accounts[name]._book = Book(**book)
+    prices = {}
+    if PRICED_FIELDS & set(fields):
+        prices = get_share_prices(sorted({symbol for account in accounts.values() for symbol in account.holdings}))
+    recent = {}
+    if "transactions" in fields and transactions_limit is not None:
+        recent = read_recent_transactions(list(accounts), transactions_limit)
+    snapshot = {}
+    for name, account in accounts.items():
+        entry = {"name": name}
+        if "balance" in fields:
+            entry["balance"] = account.balance
+        if "strategy" in fields:
+            entry["strategy"] = account.strategy
+        if "holdings" in fields:
+            entry["holdings"] = account.holdings
+        if "total_portfolio_value" in fields or "total_profit_loss" in fields:
+            portfolio_value = account.calculate_portfolio_value(prices)
+            if "total_portfolio_value" in fields:
+                entry["total_portfolio_value"] = portfolio_value
+            if "total_profit_loss" in fields:
+                entry["total_profit_loss"] = account.calculate_profit_loss(portfolio_value)
+        if "positions" in fields:
+            entry["positions"] = account.get_positions(prices)
+        if "total_realized_profit_loss" in fields:
+            entry["total_realized_profit_loss"] = account.book.realized_pnl
+        if "total_unrealized_profit_loss" in fields:
+            entry["total_unrealized_profit_loss"] = account.book.unrealized_pnl(prices)
+        if "transactions" in fields:
+            entry["transactions"] = recent[name] if transactions_limit is not None else account.list_transactions()
+        if "portfolio_value_time_series" in fields:
+            entry["portfolio_value_time_series"] = account.get_portfolio_value_series(max_points=max_points)
+        snapshot[name] = entry
+    return snapshot
+
 # Example of usage:
 if __name__ == "__main__":
     account = Account("John Doe")
@@ -1,39 +1,153 @@
 import mcp
 from mcp.client.stdio import stdio_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
 from mcp import StdioServerParameters
 from agents import FunctionTool
+import anyio
+import asyncio
 import json
+import uuid
 
 params = StdioServerParameters(command="uv", args=["run", "accounts_server.py"], env=None)
 
+# Tools that are safe to send again if the response was lost: they only read
+# The trade tools are made safe by sending each trade with an idempotency key, so the server records it once;
+# change_strategy is not retried, as every call is recorded in the ledger
+
+TRADE_TOOLS = {"buy_shares", "sell_shares"}
+RETRYABLE_TOOLS = {"get_balance", "get_holdings", "get_accounts_snapshot"} | TRADE_TOOLS
+
+
+class AccountsClient:
+    """
+    One initialized ClientSession with the accounts server, kept alive between calls.
+    The session is owned by a background task, because the stdio client has to be closed by the task that opened it;
+    callers in any task can send requests over it concurrently, and the session matches up the responses.
+    If the server goes away, the next request reconnects, and is retried once if it is safe to send twice.
+    """
+
+    def __init__(self, params: StdioServerParameters):
+        self.params = params
+        self._session = None
+        self._task = None
+        self._watcher = None
+        self._closed = None
+        self._lock = asyncio.Lock()
+        self._tools = None
+
+    async def _watch(self, read, forward) -> None:
+        """
+        Pass on everything the server sends, finishing once the server stops, as when it exits.
+        The session stays open until the next request replaces it, so it can fail its pending requests as closed.
+        """
+        async with forward:
+            async for message in read:
+                await forward.send(message)
+
+    async def _run(self, ready: asyncio.Future) -> None:
+        try:
+            async with stdio_client(self.params) as (read, write):
+                forward, received = anyio.create_memory_object_stream(0)
+                self._watcher = asyncio.create_task(self._watch(read, forward))
+                try:
+                    async with mcp.ClientSession(received, write) as session:
+                        await session.initialize()
+                        self._session = session
+                        ready.set_result(session)
+                        await self._closed.wait()
+                finally:
+                    self._watcher.cancel()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"Accounts client disconnected: {e}")
+        finally:
+            self._session = None
+
+    def _is_connected(self) -> bool:
+        if self._session is None or self._task is None or self._task.done():
+            return False
+        return not self._watcher.done()
+
+    async def _disconnect(self) -> None:
+        if self._task:
+            self._closed.set()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        self._session = None
+
+    async def session(self) -> mcp.ClientSession:
+        if self._is_connected():
+            return self._session
+        async with self._lock:
+            if not self._is_connected():
+                await self._disconnect()
+                self._closed = asyncio.Event()
+                ready = asyncio.get_running_loop().create_future()
+                self._task = asyncio.create_task(self._run(ready))
+                await ready
+            return self._session
+
+    async def request(self, send, retry: bool = True):
+        """
+        Call send(session), reconnecting if the connection itself failed, and retrying once if retry is set.
+        Only set retry for requests that are safe to repeat: the failed one may have reached the server.
+        """
+        session = await self.session()
+        try:
+            return await send(session)
+        except Exception as e:
+            # Tool and protocol errors come back as an McpError over a working connection; a closed one fails the same way
+            if isinstance(e, McpError) and e.error.code != CONNECTION_CLOSED:
+                raise
+            async with self._lock:
+                if self._session is session:
+                    await self._disconnect()
+            if not retry:
+                raise
+            return await send(await self.session())
+
+    async def list_tools(self):
+        if self._tools is None:
+            result = await self.request(lambda session: session.list_tools())
+            self._tools = result.tools
+        return self._tools
+
+    async def close(self) -> None:
+        async with self._lock:
+            await self._disconnect()
+
+
+client = AccountsClient(params)
+
 
 async def list_accounts_tools():
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            tools_result = await session.list_tools()
-            return tools_result.tools
-        
+    return await client.list_tools()
+
 async def call_accounts_tool(tool_name, tool_args):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.call_tool(tool_name, tool_args)
-            return result
-            
+    if tool_name in TRADE_TOOLS and not tool_args.get("idempotency_key"):
+        tool_args = {**tool_args, "idempotency_key": uuid.uuid4().hex}
+    return await client.request(
+        lambda session: session.call_tool(tool_name, tool_args), retry=tool_name in RETRYABLE_TOOLS
+    )
+
 async def read_accounts_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://accounts_server/{name}")
-            return result.contents[0].text
-        
+    result = await client.request(lambda session: session.read_resource(f"accounts://accounts_server/{name}"))
+    return result.contents[0].text
+
 async def read_strategy_resource(name):
-    async with stdio_client(params) as streams:
-        async with mcp.ClientSession(*streams) as session:
-            await session.initialize()
-            result = await session.read_resource(f"accounts://strategy/{name}")
-            return result.contents[0].text
+    result = await client.request(lambda session: session.read_resource(f"accounts://strategy/{name}"))
+    return result.contents[0].text
+
+async def read_accounts_snapshot_resource(fields: list[str] | None = None):
+    uri = f"accounts://snapshot/{','.join(fields)}" if fields else "accounts://snapshot"
+    result = await client.request(lambda session: session.read_resource(uri))
+    return result.contents[0].text
+
+async def close_accounts_client():
+    await client.close()
 
 async def get_accounts_tools_openai():
     openai_tools = []
@@ -44,7 +158,7 @@ async def get_accounts_tools_openai():
             description=tool.description,
             params_json_schema=schema,
             on_invoke_tool=lambda ctx, args, toolname=tool.name: call_accounts_tool(toolname, json.loads(args))
-                
+
         )
         openai_tools.append(openai_tool)
-    return openai_tools
\ No newline at end of file
+    return openai_tools
@@ -1,8 +1,12 @@
 from mcp.server.fastmcp import FastMCP
-from accounts import Account
+import asyncio
+import json
+from accounts import Account, get_accounts_snapshot as accounts_snapshot
 
 mcp = FastMCP("accounts_server")
 
+# Anything that prices holdings blocks on the Polygon rate limit and requests, so it runs in a worker thread
+
 @mcp.tool()
 async def get_balance(name: str) -> float:
     """Get the cash balance of the given account name.
@@ -22,7 +26,9 @@ async def get_holdings(name: str) -> dict[str, int]:
     return Account.get(name).holdings
 
 @mcp.tool()
-async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
+async def buy_shares(
+    name: str, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None
+) -> float:
     """Buy shares of a stock.
 
     Args:
@@ -30,12 +36,15 @@ async def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> f
         symbol: The symbol of the stock
         quantity: The quantity of shares to buy
         rationale: The rationale for the purchase and fit with the account's strategy
+        idempotency_key: Optional unique key for this trade; a retried call with the same key is not traded twice
     """
-    return Account.get(name).buy_shares(symbol, quantity, rationale)
+    return await asyncio.to_thread(lambda: Account.get(name).buy_shares(symbol, quantity, rationale, idempotency_key))
 
 
 @mcp.tool()
-async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) -> float:
+async def sell_shares(
+    name: str, symbol: str, quantity: int, rationale: str, idempotency_key: str | None = None
+) -> float:
     """Sell shares of a stock.
 
     Args:
@@ -43,8 +52,9 @@ async def sell_shares(name: str, symbol: str, quantity: int, rationale: str) ->
         symbol: The symbol of the stock
         quantity: The quantity of shares to sell
         rationale: The rationale for the sale and fit with the account's strategy
+        idempotency_key: Optional unique key for this trade; a retried call with the same key is not traded twice
     """
-    return Account.get(name).sell_shares(symbol, quantity, rationale)
+    return await asyncio.to_thread(lambda: Account.get(name).sell_shares(symbol, quantity, rationale, idempotency_key))
 
 @mcp.tool()
 async def change_strategy(name: str, strategy: str) -> str:
@@ -56,10 +66,39 @@ async def change_strategy(name: str, strategy: str) -> str:
     """
     return Account.get(name).change_strategy(strategy)
 
+@mcp.tool()
+async def get_accounts_snapshot(
+    names: list[str] | None = None,
+    fields: list[str] | None = None,
+    transactions_limit: int | None = None,
+) -> dict[str, dict]:
+    """Get a snapshot of several accounts at once, priced with a single batched price lookup.
+
+    Args:
+        names: The account holders to include; all accounts if omitted
+        fields: Which fields to include, from balance, strategy, holdings, total_portfolio_value, total_profit_loss,
+            positions, total_realized_profit_loss, total_unrealized_profit_loss, transactions and
+            portfolio_value_time_series; balance, holdings, total_portfolio_value and total_profit_loss if omitted
+        transactions_limit: If transactions are included, only this many of the most recent for each account
+    """
+    return await asyncio.to_thread(accounts_snapshot, names, fields, transactions_limit)
+
+@mcp.resource("accounts://snapshot")
+async def read_accounts_snapshot_resource() -> str:
+    return json.dumps(await asyncio.to_thread(accounts_snapshot))
+
+@mcp.resource("accounts://snapshot/{fields}")
+async def read_accounts_snapshot_fields_resource(fields: str) -> str:
+    return json.dumps(await asyncio.to_thread(accounts_snapshot, fields=fields.split(",")))
+
 @mcp.resource("accounts://accounts_server/{name}")
 async def read_account_resource(name: str) -> str:
+    return await asyncio.to_thread(lambda: Account.get(name.lower()).report())
+
+@mcp.resource("accounts://as_of/{name}/{timestamp}")
+async def read_account_as_of_resource(name: str, timestamp: str) -> str:
     account = Account.get(name.lower())
-    return account.report()
+    return json.dumps(account.as_of(timestamp.replace("T", " ")))
 
 @mcp.resource("accounts://strategy/{name}")
 async def read_strategy_resource(name: str) -> str:
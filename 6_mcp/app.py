@@ -3,8 +3,12 @@ from util import css, js, Color
 import pandas as pd
 from trading_floor import names, lastnames, short_model_names
 import plotly.express as px
-from accounts import Account
-from database import read_log
+from accounts import Account, get_accounts_snapshot
+from database import read_logs_since, latest_log_id, subscribe_logs, read_trader_runs
+from collections import deque
+import asyncio
+import threading
+import time
 
 mapper = {
     "trace": Color.WHITE,
@@ -15,16 +19,46 @@ mapper = {
     "account": Color.RED,
 }
 
+RECENT_TRANSACTIONS = 50
+CHART_POINTS = 300
+LOG_LINES = 13
+RECENT_RUNS = 5
+SNAPSHOT_MAX_AGE = 5
+DASHBOARD_FIELDS = ["holdings", "total_portfolio_value", "total_profit_loss", "transactions", "portfolio_value_time_series"]
+
+
+class FloorSnapshot:
+    """
+    One snapshot of every trader's account, shared by all the trader views: a refresh of the whole floor
+    reads the accounts together and prices all their holdings with one batched lookup, at most every few seconds
+    """
+
+    def __init__(self, names: list[str]):
+        self.names = [name.lower() for name in names]
+        self.snapshot = {}
+        self.taken = 0.0
+        self.lock = threading.Lock()
+
+    def get(self, name: str) -> dict:
+        with self.lock:
+            if time.monotonic() - self.taken > SNAPSHOT_MAX_AGE:
+                self.snapshot = get_accounts_snapshot(self.names, DASHBOARD_FIELDS, RECENT_TRANSACTIONS, CHART_POINTS)
+                self.taken = time.monotonic()
+            return self.snapshot.get(name.lower(), {})
+
 
 class Trader:
-    def __init__(self, name: str, lastname: str, model_name: str):
+    def __init__(self, name: str, lastname: str, model_name: str, floor: FloorSnapshot):
         self.name = name
         self.lastname = lastname
         self.model_name = model_name
+        self.floor = floor
         self.account = Account.get(name)
-
-    def reload(self):
-        self.account = Account.get(self.name)
+        self.log_lines = deque(maxlen=LOG_LINES)
+        self.log_cursor = 0
+        self.log_html = None
+        self.log_lock = threading.Lock()
+        self.log_streams = set()
 
     def get_title(self) -> str:
         return f"<div style='text-align: center;font-size:34px;'>{self.name}<span style='color:#ccc;font-size:24px;'> ({self.model_name}) - {self.lastname}</span></div>"
@@ -33,7 +67,8 @@ class Trader:
         return self.account.get_strategy()
 
     def get_portfolio_value_df(self) -> pd.DataFrame:
-        df = pd.DataFrame(self.account.portfolio_value_time_series, columns=["datetime", "value"])
+        series = self.floor.get(self.name).get("portfolio_value_time_series", [])
+        df = pd.DataFrame(series, columns=["datetime", "value"])
         df["datetime"] = pd.to_datetime(df["datetime"])
         return df
 
@@ -55,7 +90,7 @@ class Trader:
 
     def get_holdings_df(self) -> pd.DataFrame:
         """Convert holdings to DataFrame for display"""
-        holdings = self.account.get_holdings()
+        holdings = self.floor.get(self.name).get("holdings", {})
         if not holdings:
             return pd.DataFrame(columns=["Symbol", "Quantity"])
 
@@ -65,32 +100,66 @@ class Trader:
         return df
 
     def get_transactions_df(self) -> pd.DataFrame:
-        """Convert transactions to DataFrame for display"""
-        transactions = self.account.list_transactions()
+        """Convert the most recent transactions to DataFrame for display"""
+        transactions = self.floor.get(self.name).get("transactions", [])
         if not transactions:
             return pd.DataFrame(columns=["Timestamp", "Symbol", "Quantity", "Price", "Rationale"])
 
         return pd.DataFrame(transactions)
 
+    def get_runs_df(self) -> pd.DataFrame:
+        """The outcomes of the trader's most recent scheduled runs, newest first"""
+        runs = read_trader_runs(self.name, last_n=RECENT_RUNS)
+        return pd.DataFrame(
+            [[run["started"], run["mode"], run["status"], run["attempts"], run["error"] or ""] for run in runs],
+            columns=["Started", "Mode", "Status", "Attempts", "Error"],
+        )
+
     def get_portfolio_value(self) -> str:
         """Calculate total portfolio value based on current prices"""
-        portfolio_value = self.account.calculate_portfolio_value() or 0.0
-        pnl = self.account.calculate_profit_loss(portfolio_value) or 0.0
+        snapshot = self.floor.get(self.name)
+        portfolio_value = snapshot.get("total_portfolio_value") or 0.0
+        pnl = snapshot.get("total_profit_loss") or 0.0
         color = "green" if pnl >= 0 else "red"
         emoji = "⬆" if pnl >= 0 else "⬇"
         return f"<div style='text-align: center;background-color:{color};'><span style='font-size:32px'>${portfolio_value:,.0f}</span><span style='font-size:24px'>&nbsp;&nbsp;&nbsp;{emoji}&nbsp;${pnl:,.0f}</span></div>"
 
-    def get_logs(self, previous=None) -> str:
-        logs = read_log(self.name, last_n=13)
-        response = ""
-        for log in logs:
-            timestamp, type, message = log
-            color = mapper.get(type, Color.WHITE).value
-            response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
-        response = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
-        if response != previous:
-            return response
-        return gr.update()
+    def get_logs(self) -> str:
+        """Render the latest logs, reading only rows newer than those already shown, and only when there are some"""
+        latest = latest_log_id(self.name)
+        with self.log_lock:
+            if self.log_html is None or latest > self.log_cursor:
+                for log in read_logs_since(self.name, self.log_cursor, limit=LOG_LINES):
+                    self.log_lines.append(log)
+                    self.log_cursor = log[0]
+                response = ""
+                for log in self.log_lines:
+                    _, timestamp, type, message = log
+                    color = mapper.get(type, Color.WHITE).value
+                    response += f"<span style='color:{color}'>{timestamp} : [{type}] {message}</span><br/>"
+                self.log_html = f"<div style='height:250px; overflow-y:auto;'>{response}</div>"
+            return self.log_html
+
+    def notify_logs(self) -> None:
+        """Wake every open log stream of this trader; called on the log feed's thread"""
+        for loop, event in list(self.log_streams):
+            loop.call_soon_threadsafe(event.set)
+
+    async def stream_logs(self):
+        """Send the logs to the page again each time the log feed reports new entries for this trader"""
+        stream = (asyncio.get_running_loop(), asyncio.Event())
+        self.log_streams.add(stream)
+        try:
+            previous = None
+            while True:
+                stream[1].clear()
+                response = await asyncio.to_thread(self.get_logs)
+                if response != previous:
+                    previous = response
+                    yield response
+                await stream[1].wait()
+        finally:
+            self.log_streams.discard(stream)
 
 
 class TraderView:
@@ -100,8 +169,9 @@ class TraderView:
         self.chart = None
         self.holdings_table = None
         self.transactions_table = None
+        self.runs_table = None
 
-    def make_ui(self):
+    def make_ui(self, ui: gr.Blocks):
         with gr.Column():
             gr.HTML(self.trader.get_title())
             with gr.Row():
@@ -132,6 +202,16 @@ class TraderView:
                     max_height=300,
                     elem_classes=["dataframe-fix"],
                 )
+            with gr.Row():
+                self.runs_table = gr.Dataframe(
+                    value=self.trader.get_runs_df,
+                    label="Recent Runs",
+                    headers=["Started", "Mode", "Status", "Attempts", "Error"],
+                    row_count=(RECENT_RUNS, "dynamic"),
+                    col_count=5,
+                    max_height=300,
+                    elem_classes=["dataframe-fix"],
+                )
 
         timer = gr.Timer(value=120)
         timer.tick(
@@ -142,26 +222,27 @@ class TraderView:
                 self.chart,
                 self.holdings_table,
                 self.transactions_table,
+                self.runs_table,
             ],
             show_progress="hidden",
             queue=False,
         )
-        log_timer = gr.Timer(value=0.5)
-        log_timer.tick(
-            fn=self.trader.get_logs,
-            inputs=[self.log],
+        # Each open page streams its logs for as long as it is open, so it must not wait for other pages
+        ui.load(
+            fn=self.trader.stream_logs,
+            inputs=[],
             outputs=[self.log],
             show_progress="hidden",
-            queue=False,
+            concurrency_limit=None,
         )
 
     def refresh(self):
-        self.trader.reload()
         return (
             self.trader.get_portfolio_value(),
             self.trader.get_portfolio_value_chart(),
             self.trader.get_holdings_df(),
             self.trader.get_transactions_df(),
+            self.trader.get_runs_df(),
         )
 
 
@@ -169,18 +250,26 @@ class TraderView:
 def create_ui():
     """Create the main Gradio UI for the trading simulation"""
 
+    floor = FloorSnapshot(names)
     traders = [
-        Trader(trader_name, lastname, model_name)
+        Trader(trader_name, lastname, model_name, floor)
         for trader_name, lastname, model_name in zip(names, lastnames, short_model_names)
     ]
     trader_views = [TraderView(trader) for trader in traders]
+    by_name = {trader.name.lower(): trader for trader in traders}
+
+    def on_new_logs(name: str, latest_id: int) -> None:
+        if name in by_name:
+            by_name[name].notify_logs()
+
+    subscribe_logs(on_new_logs)
 
     with gr.Blocks(
         title="Traders", css=css, js=js, theme=gr.themes.Default(primary_hue="sky"), fill_width=True
     ) as ui:
         with gr.Row():
             for trader_view in trader_views:
-                trader_view.make_ui()
+                trader_view.make_ui(ui)
 
     return ui
 
@@ -0,0 +1,236 @@
+"""
+Backtest the traders against historical prices, as fast as the machine allows, without an LLM.
+
+    uv run backtest.py prices.csv --cycles 500 --traders 4 --trades 3
+    uv run backtest.py prices.csv --mcp        # route the trades through accounts_server over MCP
+
+The price file has one row per bar with a timestamp (or date), a symbol (or ticker) and a close (or price);
+Parquet files work too when pandas is installed. Each distinct timestamp is one trading cycle:
+the simulated clock moves to it, and every trader runs its agent once with a stub model
+that buys and sells at random, with a fixed seed, through the real tools, Runner and tracer.
+Backtests use their own database (replay.db unless ACCOUNTS_DB is set) so live accounts are untouched.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+os.environ.setdefault("ACCOUNTS_DB", "replay.db")
+
+from agents import (
+    Agent,
+    Model,
+    ModelResponse,
+    Runner,
+    Usage,
+    set_trace_processors,
+    function_tool,
+    generation_span,
+    trace,
+)
+from agents.mcp import MCPServerStdio
+from openai.types.responses import (
+    Response,
+    ResponseCompletedEvent,
+    ResponseFunctionToolCall,
+    ResponseOutputMessage,
+    ResponseOutputText,
+)
+import market
+from accounts import Account, INITIAL_BALANCE, SPREAD
+from database import count_transactions, flush_logs, read_span_latencies
+from replay import PriceReplay, ReplayClock, install_replay
+from tracers import LogTracer, make_trace_id
+
+
+class StubModel(Model):
+    """
+    A model that needs no LLM: at the start of a run it decides on a few random trades for its trader,
+    then calls buy_shares or sell_shares for one of them per turn, and finishes when none are left.
+    Decisions come from a seeded generator and the account's current holdings, and trades run one at a time,
+    so a replay is repeatable.
+    """
+
+    def __init__(self, name: str, replay: PriceReplay, trades: int, seed: int):
+        self.name = name
+        self.replay = replay
+        self.trades = trades
+        self.random = random.Random(f"{seed}-{name}")
+        self.calls = 0
+        self.pending = []
+
+    def decide(self) -> list[tuple[str, dict]]:
+        account = Account.get(self.name)
+        holdings = dict(account.holdings)
+        cash = account.balance
+        decisions = []
+        for _ in range(self.trades):
+            if holdings and self.random.random() < 0.4:
+                symbol = self.random.choice(sorted(holdings))
+                quantity = self.random.randint(1, holdings[symbol])
+                holdings[symbol] -= quantity
+                if not holdings[symbol]:
+                    del holdings[symbol]
+                decisions.append(("sell_shares", symbol, quantity))
+            else:
+                symbol = self.random.choice(self.replay.symbols)
+                price = market.get_share_price(symbol)
+                quantity = int(cash * 0.1 // (price * (1 + SPREAD))) if price else 0
+                if quantity:
+                    cash -= quantity * price * (1 + SPREAD)
+                    decisions.append(("buy_shares", symbol, quantity))
+        return [
+            (tool, {"name": self.name, "symbol": symbol, "quantity": quantity, "rationale": "Replay"})
+            for tool, symbol, quantity in decisions
+        ]
+
+    def _call(self, tool: str, arguments: dict) -> ResponseFunctionToolCall:
+        self.calls += 1
+        return ResponseFunctionToolCall(
+            type="function_call", id=f"fc_{self.calls}", call_id=f"call_{self.calls}", name=tool, arguments=json.dumps(arguments)
+        )
+
+    def _message(self, text: str) -> ResponseOutputMessage:
+        return ResponseOutputMessage(
+            type="message",
+            id=f"msg_{self.calls}",
+            role="assistant",
+            status="completed",
+            content=[ResponseOutputText(type="output_text", text=text, annotations=[])],
+        )
+
+    async def get_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs):
+        with generation_span(model="stub"):
+            answered = isinstance(input, list) and any(
+                isinstance(item, dict) and item.get("type") == "function_call_output" for item in input
+            )
+            if not answered:
+                self.pending = self.decide()
+            output = [self._call(*self.pending.pop(0))] if self.pending else [self._message("Done")]
+        return ModelResponse(output=output, usage=Usage(), response_id=None)
+
+    async def stream_response(self, system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs):
+        """The same turn as get_response, streamed as the one completed event the Runner builds its response from"""
+        response = await self.get_response(
+            system_instructions, input, model_settings, tools, output_schema, handoffs, tracing, **kwargs
+        )
+        yield ResponseCompletedEvent(
+            type="response.completed",
+            sequence_number=0,
+            response=Response(
+                id=f"resp_{self.calls}",
+                created_at=time.time(),
+                model="stub",
+                object="response",
+                output=response.output,
+                tool_choice="auto",
+                tools=[],
+                parallel_tool_calls=False,
+            ),
+        )
+
+
+@function_tool
+def buy_shares(name: str, symbol: str, quantity: int, rationale: str) -> str:
+    """Buy shares of a stock."""
+    return Account.get(name).buy_shares(symbol, quantity, rationale)
+
+
+@function_tool
+def sell_shares(name: str, symbol: str, quantity: int, rationale: str) -> str:
+    """Sell shares of a stock."""
+    return Account.get(name).sell_shares(symbol, quantity, rationale)
+
+
+async def run_backtest(
+    prices_file: str,
+    cycles: int | None = None,
+    traders: int = 4,
+    trades: int = 3,
+    seed: int = 42,
+    use_mcp: bool = False,
+) -> dict:
+    """Replay the price file for the given number of cycles (all of it by default) and report throughput"""
+    replay = PriceReplay.load(prices_file)
+    clock_file = os.path.abspath(f"{os.environ['ACCOUNTS_DB']}.clock")
+    clock = ReplayClock(clock_file if use_mcp else None)
+    times = replay.times[:cycles] if cycles else replay.times
+    clock.set(times[0])
+    install_replay(replay, clock)
+    set_trace_processors([LogTracer()])
+
+    names = [f"replay{index}" for index in range(traders)]
+    for name in names:
+        Account.get(name).reset("Replay")
+    models = {name: StubModel(name, replay, trades, seed) for name in names}
+
+    servers = []
+    if use_mcp:
+        env = {
+            "ACCOUNTS_DB": os.path.abspath(os.environ["ACCOUNTS_DB"]),
+            "REPLAY_PRICES_FILE": os.path.abspath(prices_file),
+            "REPLAY_CLOCK_FILE": clock_file,
+        }
+        server = MCPServerStdio(
+            {"command": sys.executable, "args": ["accounts_server.py"], "env": env},
+            client_session_timeout_seconds=120,
+            cache_tools_list=True,
+        )
+        await server.connect()
+        servers.append(server)
+
+    def agent(name: str) -> Agent:
+        if use_mcp:
+            return Agent(name=name, instructions="Trade", model=models[name], mcp_servers=servers)
+        return Agent(name=name, instructions="Trade", model=models[name], tools=[buy_shares, sell_shares])
+
+    agents = {name: agent(name) for name in names}
+
+    async def run_trader(name: str) -> None:
+        with trace(f"{name}-replay", trace_id=make_trace_id(name)):
+            await Runner.run(agents[name], "Trade", max_turns=trades + 2)
+
+    since = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    start = time.perf_counter()
+    try:
+        for timestamp in times:
+            clock.set(timestamp)
+            await asyncio.gather(*[run_trader(name) for name in names])
+    finally:
+        for server in servers:
+            await server.cleanup()
+    elapsed = time.perf_counter() - start
+    flush_logs()
+
+    trade_count = sum(count_transactions(name) for name in names)
+    return {
+        "cycles": len(times),
+        "traders": traders,
+        "trades": trade_count,
+        "seconds": elapsed,
+        "trades_per_minute": 60 * trade_count / elapsed if elapsed else 0.0,
+        "cycles_per_second": len(times) / elapsed if elapsed else 0.0,
+        "portfolio_values": {
+            name: Account.get(name).calculate_portfolio_value() for name in names
+        },
+        "initial_balance": INITIAL_BALANCE,
+        "span_latencies": read_span_latencies(since),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay historical prices through the traders without an LLM")
+    parser.add_argument("prices_file", help="CSV (or Parquet) with timestamp, symbol and close columns")
+    parser.add_argument("--cycles", type=int, default=None, help="How many timestamps to replay (default: all)")
+    parser.add_argument("--traders", type=int, default=4, help="How many stub traders to run each cycle")
+    parser.add_argument("--trades", type=int, default=3, help="How many trades each trader attempts per cycle")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--mcp", action="store_true", help="Trade through accounts_server over MCP")
+    args = parser.parse_args()
+    result = asyncio.run(run_backtest(args.prices_file, args.cycles, args.traders, args.trades, args.seed, args.mcp))
+    print(json.dumps(result, indent=2))
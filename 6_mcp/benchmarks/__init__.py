@@ -0,0 +1,15 @@
+"""
+Benchmarks for the trading floor's hot paths, run from the 6_mcp directory:
+
+    uv run -m benchmarks --output results.json
+    uv run -m benchmarks --compare results.json --output latest.json
+
+Everything runs against local stand-ins, never Polygon or an LLM, in a new temporary database
+for each run, unless ACCOUNTS_DB is set. Runs never share a database by default, because cached prices
+and log entries left by one run would change the timings of the next.
+"""
+
+import os
+import tempfile
+
+os.environ.setdefault("ACCOUNTS_DB", os.path.join(tempfile.mkdtemp(prefix="benchmark"), "benchmark.db"))
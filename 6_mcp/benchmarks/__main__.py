@@ -0,0 +1,90 @@
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+from datetime import datetime
+from benchmarks import micro
+from benchmarks.scenario import run_scenario
+
+MICRO_BENCHMARKS = {
+    "buy_shares": micro.bench_buy_shares,
+    "report": micro.bench_report,
+    "write_log": micro.bench_write_log,
+    "write_log_flushed": micro.bench_write_log_flushed,
+    "read_log": micro.bench_read_log,
+    "get_share_price_cached": micro.bench_get_share_price_cached,
+    "get_share_price_miss": micro.bench_get_share_price_miss,
+}
+ALL = list(MICRO_BENCHMARKS) + ["mcp", "scenario"]
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def headline(result: dict) -> tuple[str, float, bool]:
+    """The number to compare between runs for a result, and whether higher is better"""
+    if "trades_per_minute" in result:
+        return "trades_per_minute", result["trades_per_minute"], True
+    return "mean_ms", result["mean_ms"], False
+
+
+def compare(previous: dict, current: dict) -> None:
+    for name, result in current["benchmarks"].items():
+        before = previous.get("benchmarks", {}).get(name)
+        metric, value, higher_is_better = headline(result)
+        if not before or not before.get(metric):
+            print(f"{name:32} {metric} {value:12.3f}  (new)")
+            continue
+        change = (value - before[metric]) / before[metric]
+        better = change > 0 if higher_is_better else change < 0
+        label = "better" if better else "worse"
+        print(f"{name:32} {metric} {before[metric]:12.3f} -> {value:12.3f}  {change:+.1%} {label}")
+
+
+async def run(selected: list[str], iterations: int, traders: int, cycles: int) -> dict:
+    results = []
+    for name in selected:
+        print(f"Running {name}", file=sys.stderr)
+        if name in MICRO_BENCHMARKS:
+            results.append(MICRO_BENCHMARKS[name](iterations))
+        elif name == "mcp":
+            results.extend(await micro.bench_mcp_round_trip(iterations))
+        elif name == "scenario":
+            results.append(await run_scenario(traders, cycles))
+    return {
+        "metadata": {
+            "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": iterations,
+        },
+        "benchmarks": {result["name"]: result for result in results},
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the trading floor's hot paths")
+    parser.add_argument("--only", nargs="+", choices=ALL, default=ALL, help="Which benchmarks to run")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--traders", type=int, default=4, help="Traders in the end-to-end scenario")
+    parser.add_argument("--cycles", type=int, default=50, help="Cycles in the end-to-end scenario")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="A previous results file to compare against")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.only, args.iterations, args.traders, args.cycles))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+    else:
+        print(json.dumps(results, indent=2))
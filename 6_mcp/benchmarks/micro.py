@@ -0,0 +1,99 @@
+import itertools
+import os
+import sys
+import tempfile
+import mcp
+from mcp import StdioServerParameters
+from mcp.client.stdio import stdio_client
+import market
+from accounts import Account
+from database import write_log, flush_logs, read_log
+from benchmarks.standins import SYMBOLS, install_polygon_stand_in, write_price_file
+from benchmarks.timing import measure, measure_async
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def funded_account(name: str, transactions: int = 0) -> Account:
+    """A freshly reset account with effectively unlimited cash and the given number of past trades"""
+    account = Account.get(name)
+    account.reset("Benchmark")
+    account.balance = 1e12
+    account.save()
+    for index in range(transactions):
+        account.buy_shares(SYMBOLS[index % len(SYMBOLS)], 1, "Benchmark")
+    return account
+
+
+def bench_buy_shares(iterations: int) -> dict:
+    install_polygon_stand_in()
+    account = funded_account("benchbuy")
+    symbols = itertools.cycle(SYMBOLS)
+    return measure("buy_shares", lambda: account.buy_shares(next(symbols), 1, "Benchmark"), iterations)
+
+
+def bench_report(iterations: int, history: int = 500) -> dict:
+    install_polygon_stand_in()
+    account = funded_account("benchreport", transactions=history)
+    return measure(f"report_{history}_transactions", account.report, iterations)
+
+
+def bench_write_log(iterations: int) -> dict:
+    return measure("write_log", lambda: write_log("benchlog", "account", "Benchmark entry"), iterations)
+
+
+def bench_write_log_flushed(iterations: int, batch: int = 100) -> dict:
+    def write_batch():
+        for _ in range(batch):
+            write_log("benchlog", "account", "Benchmark entry")
+        flush_logs()
+
+    return measure(f"write_log_flush_{batch}", write_batch, iterations)
+
+
+def bench_read_log(iterations: int) -> dict:
+    for _ in range(1000):
+        write_log("benchread", "account", "Benchmark entry")
+    flush_logs()
+    return measure("read_log", lambda: list(read_log("benchread", last_n=13)), iterations)
+
+
+def bench_get_share_price_cached(iterations: int) -> dict:
+    install_polygon_stand_in()
+    market.get_share_price("AAPL")
+    return measure("get_share_price_cached", lambda: market.get_share_price("AAPL"), iterations)
+
+
+def bench_get_share_price_miss(iterations: int, latency: float = 0.0) -> dict:
+    """Every lookup is a new symbol, so each one goes through the disk cache and the Polygon stand-in"""
+    install_polygon_stand_in(latency)
+    symbols = (f"MISS{index}" for index in itertools.count())
+    return measure("get_share_price_miss", lambda: market.get_share_price(next(symbols)), iterations)
+
+
+async def bench_mcp_round_trip(iterations: int) -> list[dict]:
+    """Tool calls and resource reads through a real accounts_server process priced from a replay file"""
+    funded_account("benchmcp", transactions=50)
+    directory = tempfile.mkdtemp(prefix="benchmark")
+    clock_file = os.path.join(directory, "clock")
+    with open(clock_file, "w") as f:
+        f.write("2024-06-28 16:00:00")
+    env = {
+        "ACCOUNTS_DB": os.path.abspath(os.environ["ACCOUNTS_DB"]),
+        "REPLAY_PRICES_FILE": write_price_file(os.path.join(directory, "prices.csv")),
+        "REPLAY_CLOCK_FILE": clock_file,
+    }
+    params = StdioServerParameters(command=sys.executable, args=["accounts_server.py"], env=env, cwd=SERVER_DIRECTORY)
+    async with stdio_client(params) as streams:
+        async with mcp.ClientSession(*streams) as session:
+            await session.initialize()
+            return [
+                await measure_async(
+                    "mcp_get_balance", lambda: session.call_tool("get_balance", {"name": "benchmcp"}), iterations
+                ),
+                await measure_async(
+                    "mcp_read_account_resource",
+                    lambda: session.read_resource("accounts://accounts_server/benchmcp"),
+                    iterations,
+                ),
+            ]
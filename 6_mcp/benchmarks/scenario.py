@@ -0,0 +1,27 @@
+import os
+import tempfile
+from backtest import run_backtest
+from benchmarks.standins import write_price_file
+
+
+async def run_scenario(traders: int, cycles: int, trades: int = 3) -> dict:
+    """N traders x M cycles through the Runner, tools, database and tracer, with the stub model and replayed prices"""
+    prices_file = write_price_file(os.path.join(tempfile.mkdtemp(prefix="benchmark"), "prices.csv"), days=cycles)
+    result = await run_backtest(prices_file, cycles=cycles, traders=traders, trades=trades)
+    return {
+        "name": f"scenario_{traders}x{cycles}",
+        "traders": traders,
+        "cycles": result["cycles"],
+        "trades": result["trades"],
+        "seconds": result["seconds"],
+        "trades_per_minute": result["trades_per_minute"],
+        "cycles_per_second": result["cycles_per_second"],
+        "spans": {
+            f"{span['kind']}:{span['label']}": {
+                "count": span["count"],
+                "mean_ms": span["mean_ms"],
+                "p95_ms": span["p95_ms"],
+            }
+            for span in result["span_latencies"]
+        },
+    }
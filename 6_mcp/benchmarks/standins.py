@@ -0,0 +1,36 @@
+import random
+import time
+from datetime import date, timedelta
+import market
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "AMZN", "GOOGL", "META", "TSLA", "JPM", "V", "XOM"]
+
+
+def write_price_file(path: str, symbols: list[str] = SYMBOLS, days: int = 250, seed: int = 7) -> str:
+    """A CSV of daily closes following a seeded random walk, for replays"""
+    generator = random.Random(seed)
+    prices = {symbol: generator.uniform(20, 400) for symbol in symbols}
+    start = date(2024, 1, 2)
+    with open(path, "w") as f:
+        f.write("date,symbol,close\n")
+        for day in range(days):
+            for symbol in symbols:
+                prices[symbol] *= 1 + generator.gauss(0, 0.02)
+                f.write(f"{start + timedelta(days=day)},{symbol},{prices[symbol]:.2f}\n")
+    return path
+
+
+def install_polygon_stand_in(latency: float = 0.0) -> None:
+    """
+    Route market.py's Polygon lookups to a local function that sleeps for latency seconds per request
+    and prices each symbol deterministically, so the price cache and everything above it runs as in production.
+    """
+
+    def fetch(symbols: list[str]) -> dict[str, float]:
+        if latency:
+            time.sleep(latency)
+        return {symbol: float(10 + sum(map(ord, symbol)) % 390) for symbol in symbols}
+
+    market.set_replay(None, None)
+    market.polygon_api_key = "benchmark"
+    market.get_share_prices_polygon = fetch
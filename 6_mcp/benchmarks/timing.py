@@ -0,0 +1,42 @@
+import math
+import time
+
+
+def summarize(name: str, samples: list[float]) -> dict:
+    """Latency statistics in milliseconds for a list of durations in seconds"""
+    ordered = sorted(samples)
+    total = sum(ordered)
+    return {
+        "name": name,
+        "iterations": len(ordered),
+        "mean_ms": 1000 * total / len(ordered),
+        "p50_ms": 1000 * ordered[(len(ordered) - 1) // 2],
+        "p95_ms": 1000 * ordered[math.ceil(0.95 * len(ordered)) - 1],
+        "min_ms": 1000 * ordered[0],
+        "max_ms": 1000 * ordered[-1],
+        "ops_per_second": len(ordered) / total if total else 0.0,
+    }
+
+
+def measure(name: str, fn, iterations: int, warmup: int = 5) -> dict:
+    """Call fn() warmup times, then time each of iterations further calls"""
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(name, samples)
+
+
+async def measure_async(name: str, fn, iterations: int, warmup: int = 5) -> dict:
+    """The same as measure, for a coroutine function"""
+    for _ in range(warmup):
+        await fn()
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await fn()
+        samples.append(time.perf_counter() - start)
+    return summarize(name, samples)
@@ -0,0 +1,170 @@
+import copy
+import json
+import os
+from database import read_transactions
+
+try:
+    import tiktoken
+
+    encoding = tiktoken.get_encoding("o200k_base")
+except Exception:
+    encoding = None
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2500"))
+CONTEXT_RECENT_TRANSACTIONS = int(os.getenv("CONTEXT_RECENT_TRANSACTIONS", "12"))
+CONTEXT_RATIONALE_CHARS = int(os.getenv("CONTEXT_RATIONALE_CHARS", "240"))
+
+
+def count_tokens(text: str) -> int:
+    """Tokens in text with the local tokenizer, or an estimate of 4 characters per token without tiktoken"""
+    if encoding:
+        return len(encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def shorten(text: str, limit: int) -> str:
+    if limit <= 0:
+        return ""
+    return text if len(text) <= limit else text[: limit - 3].rstrip() + "..."
+
+
+class TransactionSummary:
+    """Running per-symbol totals of the older transactions, folded in once each and then kept between runs"""
+
+    def __init__(self):
+        self.count = 0
+        self.last = None
+        self.symbols = {}
+        self.first_timestamp = None
+        self.last_timestamp = None
+
+    def add(self, transaction: dict) -> None:
+        quantity = transaction["quantity"]
+        totals = self.symbols.setdefault(
+            transaction["symbol"], {"trades": 0, "bought": 0, "sold": 0, "spent": 0.0, "received": 0.0}
+        )
+        totals["trades"] += 1
+        if quantity > 0:
+            totals["bought"] += quantity
+            totals["spent"] += quantity * transaction["price"]
+        else:
+            totals["sold"] -= quantity
+            totals["received"] -= quantity * transaction["price"]
+        self.first_timestamp = self.first_timestamp or transaction["timestamp"]
+        self.last_timestamp = transaction["timestamp"]
+        self.count += 1
+        self.last = key(transaction)
+
+    def describe(self, max_symbols: int | None = None) -> dict:
+        ranked = sorted(self.symbols.items(), key=lambda item: item[1]["spent"] + item[1]["received"], reverse=True)
+        shown = ranked if max_symbols is None else ranked[:max_symbols]
+        symbols = {}
+        for symbol, totals in shown:
+            entry = {"trades": totals["trades"], "bought": totals["bought"], "sold": totals["sold"]}
+            if totals["bought"]:
+                entry["average_buy_price"] = round(totals["spent"] / totals["bought"], 2)
+            if totals["sold"]:
+                entry["average_sell_price"] = round(totals["received"] / totals["sold"], 2)
+            symbols[symbol] = entry
+        summary = {
+            "transactions": self.count,
+            "from": self.first_timestamp,
+            "to": self.last_timestamp,
+            "by_symbol": symbols,
+        }
+        if len(shown) < len(ranked):
+            summary["other_symbols"] = len(ranked) - len(shown)
+        return summary
+
+
+def key(transaction: dict) -> tuple:
+    return transaction["timestamp"], transaction["symbol"], transaction["quantity"], transaction["price"]
+
+
+class AccountContext:
+    """
+    Builds the account payload for a trader's prompt: the most recent transactions in full,
+    everything older folded into a per-symbol summary, the whole kept within a token budget.
+    The summary is kept between runs, so each run only folds in the transactions that aged out since the last one,
+    taken from the account report's page of recent transactions, or from the database once they are older than that.
+    """
+
+    def __init__(
+        self,
+        budget: int = CONTEXT_TOKEN_BUDGET,
+        recent: int = CONTEXT_RECENT_TRANSACTIONS,
+        rationale_chars: int = CONTEXT_RATIONALE_CHARS,
+    ):
+        self.budget = budget
+        self.recent = recent
+        self.rationale_chars = rationale_chars
+        self.summary = TransactionSummary()
+        self.tokens = 0
+
+    def older(self, name: str, transactions: list[dict], start: int, first: int, end: int) -> list[dict]:
+        """Transactions number first up to end of the history, given the page of them from number start onwards"""
+        if first >= start:
+            return transactions[first - start : end - start]
+        return read_transactions(name, limit=end - first, offset=start + len(transactions) - end)
+
+    def summarize(self, name: str, transactions: list[dict], start: int, end: int) -> None:
+        """Fold the transactions up to number end into the summary, starting over if the history has changed under it"""
+        if self.summary.count > end:
+            self.summary = TransactionSummary()
+        # Read the last transaction already folded in as well, to check it is still the one the summary ends with
+        first = max(self.summary.count - 1, 0)
+        older = self.older(name, transactions, start, first, end)
+        if self.summary.count:
+            if older and key(older[0]) == self.summary.last:
+                older = older[1:]
+            else:
+                self.summary = TransactionSummary()
+                older = self.older(name, transactions, start, 0, end)
+        for transaction in older:
+            self.summary.add(transaction)
+
+    def render(
+        self, account: dict, recent: list[dict], summary: TransactionSummary, rationale_chars: int, max_symbols: int | None
+    ) -> str:
+        payload = dict(account)
+        payload["recent_transactions"] = [
+            {**transaction, "rationale": shorten(transaction["rationale"], rationale_chars)}
+            if rationale_chars
+            else {field: value for field, value in transaction.items() if field != "rationale"}
+            for transaction in recent
+        ]
+        if summary.count:
+            payload["earlier_transactions_summary"] = summary.describe(max_symbols)
+        return json.dumps(payload)
+
+    def build(self, account: dict) -> str:
+        """The account as JSON within the token budget, tightening the recent window and summary until it fits"""
+        account = dict(account)
+        account.pop("portfolio_value_time_series", None)
+        transactions = account.pop("transactions", [])
+        start = account.pop("transactions_start", 0)
+        keep = min(self.recent, len(transactions))
+        self.summarize(account["name"], transactions, start, start + len(transactions) - keep)
+        recent = transactions[len(transactions) - keep :]
+        summary = self.summary
+        rationale_chars = self.rationale_chars
+        max_symbols = None
+        while True:
+            text = self.render(account, recent, summary, rationale_chars, max_symbols)
+            self.tokens = count_tokens(text)
+            if self.tokens <= self.budget:
+                return text
+            if rationale_chars > 60:
+                rationale_chars //= 2
+            elif len(recent) > 3:
+                if summary is self.summary:
+                    summary = copy.deepcopy(self.summary)
+                for transaction in recent[: len(recent) // 2]:
+                    summary.add(transaction)
+                recent = recent[len(recent) // 2 :]
+            elif rationale_chars:
+                rationale_chars = 0
+            elif max_symbols is None or max_symbols > 5:
+                max_symbols = max(5, (max_symbols or len(summary.symbols)) // 2)
+            else:
+                return text
@@ -1,101 +1,1287 @@
-import sqlite3
-import json
-from datetime import datetime
-from dotenv import load_dotenv
-
-load_dotenv(override=True)
-
-DB = "accounts.db"
-
-
-with sqlite3.connect(DB) as conn:
-    cursor = conn.cursor()
-    cursor.execute('CREATE TABLE IF NOT EXISTS accounts (name TEXT PRIMARY KEY, account TEXT)')
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT,
-            datetime DATETIME,
-            type TEXT,
-            message TEXT
-        )
-    ''')
-    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
-    conn.commit()
-
-def write_account(name, account_dict):
-    json_data = json.dumps(account_dict)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO accounts (name, account)
-            VALUES (?, ?)
-            ON CONFLICT(name) DO UPDATE SET account=excluded.account
-        ''', (name.lower(), json_data))
-        conn.commit()
-
-def read_account(name):
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT account FROM accounts WHERE name = ?', (name.lower(),))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
-    
-def write_log(name: str, type: str, message: str):
-    """
-    Write a log entry to the logs table.
-    
-    Args:
-        name (str): The name associated with the log
-        type (str): The type of log entry
-        message (str): The log message
-    """
-    now = datetime.now().isoformat()
-    
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO logs (name, datetime, type, message)
-            VALUES (?, datetime('now'), ?, ?)
-        ''', (name.lower(), type, message))
-        conn.commit()
-
-def read_log(name: str, last_n=10):
-    """
-    Read the most recent log entries for a given name.
-    
-    Args:
-        name (str): The name to retrieve logs for
-        last_n (int): Number of most recent entries to retrieve
-        
-    Returns:
-        list: A list of tuples containing (datetime, type, message)
-    """
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT datetime, type, message FROM logs 
-            WHERE name = ? 
-            ORDER BY datetime DESC
-            LIMIT ?
-        ''', (name.lower(), last_n))
-        
-        return reversed(cursor.fetchall())
-
-def write_market(date: str, data: dict) -> None:
-    data_json = json.dumps(data)
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO market (date, data)
-            VALUES (?, ?)
-            ON CONFLICT(date) DO UPDATE SET data=excluded.data
-        ''', (date, data_json))
-        conn.commit()
-
-def read_market(date: str) -> dict | None:
-    with sqlite3.connect(DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute('SELECT data FROM market WHERE date = ?', (date,))
-        row = cursor.fetchone()
-        return json.loads(row[0]) if row else None
\ No newline at end of file
+import sqlite3
+import json
+import os
+import queue
+import threading
+import time
+import atexit
+from contextlib import contextmanager
+import math
+from datetime import datetime, timedelta, timezone
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+DB = os.getenv("ACCOUNTS_DB", "accounts.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+LOG_FLUSH_INTERVAL = float(os.getenv("LOG_FLUSH_INTERVAL", "0.5"))
+LOG_WATCH_INTERVAL = float(os.getenv("LOG_WATCH_INTERVAL", "0.5"))
+SERIES_RAW_RETENTION_DAYS = float(os.getenv("SERIES_RAW_RETENTION_DAYS", "2"))
+SERIES_5M_RETENTION_DAYS = float(os.getenv("SERIES_5M_RETENTION_DAYS", "30"))
+SERIES_1H_RETENTION_DAYS = float(os.getenv("SERIES_1H_RETENTION_DAYS", "365"))
+SERIES_MAX_POINTS = int(os.getenv("SERIES_MAX_POINTS", "500"))
+LEDGER_SNAPSHOT_EVERY = int(os.getenv("LEDGER_SNAPSHOT_EVERY", "100"))
+SPAN_LATENCY_BUCKETS_MS = [10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000]
+
+# Portfolio value tiers, finest first: (resolution, bucket size in seconds, how long it is kept)
+# Raw points are kept for a short window, and rolled up on write into 5 minute, hourly and daily OHLC buckets
+
+SERIES_TIERS = [
+    ("raw", None, timedelta(days=SERIES_RAW_RETENTION_DAYS)),
+    ("5m", 300, timedelta(days=SERIES_5M_RETENTION_DAYS)),
+    ("1h", 3600, timedelta(days=SERIES_1H_RETENTION_DAYS)),
+    ("1d", 86400, None),
+]
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Statements are kept as module constants so that each pooled connection's statement cache
+# (cached_statements) keeps them prepared between calls
+
+UPSERT_ACCOUNT = '''
+    INSERT INTO accounts (name, account, balance, strategy, version)
+    VALUES (?, NULL, ?, ?, 1)
+    ON CONFLICT(name) DO UPDATE SET
+        account=NULL, balance=excluded.balance, strategy=excluded.strategy, version=accounts.version + 1
+'''
+UPDATE_ACCOUNT_IF_VERSION = '''
+    UPDATE accounts SET balance = ?, strategy = ?, version = version + 1
+    WHERE name = ? AND version = ?
+'''
+UPDATE_TRADE_IF_VERSION = '''
+    UPDATE accounts SET balance = ?, version = version + 1
+    WHERE name = ? AND version = ?
+'''
+SELECT_VERSION = 'SELECT version FROM accounts WHERE name = ?'
+INSERT_EVENT = 'INSERT INTO account_events (name, version, datetime, type, data) VALUES (?, ?, ?, ?, ?)'
+SELECT_EVENTS_AFTER = '''
+    SELECT id, version, datetime, type, data FROM account_events
+    WHERE name = ? AND id > ? AND datetime <= ?
+    ORDER BY id
+'''
+SELECT_LATEST_EVENT_ID = 'SELECT MAX(id) FROM account_events WHERE name = ?'
+SELECT_EVENTS_PAGE = '''
+    SELECT id, version, datetime, type, data FROM account_events
+    WHERE name = ? AND id > ?
+    ORDER BY id
+    LIMIT ?
+'''
+INSERT_LEDGER_SNAPSHOT = 'INSERT OR REPLACE INTO account_snapshots (name, event_id, datetime, state) VALUES (?, ?, ?, ?)'
+SELECT_LEDGER_SNAPSHOT = '''
+    SELECT event_id, state FROM account_snapshots
+    WHERE name = ? AND datetime <= ?
+    ORDER BY event_id DESC
+    LIMIT 1
+'''
+SELECT_ACCOUNT = 'SELECT name, balance, strategy, version FROM accounts WHERE name = ?'
+SELECT_HOLDINGS = 'SELECT symbol, quantity FROM holdings WHERE name = ?'
+SELECT_ACCOUNTS = '''
+    SELECT name, balance, strategy, version FROM accounts
+    WHERE ? IS NULL OR name IN (SELECT value FROM json_each(?))
+    ORDER BY name
+'''
+SELECT_ACCOUNTS_HOLDINGS = '''
+    SELECT name, symbol, quantity FROM holdings
+    WHERE ? IS NULL OR name IN (SELECT value FROM json_each(?))
+'''
+DELETE_HOLDINGS = 'DELETE FROM holdings WHERE name = ?'
+UPSERT_HOLDING = '''
+    INSERT INTO holdings (name, symbol, quantity)
+    VALUES (?, ?, ?)
+    ON CONFLICT(name, symbol) DO UPDATE SET quantity=excluded.quantity
+'''
+DELETE_HOLDING = 'DELETE FROM holdings WHERE name = ? AND symbol = ?'
+UPSERT_BOOK = '''
+    INSERT INTO books (name, method, net_spend, realized_pnl, transaction_count)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET
+        method=excluded.method, net_spend=excluded.net_spend, realized_pnl=excluded.realized_pnl,
+        transaction_count=excluded.transaction_count
+'''
+UPSERT_BOOK_POSITION = '''
+    INSERT INTO book_positions (name, symbol, quantity, cost_basis, realized_pnl, next_lot, first_lot)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(name, symbol) DO UPDATE SET
+        quantity=excluded.quantity, cost_basis=excluded.cost_basis, realized_pnl=excluded.realized_pnl,
+        next_lot=excluded.next_lot, first_lot=excluded.first_lot
+'''
+UPSERT_BOOK_LOT = '''
+    INSERT INTO book_lots (name, symbol, seq, quantity, price, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(name, symbol, seq) DO UPDATE SET quantity=excluded.quantity, price=excluded.price
+'''
+DELETE_BOOK_LOTS_BEFORE = 'DELETE FROM book_lots WHERE name = ? AND symbol = ? AND seq < ?'
+DELETE_BOOK = 'DELETE FROM books WHERE name = ?'
+DELETE_BOOK_POSITIONS = 'DELETE FROM book_positions WHERE name = ?'
+DELETE_BOOK_LOTS = 'DELETE FROM book_lots WHERE name = ?'
+SELECT_BOOKS = '''
+    SELECT name, method, net_spend, realized_pnl, transaction_count FROM books
+    WHERE name IN (SELECT value FROM json_each(?))
+'''
+SELECT_BOOKS_POSITIONS = '''
+    SELECT name, symbol, quantity, cost_basis, realized_pnl, next_lot, first_lot FROM book_positions
+    WHERE name IN (SELECT value FROM json_each(?))
+'''
+SELECT_BOOK_LOTS = '''
+    SELECT seq, quantity, price, timestamp FROM book_lots
+    WHERE name = ? AND symbol = ?
+    ORDER BY seq
+'''
+INSERT_TRANSACTION = '''
+    INSERT INTO transactions (name, symbol, quantity, price, timestamp, rationale, idempotency_key)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+HAS_IDEMPOTENCY_KEY = 'SELECT 1 FROM transactions WHERE name = ? AND idempotency_key = ?'
+SELECT_TRANSACTIONS = '''
+    SELECT symbol, quantity, price, timestamp, rationale FROM transactions
+    WHERE name = ?
+    ORDER BY id
+'''
+SELECT_TRANSACTIONS_PAGE = '''
+    SELECT symbol, quantity, price, timestamp, rationale FROM (
+        SELECT id, symbol, quantity, price, timestamp, rationale FROM transactions
+        WHERE name = ?
+        ORDER BY id DESC
+        LIMIT ? OFFSET ?
+    ) ORDER BY id
+'''
+SELECT_RECENT_TRANSACTIONS = '''
+    SELECT name, symbol, quantity, price, timestamp, rationale FROM (
+        SELECT id, name, symbol, quantity, price, timestamp, rationale,
+            ROW_NUMBER() OVER (PARTITION BY name ORDER BY id DESC) AS recent
+        FROM transactions
+        WHERE name IN (SELECT value FROM json_each(?))
+    ) WHERE recent <= ?
+    ORDER BY name, id
+'''
+COUNT_TRANSACTIONS = 'SELECT COUNT(*) FROM transactions WHERE name = ?'
+DELETE_TRANSACTIONS = 'DELETE FROM transactions WHERE name = ?'
+INSERT_SNAPSHOT = 'INSERT INTO portfolio_snapshots (name, datetime, value) VALUES (?, ?, ?)'
+SELECT_SNAPSHOTS = 'SELECT datetime, value FROM portfolio_snapshots WHERE name = ? ORDER BY id'
+DELETE_SNAPSHOTS = 'DELETE FROM portfolio_snapshots WHERE name = ?'
+PRUNE_SNAPSHOTS = 'DELETE FROM portfolio_snapshots WHERE name = ? AND datetime < ?'
+UPSERT_ROLLUP = '''
+    INSERT INTO portfolio_rollups (name, resolution, bucket, open, high, low, close)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(name, resolution, bucket) DO UPDATE SET
+        high=max(high, excluded.high), low=min(low, excluded.low), close=excluded.close
+'''
+DELETE_ROLLUPS = 'DELETE FROM portfolio_rollups WHERE name = ?'
+PRUNE_ROLLUPS = 'DELETE FROM portfolio_rollups WHERE name = ? AND resolution = ? AND bucket < ?'
+EARLIEST_ROLLUP = "SELECT MIN(bucket) FROM portfolio_rollups WHERE name = ? AND resolution = '1d'"
+LATEST_SNAPSHOT = 'SELECT MAX(datetime) FROM portfolio_snapshots WHERE name = ?'
+COUNT_SERIES_RAW = 'SELECT COUNT(*) FROM portfolio_snapshots WHERE name = ? AND datetime >= ? AND datetime <= ?'
+SELECT_SERIES_RAW = '''
+    SELECT datetime, value FROM portfolio_snapshots
+    WHERE name = ? AND datetime >= ? AND datetime <= ?
+    ORDER BY datetime
+'''
+COUNT_SERIES_ROLLUP = '''
+    SELECT COUNT(*) FROM portfolio_rollups
+    WHERE name = ? AND resolution = ? AND bucket >= ? AND bucket <= ?
+'''
+SELECT_SERIES_ROLLUP = '''
+    SELECT bucket, close FROM portfolio_rollups
+    WHERE name = ? AND resolution = ? AND bucket >= ? AND bucket <= ?
+    ORDER BY bucket
+'''
+INSERT_LOG = 'INSERT INTO logs (name, datetime, type, message) VALUES (?, ?, ?, ?)'
+SELECT_LOGS = '''
+    SELECT datetime, type, message FROM logs
+    WHERE name = ?
+    ORDER BY id DESC
+    LIMIT ?
+'''
+SELECT_LOGS_SINCE = '''
+    SELECT id, datetime, type, message FROM logs
+    WHERE name = ? AND id > ?
+    ORDER BY id DESC
+    LIMIT ?
+'''
+SELECT_LATEST_LOG_IDS = 'SELECT name, MAX(id) FROM logs WHERE id > ? GROUP BY name'
+INSERT_SPAN_METRIC = '''
+    INSERT INTO span_metrics (name, datetime, kind, label, duration_ms, error)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+SELECT_SPAN_METRICS = '''
+    SELECT kind, label, duration_ms, error FROM span_metrics
+    WHERE datetime >= ? AND (? IS NULL OR kind = ?) AND (? IS NULL OR name = ?)
+    ORDER BY kind, label, duration_ms
+'''
+UPSERT_MARKET_PRICE = '''
+    INSERT INTO market_prices (date, ticker, close)
+    VALUES (?, ?, ?)
+    ON CONFLICT(date, ticker) DO UPDATE SET close=excluded.close
+'''
+SELECT_MARKET = 'SELECT ticker, close FROM market_prices WHERE date = ?'
+SELECT_MARKET_PRICES = '''
+    SELECT ticker, close FROM market_prices
+    WHERE date = ? AND ticker IN (SELECT value FROM json_each(?))
+'''
+HAS_MARKET = 'SELECT 1 FROM market_prices WHERE date = ? LIMIT 1'
+UPSERT_PRICE = '''
+    INSERT INTO prices (symbol, price, fetched_at)
+    VALUES (?, ?, ?)
+    ON CONFLICT(symbol) DO UPDATE SET price=excluded.price, fetched_at=excluded.fetched_at
+'''
+SELECT_PRICES = 'SELECT symbol, price, fetched_at FROM prices WHERE symbol IN (SELECT value FROM json_each(?))'
+SELECT_TOOL_RESULT = 'SELECT result, fetched_at FROM tool_cache WHERE key = ?'
+TOUCH_TOOL_RESULT = 'UPDATE tool_cache SET used_at = ? WHERE key = ?'
+UPSERT_TOOL_RESULT = '''
+    INSERT INTO tool_cache (key, tool, result, size, fetched_at, used_at)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT(key) DO UPDATE SET
+        result=excluded.result, size=excluded.size, fetched_at=excluded.fetched_at, used_at=excluded.used_at
+'''
+TOOL_CACHE_SIZE = 'SELECT COALESCE(SUM(size), 0) FROM tool_cache'
+SELECT_TOOL_CACHE_LRU = 'SELECT key, size FROM tool_cache ORDER BY used_at'
+DELETE_TOOL_RESULT = 'DELETE FROM tool_cache WHERE key = ?'
+INSERT_TRADER_RUN = '''
+    INSERT INTO trader_runs (name, mode, started, ended, status, attempts, error)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+SELECT_TRADER_RUNS = '''
+    SELECT name, mode, started, ended, status, attempts, error FROM trader_runs
+    WHERE ? IS NULL OR name = ?
+    ORDER BY id DESC LIMIT ?
+'''
+
+
+class VersionConflict(Exception):
+    """The account was changed by another writer since it was read, so the update was not applied"""
+
+
+class DuplicateTrade(Exception):
+    """A trade with the same idempotency key was already recorded for the account, so it was not recorded again"""
+
+
+class ConnectionPool:
+    """
+    A thread-safe pool of SQLite connections to a single database file.
+    Connections are opened lazily up to `size`, run in WAL mode so readers don't block the writer,
+    and are in autocommit mode: use transaction() to group statements into one commit.
+    """
+
+    def __init__(self, path: str, size: int = DB_POOL_SIZE):
+        self.path = path
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=30,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return self._open()
+                except Exception:
+                    self._opened -= 1
+                    raise
+        return self._idle.get()
+
+    def _release(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor inside BEGIN IMMEDIATE ... COMMIT, rolling back on error"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def close(self) -> None:
+        with self._lock:
+            while True:
+                try:
+                    self._idle.get_nowait().close()
+                except queue.Empty:
+                    break
+            self._opened = 0
+
+
+class LogWriter:
+    """
+    Collects rows for the logs and span_metrics tables in memory and writes everything queued
+    in a single transaction, once per flush interval, on a background daemon thread.
+    Rows from a flush that failed are kept and written first by the next one.
+    """
+
+    def __init__(self, pool: ConnectionPool, interval: float = LOG_FLUSH_INTERVAL, on_flush=None):
+        self.pool = pool
+        self.interval = interval
+        self.on_flush = on_flush
+        self._queue = queue.SimpleQueue()
+        self._unwritten = []
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Was not able to write logs due to {e}")
+
+    def write(self, row: tuple, statement: str = INSERT_LOG) -> None:
+        self._ensure_started()
+        self._queue.put((statement, row))
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            rows, self._unwritten = self._unwritten, []
+            while True:
+                try:
+                    rows.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if rows:
+                batches = {}
+                for statement, row in rows:
+                    batches.setdefault(statement, []).append(row)
+                try:
+                    with self.pool.transaction() as cursor:
+                        for statement, batch in batches.items():
+                            cursor.executemany(statement, batch)
+                except BaseException:
+                    self._unwritten = rows
+                    raise
+        if rows and self.on_flush:
+            self.on_flush()
+
+    def close(self) -> None:
+        self._stopped.set()
+        self.flush()
+
+
+class LogFeed:
+    """
+    Keeps the newest log id for each name, and notifies subscribers as soon as new log rows exist.
+    Rows written in this process are picked up right after each flush; rows written by other processes
+    are noticed by a background thread that checks PRAGMA data_version on its own connection,
+    so an idle database costs one pragma per interval and no log queries at all.
+    """
+
+    def __init__(self, path: str, interval: float = LOG_WATCH_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._latest: dict[str, int] = {}
+        self._high_water = 0
+        self._data_version = None
+        self._subscribers = []
+        self._conn = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_started(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+                    self._poll_locked()
+                    self._thread = threading.Thread(target=self._run, name="log-feed", daemon=True)
+                    self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Was not able to watch logs due to {e}")
+
+    def _poll_locked(self) -> dict[str, int]:
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._data_version:
+            return {}
+        self._data_version = version
+        changed = dict(self._conn.execute(SELECT_LATEST_LOG_IDS, (self._high_water,)).fetchall())
+        self._latest.update(changed)
+        self._high_water = max([self._high_water, *changed.values()])
+        return changed
+
+    def poll(self) -> None:
+        """Check for new log rows now, and notify subscribers of each name that has them"""
+        if self._conn is None:
+            return
+        with self._lock:
+            changed = self._poll_locked()
+            subscribers = list(self._subscribers)
+        for name, latest_id in changed.items():
+            for callback in subscribers:
+                callback(name, latest_id)
+
+    def latest_id(self, name: str) -> int:
+        self._ensure_started()
+        return self._latest.get(name.lower(), 0)
+
+    def subscribe(self, callback) -> None:
+        """Call callback(name, latest_id) whenever new log rows are written for a name"""
+        self._ensure_started()
+        with self._lock:
+            self._subscribers.append(callback)
+
+
+pool = ConnectionPool(DB)
+log_feed = LogFeed(DB)
+log_writer = LogWriter(pool, on_flush=log_feed.poll)
+atexit.register(log_writer.close)
+
+
+def _account_state(cursor, name: str) -> dict:
+    """The current balance, strategy, holdings and version of an account, as stored in the accounts and holdings tables"""
+    balance, strategy, version = cursor.execute(
+        "SELECT balance, strategy, version FROM accounts WHERE name = ?", (name,)
+    ).fetchone()
+    holdings = dict(cursor.execute(SELECT_HOLDINGS, (name,)).fetchall())
+    return {"balance": balance, "strategy": strategy, "holdings": holdings, "version": version}
+
+
+def _append_event(cursor, name: str, version: int, type: str, data: dict, timestamp: str | None = None) -> None:
+    """
+    Append an event to the account's ledger, in the same transaction as the change it records.
+    Every LEDGER_SNAPSHOT_EVERY versions, the resulting state is also snapshotted so rebuilds only replay a short tail.
+    """
+    timestamp = timestamp or datetime.now().strftime(TIMESTAMP_FORMAT)
+    cursor.execute(INSERT_EVENT, (name, version, timestamp, type, json.dumps(data)))
+    event_id = cursor.lastrowid
+    if version % LEDGER_SNAPSHOT_EVERY == 0:
+        cursor.execute(INSERT_LEDGER_SNAPSHOT, (name, event_id, timestamp, json.dumps(_account_state(cursor, name))))
+
+
+def _apply_event(state: dict, type: str, data: dict) -> None:
+    """Move an account state forward by one ledger event"""
+    if type in ("buy", "sell"):
+        quantity = state["holdings"].get(data["symbol"], 0) + data["quantity"]
+        if quantity:
+            state["holdings"][data["symbol"]] = quantity
+        else:
+            state["holdings"].pop(data["symbol"], None)
+    else:
+        state["strategy"] = data["strategy"]
+        state["holdings"] = dict(data["holdings"])
+    state["balance"] = data["balance"]
+
+
+def _replace_account(
+    cursor, name: str, account_dict: dict, event_type: str = "reset", timestamp: str | None = None
+) -> int:
+    """
+    Write every part of an account that is present in account_dict, replacing what was stored,
+    record it in the ledger as an event of event_type at timestamp, and return the account's new version
+    """
+    cursor.execute(UPSERT_ACCOUNT, (name, account_dict["balance"], account_dict["strategy"]))
+    if "book" in account_dict:
+        _replace_book(cursor, name, account_dict["book"])
+    cursor.execute(DELETE_HOLDINGS, (name,))
+    cursor.executemany(
+        UPSERT_HOLDING, [(name, symbol, quantity) for symbol, quantity in account_dict["holdings"].items()]
+    )
+    if "transactions" in account_dict:
+        cursor.execute(DELETE_TRANSACTIONS, (name,))
+        cursor.executemany(INSERT_TRANSACTION, [
+            (name, t["symbol"], t["quantity"], t["price"], t["timestamp"], t["rationale"], t.get("idempotency_key"))
+            for t in account_dict["transactions"]
+        ])
+    if "portfolio_value_time_series" in account_dict:
+        cursor.execute(DELETE_SNAPSHOTS, (name,))
+        cursor.execute(DELETE_ROLLUPS, (name,))
+        _insert_snapshots(cursor, name, account_dict["portfolio_value_time_series"])
+    version = cursor.execute(SELECT_VERSION, (name,)).fetchone()[0]
+    state = {"balance": account_dict["balance"], "strategy": account_dict["strategy"], "holdings": account_dict["holdings"]}
+    _append_event(cursor, name, version, "open" if version == 1 else event_type, state, timestamp)
+    return version
+
+
+def _write_position(cursor, name: str, position: dict) -> None:
+    """
+    Write a book position and the lots given with it, and drop its stored lots numbered before first_lot,
+    which have been used up
+    """
+    symbol = position["symbol"]
+    cursor.execute(UPSERT_BOOK_POSITION, (
+        name, symbol, position["quantity"], position["cost_basis"], position["realized_pnl"],
+        position["next_lot"], position["first_lot"],
+    ))
+    cursor.execute(DELETE_BOOK_LOTS_BEFORE, (name, symbol, position["first_lot"]))
+    cursor.executemany(UPSERT_BOOK_LOT, [
+        (name, symbol, lot["seq"], lot["quantity"], lot["price"], lot["timestamp"]) for lot in position["lots"]
+    ])
+
+
+def _replace_book(cursor, name: str, book: dict) -> None:
+    """Write a whole accounting book, with every position and lot, replacing what was stored"""
+    cursor.execute(DELETE_BOOK_POSITIONS, (name,))
+    cursor.execute(DELETE_BOOK_LOTS, (name,))
+    cursor.execute(UPSERT_BOOK, (
+        name, book["method"], book["net_spend"], book["realized_pnl"], book["transaction_count"],
+    ))
+    for position in book["positions"].values():
+        _write_position(cursor, name, position)
+
+
+def _bucket(timestamp: str, seconds: int) -> str:
+    """The start of the bucket of the given size, within its day, that the timestamp falls in"""
+    moment = datetime.fromisoformat(timestamp)
+    since_midnight = moment.hour * 3600 + moment.minute * 60 + moment.second
+    start = since_midnight - since_midnight % seconds if seconds < 86400 else 0
+    return f"{moment:%Y-%m-%d} {start // 3600:02d}:{start % 3600 // 60:02d}:{start % 60:02d}"
+
+
+def _insert_snapshots(cursor, name: str, points) -> None:
+    """
+    Append raw portfolio values, fold them into each rollup tier, and drop whatever has aged out of a tier.
+    Ages are measured back from the newest point, not the wall clock, so series with simulated timestamps
+    (from a replay or backtest) keep their finer tiers.
+    """
+    points = list(points)
+    if not points:
+        return
+    cursor.executemany(INSERT_SNAPSHOT, [(name, timestamp, value) for timestamp, value in points])
+    cursor.executemany(UPSERT_ROLLUP, [
+        (name, resolution, _bucket(timestamp, seconds), value, value, value, value)
+        for timestamp, value in points
+        for resolution, seconds, _ in SERIES_TIERS
+        if seconds
+    ])
+    newest = datetime.fromisoformat(max(timestamp for timestamp, _ in points))
+    for resolution, _, retention in SERIES_TIERS:
+        if retention is None:
+            continue
+        cutoff = (newest - retention).strftime(TIMESTAMP_FORMAT)
+        if resolution == "raw":
+            cursor.execute(PRUNE_SNAPSHOTS, (name, cutoff))
+        else:
+            cursor.execute(PRUNE_ROLLUPS, (name, resolution, cutoff))
+
+
+def _migrate_series_rollups(cursor) -> None:
+    """One-time build of the rollup tiers from raw snapshots written before they existed"""
+    if cursor.execute("SELECT 1 FROM portfolio_rollups LIMIT 1").fetchone():
+        return
+    names = [row[0] for row in cursor.execute("SELECT DISTINCT name FROM portfolio_snapshots")]
+    for name in names:
+        points = cursor.execute(SELECT_SNAPSHOTS, (name,)).fetchall()
+        cursor.execute(DELETE_SNAPSHOTS, (name,))
+        _insert_snapshots(cursor, name, points)
+    if names:
+        print(f"Built portfolio value rollups for {len(names)} accounts")
+
+
+def _migrate_json_accounts(cursor) -> None:
+    """
+    One-time migration from the original schema, where each account was a single JSON document
+    in accounts.account, to the balance/strategy columns and the normalized tables.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(accounts)")}
+    if "balance" not in columns:
+        cursor.execute("ALTER TABLE accounts ADD COLUMN balance REAL")
+    if "strategy" not in columns:
+        cursor.execute("ALTER TABLE accounts ADD COLUMN strategy TEXT")
+    if "book" not in columns:
+        cursor.execute("ALTER TABLE accounts ADD COLUMN book TEXT")
+    if "version" not in columns:
+        cursor.execute("ALTER TABLE accounts ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+    rows = cursor.execute("SELECT name, account FROM accounts WHERE account IS NOT NULL").fetchall()
+    for name, account_json in rows:
+        _replace_account(cursor, name, json.loads(account_json))
+    if rows:
+        print(f"Migrated {len(rows)} accounts to the normalized schema")
+
+
+def _migrate_json_books(cursor) -> None:
+    """One-time migration of the JSON-encoded accounts.book column to the books, book_positions and book_lots tables"""
+    rows = cursor.execute("SELECT name, book FROM accounts WHERE book IS NOT NULL").fetchall()
+    for name, book_json in rows:
+        book = json.loads(book_json)
+        for position in book["positions"].values():
+            for seq, lot in enumerate(position["lots"]):
+                lot["seq"] = seq
+            position["next_lot"] = len(position["lots"])
+            position["first_lot"] = 0
+        _replace_book(cursor, name, book)
+    if rows:
+        cursor.execute("UPDATE accounts SET book = NULL")
+        print(f"Migrated {len(rows)} accounting books to book_positions and book_lots")
+
+
+def _migrate_ledger(cursor) -> None:
+    """One-time opening event for each account written before the ledger existed, recording its state at that point"""
+    names = [row[0] for row in cursor.execute(
+        "SELECT name FROM accounts WHERE name NOT IN (SELECT DISTINCT name FROM account_events)"
+    )]
+    for name in names:
+        state = _account_state(cursor, name)
+        version = state.pop("version")
+        _append_event(cursor, name, version, "open", state)
+    if names:
+        print(f"Opened the ledger for {len(names)} accounts")
+
+
+def _migrate_json_market(cursor) -> None:
+    """One-time migration of the JSON-encoded market table to one market_prices row per date and ticker"""
+    rows = cursor.execute("SELECT date, data FROM market").fetchall()
+    for date, data_json in rows:
+        cursor.executemany(
+            UPSERT_MARKET_PRICE, [(date, ticker, close) for ticker, close in json.loads(data_json).items()]
+        )
+    if rows:
+        cursor.execute("DELETE FROM market")
+        print(f"Migrated {len(rows)} days of market data to market_prices")
+
+
+with pool.transaction() as cursor:
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS accounts (
+            name TEXT PRIMARY KEY,
+            account TEXT,
+            balance REAL,
+            strategy TEXT,
+            book TEXT,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            name TEXT PRIMARY KEY,
+            method TEXT,
+            net_spend REAL,
+            realized_pnl REAL,
+            transaction_count INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS book_positions (
+            name TEXT,
+            symbol TEXT,
+            quantity INTEGER,
+            cost_basis REAL,
+            realized_pnl REAL,
+            next_lot INTEGER,
+            first_lot INTEGER,
+            PRIMARY KEY (name, symbol)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS book_lots (
+            name TEXT,
+            symbol TEXT,
+            seq INTEGER,
+            quantity INTEGER,
+            price REAL,
+            timestamp TEXT,
+            PRIMARY KEY (name, symbol, seq)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS account_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            version INTEGER,
+            datetime TEXT,
+            type TEXT,
+            data TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_account_events_name_id ON account_events (name, id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS account_snapshots (
+            name TEXT,
+            event_id INTEGER,
+            datetime TEXT,
+            state TEXT,
+            PRIMARY KEY (name, event_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS holdings (
+            name TEXT,
+            symbol TEXT,
+            quantity INTEGER,
+            PRIMARY KEY (name, symbol)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            symbol TEXT,
+            quantity INTEGER,
+            price REAL,
+            timestamp TEXT,
+            rationale TEXT,
+            idempotency_key TEXT
+        )
+    ''')
+    if "idempotency_key" not in {row[1] for row in cursor.execute("PRAGMA table_info(transactions)")}:
+        cursor.execute("ALTER TABLE transactions ADD COLUMN idempotency_key TEXT")
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_transactions_name_id ON transactions (name, id)')
+    cursor.execute('''
+        CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_idempotency_key
+        ON transactions (name, idempotency_key) WHERE idempotency_key IS NOT NULL
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            datetime TEXT,
+            value REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_name_id ON portfolio_snapshots (name, id)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_portfolio_snapshots_name_datetime ON portfolio_snapshots (name, datetime)'
+    )
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS portfolio_rollups (
+            name TEXT,
+            resolution TEXT,
+            bucket TEXT,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL,
+            PRIMARY KEY (name, resolution, bucket)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            datetime DATETIME,
+            type TEXT,
+            message TEXT
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_logs_name_id ON logs (name, id)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS span_metrics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            datetime DATETIME,
+            kind TEXT,
+            label TEXT,
+            duration_ms REAL,
+            error INTEGER
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_span_metrics_datetime ON span_metrics (datetime)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS market (date TEXT PRIMARY KEY, data TEXT)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS market_prices (
+            date TEXT,
+            ticker TEXT,
+            close REAL,
+            PRIMARY KEY (date, ticker)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE TABLE IF NOT EXISTS prices (symbol TEXT PRIMARY KEY, price REAL, fetched_at REAL)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tool_cache (
+            key TEXT PRIMARY KEY,
+            tool TEXT,
+            result TEXT,
+            size INTEGER,
+            fetched_at REAL,
+            used_at REAL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tool_cache_used_at ON tool_cache (used_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS trader_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            mode TEXT,
+            started DATETIME,
+            ended DATETIME,
+            status TEXT,
+            attempts INTEGER,
+            error TEXT
+        )
+    ''')
+    _migrate_json_accounts(cursor)
+    _migrate_json_books(cursor)
+    _migrate_ledger(cursor)
+    _migrate_json_market(cursor)
+    _migrate_series_rollups(cursor)
+
+
+def write_account(name, account_dict, timestamp: str | None = None) -> int:
+    """
+    Write a whole account, replacing its balance, strategy and holdings, and return its new version.
+    Transactions and the portfolio value time series are only replaced if present in account_dict.
+    The ledger event is stamped with timestamp, by default the wall clock.
+    """
+    with pool.transaction() as cursor:
+        return _replace_account(cursor, name.lower(), account_dict, timestamp=timestamp)
+
+def read_account(name):
+    """
+    Read the name, balance, strategy, holdings and version of an account.
+    Transactions, portfolio snapshots and the accounting book are read separately,
+    with read_transactions, read_portfolio_series and read_books.
+    """
+    with pool.connection() as conn:
+        row = conn.execute(SELECT_ACCOUNT, (name.lower(),)).fetchone()
+        if not row:
+            return None
+        holdings = dict(conn.execute(SELECT_HOLDINGS, (name.lower(),)).fetchall())
+        return {"name": row[0], "balance": row[1], "strategy": row[2], "holdings": holdings, "version": row[3]}
+
+def read_accounts(names: list[str] | None = None) -> dict[str, dict]:
+    """
+    Read several accounts at once, all of them by default, in the same form as read_account.
+    The accounts and their holdings are read with one query each, however many accounts there are.
+    """
+    names_json = json.dumps([name.lower() for name in names]) if names is not None else None
+    with pool.connection() as conn:
+        rows = conn.execute(SELECT_ACCOUNTS, (names_json, names_json)).fetchall()
+        accounts = {
+            name: {
+                "name": name,
+                "balance": balance,
+                "strategy": strategy,
+                "holdings": {},
+                "version": version,
+            }
+            for name, balance, strategy, version in rows
+        }
+        for name, symbol, quantity in conn.execute(SELECT_ACCOUNTS_HOLDINGS, (names_json, names_json)):
+            if name in accounts:
+                accounts[name]["holdings"][symbol] = quantity
+    return accounts
+
+def write_account_state(
+    name: str,
+    balance: float,
+    strategy: str,
+    holdings: dict[str, int],
+    expected_version: int | None = None,
+    event_type: str = "update",
+    event_data: dict | None = None,
+    timestamp: str | None = None,
+) -> int:
+    """
+    Write the balance, strategy and holdings of an account, leaving its history untouched, and return its new version.
+    The change is appended to the ledger as an event of event_type (such as deposit, withdraw or strategy),
+    holding the new state plus any event_data, stamped with timestamp (by default the wall clock).
+    With an expected_version, the write only happens if the account is still at that version,
+    and VersionConflict is raised otherwise.
+    """
+    name = name.lower()
+    state = {"balance": balance, "strategy": strategy, "holdings": holdings}
+    with pool.transaction() as cursor:
+        if expected_version is None:
+            return _replace_account(cursor, name, state, event_type, timestamp)
+        cursor.execute(UPDATE_ACCOUNT_IF_VERSION, (balance, strategy, name, expected_version))
+        if cursor.rowcount == 0:
+            raise VersionConflict(f"Account {name} is no longer at version {expected_version}")
+        cursor.execute(DELETE_HOLDINGS, (name,))
+        cursor.executemany(UPSERT_HOLDING, [(name, symbol, quantity) for symbol, quantity in holdings.items()])
+        _append_event(cursor, name, expected_version + 1, event_type, {**(event_data or {}), **state}, timestamp)
+        return expected_version + 1
+
+def write_book(name: str, book: dict) -> None:
+    with pool.transaction() as cursor:
+        _replace_book(cursor, name.lower(), book)
+
+def read_books(names: list[str]) -> dict[str, dict]:
+    """
+    Read the accounting books of several accounts with their positions, but without their lots,
+    which only a trade needs (see read_book_lots). Accounts without a stored book are left out.
+    """
+    names_json = json.dumps([name.lower() for name in names])
+    with pool.connection() as conn:
+        books = {
+            name: {
+                "method": method,
+                "net_spend": net_spend,
+                "realized_pnl": realized_pnl,
+                "transaction_count": transaction_count,
+                "positions": {},
+            }
+            for name, method, net_spend, realized_pnl, transaction_count in conn.execute(SELECT_BOOKS, (names_json,))
+        }
+        for name, symbol, quantity, cost_basis, realized_pnl, next_lot, first_lot in conn.execute(
+            SELECT_BOOKS_POSITIONS, (names_json,)
+        ):
+            if name in books:
+                books[name]["positions"][symbol] = {
+                    "symbol": symbol,
+                    "quantity": quantity,
+                    "cost_basis": cost_basis,
+                    "realized_pnl": realized_pnl,
+                    "next_lot": next_lot,
+                    "first_lot": first_lot,
+                    "lots": None,
+                }
+    return books
+
+def read_book_lots(name: str, symbol: str, quantity: int | None = None) -> list[dict]:
+    """
+    The open lots of one position in an account's book, oldest first.
+    With a quantity, only the oldest lots that together hold that many shares, which is all a sell of it uses.
+    """
+    lots = []
+    held = 0
+    with pool.connection() as conn:
+        for seq, lot_quantity, price, timestamp in conn.execute(SELECT_BOOK_LOTS, (name.lower(), symbol)):
+            if quantity is not None and held >= quantity:
+                break
+            lots.append({"seq": seq, "quantity": lot_quantity, "price": price, "timestamp": timestamp})
+            held += lot_quantity
+    return lots
+
+def record_trade(
+    name: str,
+    balance: float,
+    symbol: str,
+    quantity_held: int,
+    transaction: dict,
+    book: dict,
+    position: dict,
+    expected_version: int,
+    idempotency_key: str | None = None,
+) -> int:
+    """
+    Record a buy or sell in one transaction: append it to the transactions table,
+    set the new holding for the symbol (removing it at zero) and the new cash balance, and update the accounting book:
+    its totals, and the traded symbol's position with the lots the trade changed (see Position.changes).
+    The trade is only recorded if the account is still at expected_version, raising VersionConflict otherwise,
+    and raises DuplicateTrade if a trade with the same idempotency key was already recorded.
+    Returns the account's new version.
+    """
+    name = name.lower()
+    with pool.transaction() as cursor:
+        if idempotency_key and cursor.execute(HAS_IDEMPOTENCY_KEY, (name, idempotency_key)).fetchone():
+            raise DuplicateTrade(f"Trade {idempotency_key} was already recorded for {name}")
+        cursor.execute(UPDATE_TRADE_IF_VERSION, (balance, name, expected_version))
+        if cursor.rowcount == 0:
+            raise VersionConflict(f"Account {name} is no longer at version {expected_version}")
+        cursor.execute(UPSERT_BOOK, (
+            name, book["method"], book["net_spend"], book["realized_pnl"], book["transaction_count"],
+        ))
+        _write_position(cursor, name, position)
+        if quantity_held:
+            cursor.execute(UPSERT_HOLDING, (name, symbol, quantity_held))
+        else:
+            cursor.execute(DELETE_HOLDING, (name, symbol))
+        cursor.execute(INSERT_TRANSACTION, (
+            name, transaction["symbol"], transaction["quantity"], transaction["price"],
+            transaction["timestamp"], transaction["rationale"], idempotency_key,
+        ))
+        _append_event(
+            cursor, name, expected_version + 1, "buy" if transaction["quantity"] > 0 else "sell",
+            {**transaction, "balance": balance, "idempotency_key": idempotency_key}, transaction["timestamp"],
+        )
+        return expected_version + 1
+
+def rebuild_account(name: str, as_of: str | None = None) -> dict | None:
+    """
+    Derive the balance, strategy, holdings and version of an account from its ledger, as it stood at the
+    as_of datetime (by default, now): the latest snapshot at or before then, plus the events after it.
+    Returns None if the account had no events by then.
+    """
+    name = name.lower()
+    as_of = as_of or datetime.max.strftime(TIMESTAMP_FORMAT)
+    with pool.connection() as conn:
+        row = conn.execute(SELECT_LEDGER_SNAPSHOT, (name, as_of)).fetchone()
+        event_id, state = (row[0], json.loads(row[1])) if row else (0, None)
+        for _, version, _, type, data in conn.execute(SELECT_EVENTS_AFTER, (name, event_id, as_of)):
+            if state is None:
+                state = {"holdings": {}}
+            _apply_event(state, type, json.loads(data))
+            state["version"] = version
+    return {"name": name, **state} if state else None
+
+def read_account_events(name: str, after_id: int = 0, limit: int = 1000) -> list[dict]:
+    """A page of an account's ledger, oldest first, starting after the event with id after_id"""
+    with pool.connection() as conn:
+        rows = conn.execute(SELECT_EVENTS_PAGE, (name.lower(), after_id, limit)).fetchall()
+    return [
+        {"id": id, "version": version, "datetime": timestamp, "type": type, "data": json.loads(data)}
+        for id, version, timestamp, type, data in rows
+    ]
+
+def latest_account_event_id(name: str) -> int:
+    """The id of the newest event in an account's ledger, or 0, so a caller can tell whether anything changed since"""
+    with pool.connection() as conn:
+        return conn.execute(SELECT_LATEST_EVENT_ID, (name.lower(),)).fetchone()[0] or 0
+
+def read_transactions(name: str, limit: int | None = None, offset: int = 0) -> list[dict]:
+    """
+    Read the transactions of an account in the order they were made.
+    With a limit, read only the page of `limit` most recent transactions, skipping the `offset` most recent.
+    """
+    with pool.connection() as conn:
+        if limit is None:
+            cursor = conn.execute(SELECT_TRANSACTIONS, (name.lower(),))
+        else:
+            cursor = conn.execute(SELECT_TRANSACTIONS_PAGE, (name.lower(), limit, offset))
+        columns = [description[0] for description in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def read_recent_transactions(names: list[str], limit: int) -> dict[str, list[dict]]:
+    """Read the `limit` most recent transactions of each of several accounts in one query, oldest first"""
+    recent = {name.lower(): [] for name in names}
+    with pool.connection() as conn:
+        cursor = conn.execute(SELECT_RECENT_TRANSACTIONS, (json.dumps(list(recent)), limit))
+        for name, symbol, quantity, price, timestamp, rationale in cursor:
+            recent[name].append(
+                {"symbol": symbol, "quantity": quantity, "price": price, "timestamp": timestamp, "rationale": rationale}
+            )
+    return recent
+
+def count_transactions(name: str) -> int:
+    with pool.connection() as conn:
+        return conn.execute(COUNT_TRANSACTIONS, (name.lower(),)).fetchone()[0]
+
+def write_portfolio_snapshot(name: str, timestamp: str, value: float) -> None:
+    with pool.transaction() as cursor:
+        _insert_snapshots(cursor, name.lower(), [(timestamp, value)])
+
+def read_portfolio_series(
+    name: str, start: str | None = None, end: str | None = None, max_points: int = SERIES_MAX_POINTS
+) -> list[tuple[str, float]]:
+    """
+    Read the portfolio value between start and end (inclusive, defaulting to all history) as at most max_points
+    (datetime, value) points, from the finest tier that still covers start and fits in max_points.
+    As when pruning, a tier's coverage is measured back from the newest raw point.
+    Rollup buckets are reported at their start with their closing value.
+    """
+    name = name.lower()
+    end = end or datetime.max.strftime(TIMESTAMP_FORMAT)
+    with pool.connection() as conn:
+        if start is None:
+            start = conn.execute(EARLIEST_ROLLUP, (name,)).fetchone()[0]
+            if start is None:
+                return []
+        latest = conn.execute(LATEST_SNAPSHOT, (name,)).fetchone()[0]
+        newest = datetime.fromisoformat(latest) if latest else datetime.now()
+        for resolution, _, retention in SERIES_TIERS:
+            if retention is not None and start < (newest - retention).strftime(TIMESTAMP_FORMAT):
+                continue
+            if resolution == "raw":
+                count = conn.execute(COUNT_SERIES_RAW, (name, start, end)).fetchone()[0]
+                if count <= max_points:
+                    return conn.execute(SELECT_SERIES_RAW, (name, start, end)).fetchall()
+            else:
+                count = conn.execute(COUNT_SERIES_ROLLUP, (name, resolution, start, end)).fetchone()[0]
+                if count <= max_points:
+                    return conn.execute(SELECT_SERIES_ROLLUP, (name, resolution, start, end)).fetchall()
+        points = conn.execute(SELECT_SERIES_ROLLUP, (name, "1d", start, end)).fetchall()
+    step = max(1, math.ceil(len(points) / max(max_points, 1)))
+    return points[::-step][::-1]
+
+def write_log(name: str, type: str, message: str):
+    """
+    Write a log entry to the logs table.
+    The entry is buffered and committed with other entries on the next flush of the log writer.
+
+    Args:
+        name (str): The name associated with the log
+        type (str): The type of log entry
+        message (str): The log message
+    """
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    log_writer.write((name.lower(), now, type, message))
+
+def flush_logs():
+    """Write any buffered log entries to the database now"""
+    log_writer.flush()
+
+def read_log(name: str, last_n=10):
+    """
+    Read the most recent log entries for a given name.
+
+    Args:
+        name (str): The name to retrieve logs for
+        last_n (int): Number of most recent entries to retrieve
+
+    Returns:
+        list: A list of tuples containing (datetime, type, message)
+    """
+    log_writer.flush()
+    with pool.connection() as conn:
+        rows = conn.execute(SELECT_LOGS, (name.lower(), last_n)).fetchall()
+        return reversed(rows)
+
+def read_logs_since(name: str, last_id: int, limit=100):
+    """
+    Read the log entries for a given name written after the entry with id last_id.
+    If there are more than limit, only the most recent limit entries are read.
+
+    Returns:
+        list: A list of tuples containing (id, datetime, type, message), oldest first
+    """
+    log_writer.flush()
+    with pool.connection() as conn:
+        rows = conn.execute(SELECT_LOGS_SINCE, (name.lower(), last_id, limit)).fetchall()
+        return rows[::-1]
+
+def latest_log_id(name: str) -> int:
+    """The id of the newest log entry for a given name, from memory, without querying the logs table"""
+    return log_feed.latest_id(name)
+
+def subscribe_logs(callback) -> None:
+    """Call callback(name, latest_id), on a background thread, as soon as new log entries exist for a name"""
+    log_feed.subscribe(callback)
+
+def write_span_metric(name: str | None, kind: str, label: str | None, duration_ms: float, error: bool = False) -> None:
+    """Record how long a traced span took; buffered and committed with the logs on the next flush"""
+    now = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+    row = (name.lower() if name else None, now, kind, label, duration_ms, int(error))
+    log_writer.write(row, INSERT_SPAN_METRIC)
+
+def read_span_latencies(
+    since: str | None = None, kind: str | None = None, name: str | None = None, buckets=SPAN_LATENCY_BUCKETS_MS
+) -> list[dict]:
+    """
+    Summarize span durations for each kind of span and label: the tool for function spans,
+    the model for generation spans, and the server for MCP spans.
+
+    Args:
+        since (str): Only include spans recorded at or after this UTC datetime
+        kind (str): Only include spans of this type, such as "function", "generation" or "mcp_tools"
+        name (str): Only include spans from this trader
+        buckets (list): Upper bounds in milliseconds of the histogram buckets
+
+    Returns:
+        list: One dict per (kind, label) with count, errors, mean/p50/p95/max in ms, and histogram counts
+    """
+    log_writer.flush()
+    name = name.lower() if name else None
+    with pool.connection() as conn:
+        rows = conn.execute(SELECT_SPAN_METRICS, (since or "", kind, kind, name, name)).fetchall()
+    groups = {}
+    for row_kind, label, duration, error in rows:
+        group = groups.setdefault((row_kind, label), {"durations": [], "errors": 0})
+        group["durations"].append(duration)
+        group["errors"] += error
+    summaries = []
+    for (row_kind, label), group in groups.items():
+        durations = group["durations"]
+        histogram = {f"<={bound}": 0 for bound in buckets}
+        histogram[f">{buckets[-1]}"] = 0
+        for duration in durations:
+            bound = next((bound for bound in buckets if duration <= bound), None)
+            histogram[f"<={bound}" if bound is not None else f">{buckets[-1]}"] += 1
+        summaries.append({
+            "kind": row_kind,
+            "label": label,
+            "count": len(durations),
+            "errors": group["errors"],
+            "mean_ms": sum(durations) / len(durations),
+            "p50_ms": durations[(len(durations) - 1) // 2],
+            "p95_ms": durations[math.ceil(0.95 * len(durations)) - 1],
+            "max_ms": durations[-1],
+            "histogram": histogram,
+        })
+    return summaries
+
+def write_market(date: str, data: dict) -> None:
+    with pool.transaction() as cursor:
+        cursor.executemany(UPSERT_MARKET_PRICE, [(date, ticker, close) for ticker, close in data.items()])
+
+def read_market(date: str) -> dict | None:
+    with pool.connection() as conn:
+        rows = conn.execute(SELECT_MARKET, (date,)).fetchall()
+        return dict(rows) if rows else None
+
+def has_market(date: str) -> bool:
+    with pool.connection() as conn:
+        return conn.execute(HAS_MARKET, (date,)).fetchone() is not None
+
+def read_market_prices(date: str, tickers: list[str]) -> dict[str, float]:
+    """Look up the close of each ticker on a date through the (date, ticker) primary key"""
+    with pool.connection() as conn:
+        return dict(conn.execute(SELECT_MARKET_PRICES, (date, json.dumps(tickers))).fetchall())
+
+def write_prices(prices: dict[str, float], fetched_at: float) -> None:
+    with pool.transaction() as cursor:
+        cursor.executemany(UPSERT_PRICE, [(symbol, price, fetched_at) for symbol, price in prices.items()])
+
+def read_prices(symbols: list[str]) -> dict[str, tuple[float, float]]:
+    """Read cached prices as a dict of symbol to (price, fetched_at epoch seconds)"""
+    with pool.connection() as conn:
+        rows = conn.execute(SELECT_PRICES, (json.dumps(symbols),)).fetchall()
+        return {symbol: (price, fetched_at) for symbol, price, fetched_at in rows}
+
+def read_tool_result(key: str) -> tuple[str, float] | None:
+    """A cached tool result as (result, fetched_at epoch seconds), marking it as just used for LRU eviction"""
+    with pool.connection() as conn:
+        row = conn.execute(SELECT_TOOL_RESULT, (key,)).fetchone()
+    if row:
+        with pool.transaction() as cursor:
+            cursor.execute(TOUCH_TOOL_RESULT, (time.time(), key))
+    return row
+
+def write_tool_result(key: str, tool: str, result: str, fetched_at: float, max_bytes: int) -> int:
+    """Cache a tool result, then evict the least recently used results until the cache is within max_bytes"""
+    evicted = 0
+    with pool.transaction() as cursor:
+        cursor.execute(UPSERT_TOOL_RESULT, (key, tool, result, len(result), fetched_at, fetched_at))
+        excess = cursor.execute(TOOL_CACHE_SIZE).fetchone()[0] - max_bytes
+        if excess > 0:
+            for old_key, size in cursor.execute(SELECT_TOOL_CACHE_LRU).fetchall():
+                if excess <= 0:
+                    break
+                cursor.execute(DELETE_TOOL_RESULT, (old_key,))
+                excess -= size
+                evicted += 1
+    return evicted
+
+def write_trader_run(
+    name: str, mode: str, started: str, ended: str, status: str, attempts: int, error: str | None = None
+) -> None:
+    """Record the outcome of one scheduled trader run"""
+    with pool.transaction() as cursor:
+        cursor.execute(INSERT_TRADER_RUN, (name.lower(), mode, started, ended, status, attempts, error))
+
+def read_trader_runs(name: str | None = None, last_n: int = 50) -> list[dict]:
+    """The most recent trader run outcomes, newest first, for one trader or all of them"""
+    name = name.lower() if name else None
+    with pool.connection() as conn:
+        rows = conn.execute(SELECT_TRADER_RUNS, (name, name, last_n)).fetchall()
+    columns = ["name", "mode", "started", "ended", "status", "attempts", "error"]
+    return [dict(zip(columns, row)) for row in rows]
@@ -3,7 +3,12 @@ from dotenv import load_dotenv
 import os
 from datetime import datetime
 import random
-from database import write_market, read_market
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable
+from database import write_market, has_market, read_market_prices, write_prices, read_prices
+from ratelimit import get_limiter
 from functools import lru_cache
 from datetime import timezone
 
@@ -15,45 +20,213 @@ polygon_plan = os.getenv("POLYGON_PLAN")
 is_paid_polygon = polygon_plan == "paid"
 is_realtime_polygon = polygon_plan == "realtime"
 
+# How long a looked up price stays fresh, in seconds, depending on how often the plan's prices change
+
+PRICE_CACHE_TTL_EOD = float(os.getenv("PRICE_CACHE_TTL_EOD", "3600"))
+PRICE_CACHE_TTL_DELAYED = float(os.getenv("PRICE_CACHE_TTL_DELAYED", "60"))
+PRICE_CACHE_TTL_REALTIME = float(os.getenv("PRICE_CACHE_TTL_REALTIME", "2"))
+
+if is_realtime_polygon:
+    price_cache_ttl = PRICE_CACHE_TTL_REALTIME
+elif is_paid_polygon:
+    price_cache_ttl = PRICE_CACHE_TTL_DELAYED
+else:
+    price_cache_ttl = PRICE_CACHE_TTL_EOD
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> RESTClient:
+    """Return the process-wide Polygon client, so its HTTP connection pool is reused between calls"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = RESTClient(polygon_api_key)
+    return _client
+
+
+def throttle_polygon() -> None:
+    """
+    Wait for this process's Polygon rate limit before making a request.
+    This blocks the calling thread, as do the Polygon requests themselves, so from a coroutine
+    call the price lookups in a worker thread with asyncio.to_thread
+    """
+    limiter = get_limiter("polygon")
+    if limiter:
+        limiter.acquire()
+
+
+class PriceCache:
+    """
+    Prices by symbol, kept in memory and in the prices table of the database for `ttl` seconds,
+    so that other processes (the accounts and market servers) share what was looked up.
+    Concurrent misses for the same symbol are coalesced: one caller fetches and the others wait for its result.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._prices: dict[str, tuple[float, float]] = {}
+        self._inflight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.fetches = 0
+        self.fetch_seconds = 0.0
+
+    def _is_fresh(self, fetched_at: float, now: float) -> bool:
+        return now - fetched_at < self.ttl
+
+    def _load(self, symbols: list[str], fetch: Callable[[list[str]], dict[str, float]]) -> dict[str, tuple[float, float]]:
+        now = time.time()
+        loaded = {
+            symbol: entry for symbol, entry in read_prices(symbols).items() if self._is_fresh(entry[1], now)
+        }
+        missing = [symbol for symbol in symbols if symbol not in loaded]
+        if missing:
+            start = time.perf_counter()
+            prices = fetch(missing)
+            elapsed = time.perf_counter() - start
+            fetched_at = time.time()
+            write_prices(prices, fetched_at)
+            loaded.update({symbol: (price, fetched_at) for symbol, price in prices.items()})
+            with self._lock:
+                self.fetches += 1
+                self.fetch_seconds += elapsed
+                self.misses += len(missing)
+        with self._lock:
+            self.disk_hits += len(symbols) - len(missing)
+        return loaded
+
+    def get_many(self, symbols: list[str], fetch: Callable[[list[str]], dict[str, float]]) -> dict[str, float]:
+        now = time.time()
+        result = {}
+        waiting = {}
+        to_load = []
+        with self._lock:
+            for symbol in symbols:
+                cached = self._prices.get(symbol)
+                if cached and self._is_fresh(cached[1], now):
+                    result[symbol] = cached[0]
+                    self.hits += 1
+                elif symbol in self._inflight:
+                    waiting[symbol] = self._inflight[symbol]
+                    self.coalesced += 1
+                else:
+                    self._inflight[symbol] = Future()
+                    to_load.append(symbol)
+        if to_load:
+            try:
+                loaded = self._load(to_load, fetch)
+            except BaseException as e:
+                with self._lock:
+                    for symbol in to_load:
+                        self._inflight.pop(symbol).set_exception(e)
+                raise
+            with self._lock:
+                self._prices.update(loaded)
+                for symbol in to_load:
+                    self._inflight.pop(symbol).set_result(loaded[symbol][0])
+            result.update({symbol: loaded[symbol][0] for symbol in to_load})
+        for symbol, future in waiting.items():
+            result[symbol] = future.result()
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses + self.coalesced
+            return {
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_rate": (lookups - self.misses) / lookups if lookups else 0.0,
+                "fetches": self.fetches,
+                "average_fetch_ms": 1000 * self.fetch_seconds / self.fetches if self.fetches else 0.0,
+            }
+
+
+price_cache = PriceCache(price_cache_ttl)
+
+# When replaying history, prices come from a replay source at the time of a simulated clock instead of Polygon
+
+_replay_prices: Callable[[list[str]], dict[str, float]] | None = None
+_replay_clock: Callable[[], datetime] | None = None
+
+
+def set_replay(prices: Callable[[list[str]], dict[str, float]] | None, clock: Callable[[], datetime] | None) -> None:
+    """Price every lookup with prices(symbols) and tell the time with clock(); pass None to go back to live data"""
+    global _replay_prices, _replay_clock
+    _replay_prices = prices
+    _replay_clock = clock
+
+
+def market_now() -> datetime:
+    """The current time of the market, which is the simulated time during a replay"""
+    return _replay_clock() if _replay_clock else datetime.now()
+
 
 def is_market_open() -> bool:
-    client = RESTClient(polygon_api_key)
+    if _replay_prices:
+        return True
+    client = get_client()
+    throttle_polygon()
     market_status = client.get_market_status()
     return market_status.market == "open"
 
 
 def get_all_share_prices_polygon_eod() -> dict[str, float]:
     """With much thanks to student Reema R. for fixing the timezone issue with this!"""
-    client = RESTClient(polygon_api_key)
+    client = get_client()
 
+    throttle_polygon()
     probe = client.get_previous_close_agg("SPY")[0]
     last_close = datetime.fromtimestamp(probe.timestamp / 1000, tz=timezone.utc).date()
 
+    throttle_polygon()
     results = client.get_grouped_daily_aggs(last_close, adjusted=True, include_otc=False)
     return {result.ticker: result.close for result in results}
 
 
 @lru_cache(maxsize=2)
-def get_market_for_prior_date(today):
-    market_data = read_market(today)
-    if not market_data:
-        market_data = get_all_share_prices_polygon_eod()
-        write_market(today, market_data)
-    return market_data
+def ensure_market_for_prior_date(today) -> str:
+    """Make sure the prior close for every ticker is stored for today, fetching it once if not"""
+    if not has_market(today):
+        write_market(today, get_all_share_prices_polygon_eod())
+    return today
 
 
 def get_share_price_polygon_eod(symbol) -> float:
-    today = datetime.now().date().strftime("%Y-%m-%d")
-    market_data = get_market_for_prior_date(today)
-    return market_data.get(symbol, 0.0)
+    return get_share_prices_polygon_eod([symbol])[symbol]
+
+
+def get_share_prices_polygon_eod(symbols: list[str]) -> dict[str, float]:
+    today = ensure_market_for_prior_date(datetime.now().date().strftime("%Y-%m-%d"))
+    prices = read_market_prices(today, symbols)
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
 
 
 def get_share_price_polygon_min(symbol) -> float:
-    client = RESTClient(polygon_api_key)
+    client = get_client()
+    throttle_polygon()
     result = client.get_snapshot_ticker("stocks", symbol)
     return result.min.close or result.prev_day.close
 
 
+def get_share_prices_polygon_min(symbols: list[str]) -> dict[str, float]:
+    """Price every symbol from a single multi-ticker snapshot request"""
+    client = get_client()
+    throttle_polygon()
+    results = client.get_snapshot_all("stocks", tickers=symbols)
+    prices = {result.ticker: result.min.close or result.prev_day.close for result in results}
+    return {symbol: prices.get(symbol, 0.0) for symbol in symbols}
+
+
 def get_share_price_polygon(symbol) -> float:
     if is_paid_polygon:
         return get_share_price_polygon_min(symbol)
@@ -61,10 +234,47 @@ def get_share_price_polygon(symbol) -> float:
         return get_share_price_polygon_eod(symbol)
 
 
+def get_share_prices_polygon(symbols: list[str]) -> dict[str, float]:
+    if is_paid_polygon:
+        return get_share_prices_polygon_min(symbols)
+    else:
+        return get_share_prices_polygon_eod(symbols)
+
+
 def get_share_price(symbol) -> float:
+    if _replay_prices:
+        return _replay_prices([symbol])[symbol]
     if polygon_api_key:
         try:
-            return get_share_price_polygon(symbol)
+            return price_cache.get_many([symbol], get_share_prices_polygon)[symbol]
         except Exception as e:
             print(f"Was not able to use the polygon API due to {e}; using a random number")
     return float(random.randint(1, 100))
+
+
+def get_share_prices(symbols: list[str]) -> dict[str, float]:
+    """Price several symbols with one lookup rather than one lookup per symbol"""
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return {}
+    if _replay_prices:
+        return _replay_prices(symbols)
+    if polygon_api_key:
+        try:
+            return price_cache.get_many(symbols, get_share_prices_polygon)
+        except Exception as e:
+            print(f"Was not able to use the polygon API due to {e}; using random numbers")
+    return {symbol: float(random.randint(1, 100)) for symbol in symbols}
+
+
+def get_price_cache_stats() -> dict:
+    """Hit, miss and fetch latency counters for this process's price cache"""
+    return price_cache.stats()
+
+
+# Server processes started by a replay pick up its prices and clock from the environment
+
+if os.getenv("REPLAY_PRICES_FILE"):
+    from replay import install_replay_from_env
+
+    install_replay_from_env()
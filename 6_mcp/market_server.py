@@ -1,8 +1,12 @@
 from mcp.server.fastmcp import FastMCP
-from market import get_share_price
+from market import get_share_price, get_share_prices, get_price_cache_stats
+import asyncio
+import json
 
 mcp = FastMCP("market_server")
 
+# Price lookups block on the Polygon rate limit and requests, so they run in a worker thread, off the event loop
+
 @mcp.tool()
 async def lookup_share_price(symbol: str) -> float:
     """This tool provides the current price of the given stock symbol.
@@ -10,7 +14,21 @@ async def lookup_share_price(symbol: str) -> float:
     Args:
         symbol: the symbol of the stock
     """
-    return get_share_price(symbol)
+    return await asyncio.to_thread(get_share_price, symbol)
+
+@mcp.tool()
+async def lookup_share_prices(symbols: list[str]) -> dict[str, float]:
+    """This tool provides the current prices of several stock symbols in one lookup.
+    Prefer it to calling lookup_share_price repeatedly.
+
+    Args:
+        symbols: the symbols of the stocks
+    """
+    return await asyncio.to_thread(get_share_prices, symbols)
+
+@mcp.resource("market://cache_stats")
+async def read_cache_stats_resource() -> str:
+    return json.dumps(get_price_cache_stats())
 
 if __name__ == "__main__":
     mcp.run(transport='stdio')
\ No newline at end of file
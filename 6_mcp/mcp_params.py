@@ -27,20 +27,59 @@ trader_mcp_server_params = [
     market_mcp,
 ]
 
+# The MCP servers for the researcher that hold no per-trader state: Fetch and Brave Search
+
+researcher_shared_mcp_server_params = [
+    {"command": "uvx", "args": ["mcp-server-fetch"]},
+    {
+        "command": "npx",
+        "args": ["-y", "@modelcontextprotocol/server-brave-search"],
+        "env": brave_env,
+    },
+]
+
+# The researcher's Memory, kept separately for each trader in its own namespace of memory/memory.db:
+# a stdio server for a single trader, or one shared process over SSE with a URL for each trader
+
+memory_server_port = int(os.getenv("MEMORY_SERVER_PORT", "8765"))
+memory_server_url = f"http://127.0.0.1:{memory_server_port}"
+
+memory_server_process_params = {
+    "command": "uv",
+    "args": ["run", "memory_server.py", "--port", str(memory_server_port)],
+}
+
+
+def memory_mcp_server_params(name: str):
+    return {"command": "uv", "args": ["run", "memory_server.py", "--namespace", name]}
+
+
+def shared_memory_mcp_server_params(name: str):
+    return {"url": f"{memory_server_url}/{name}/sse"}
+
+
 # The full set of MCP servers for the researcher: Fetch, Brave Search and Memory
 
 
 def researcher_mcp_server_params(name: str):
-    return [
-        {"command": "uvx", "args": ["mcp-server-fetch"]},
-        {
-            "command": "npx",
-            "args": ["-y", "@modelcontextprotocol/server-brave-search"],
-            "env": brave_env,
-        },
-        {
-            "command": "npx",
-            "args": ["-y", "mcp-memory-libsql"],
-            "env": {"LIBSQL_URL": f"file:./memory/{name}.db"},
-        },
-    ]
+    return researcher_shared_mcp_server_params + [memory_mcp_server_params(name)]
+
+
+# The rate limit that tool calls to a server count against, for servers that call a rate limited API
+
+
+def rate_limit_name(params) -> str | None:
+    args = " ".join(params.get("args", []))
+    if "server-brave-search" in args:
+        return "brave"
+    if "mcp_polygon" in args:
+        return "polygon"
+    return None
+
+
+# Whether a server's tool results are cached and shared between traders: the researcher's web fetch and search
+
+
+def is_research_server(params) -> bool:
+    args = " ".join(params.get("args", []))
+    return "mcp-server-fetch" in args or "server-brave-search" in args
@@ -0,0 +1,263 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+MEMORY_DB = os.getenv("MEMORY_DB", "memory/memory.db")
+MEMORY_SEARCH_LIMIT = int(os.getenv("MEMORY_SEARCH_LIMIT", "20"))
+MEMORY_GRAPH_LIMIT = int(os.getenv("MEMORY_GRAPH_LIMIT", "50"))
+
+NAMESPACE = re.compile(r"^[\w-]{1,64}$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    namespace TEXT NOT NULL,
+    name TEXT NOT NULL,
+    entity_type TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (namespace, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entities_updated ON entities (namespace, updated_at);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    namespace TEXT NOT NULL,
+    entity TEXT NOT NULL,
+    content TEXT NOT NULL,
+    UNIQUE (namespace, entity, content)
+);
+CREATE TABLE IF NOT EXISTS relations (
+    namespace TEXT NOT NULL,
+    source TEXT NOT NULL,
+    target TEXT NOT NULL,
+    relation_type TEXT NOT NULL,
+    PRIMARY KEY (namespace, source, relation_type, target)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_relations_target ON relations (namespace, target);
+CREATE VIRTUAL TABLE IF NOT EXISTS observations_fts USING fts5(
+    content, content='observations', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS observations_insert AFTER INSERT ON observations BEGIN
+    INSERT INTO observations_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS observations_delete AFTER DELETE ON observations BEGIN
+    INSERT INTO observations_fts (observations_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+CREATE TABLE IF NOT EXISTS imported (
+    namespace TEXT PRIMARY KEY
+);
+"""
+
+SELECT_ENTITIES = """
+    SELECT name, entity_type FROM entities WHERE namespace = ? AND name IN ({names})
+"""
+
+SELECT_OBSERVATIONS = """
+    SELECT entity, content FROM observations WHERE namespace = ? AND entity IN ({names}) ORDER BY id
+"""
+
+SELECT_RELATIONS = """
+    SELECT source, target, relation_type FROM relations WHERE namespace = ? AND source IN ({names})
+    UNION
+    SELECT source, target, relation_type FROM relations WHERE namespace = ? AND target IN ({names})
+"""
+
+SEARCH_OBSERVATIONS = """
+    SELECT observations.entity FROM observations_fts
+    JOIN observations ON observations.id = observations_fts.rowid
+    WHERE observations_fts MATCH ? AND observations.namespace = ?
+    ORDER BY observations_fts.rank
+    LIMIT ?
+"""
+
+SEARCH_ENTITIES = """
+    SELECT name FROM entities
+    WHERE namespace = ? AND (name LIKE ? ESCAPE '\\' OR entity_type LIKE ? ESCAPE '\\')
+    ORDER BY updated_at DESC
+    LIMIT ?
+"""
+
+
+def search_expression(query: str) -> str | None:
+    """An FTS5 expression matching any word of a free-text query, each as a prefix, safe from FTS5 syntax errors"""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    return " OR ".join(f'"{word}"*' for word in words)
+
+
+def like_pattern(query: str) -> str:
+    escaped = query.strip().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+class KnowledgeGraph:
+    """
+    Entities, their observations and the relations between them, for any number of traders in one SQLite file.
+    Every call is scoped to a namespace, one per trader. Observations are indexed with FTS5 for search,
+    and relations are indexed by source and by target, so recall is an indexed query rather than a scan.
+    """
+
+    def __init__(self, path: str = MEMORY_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.namespaces = set()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    def _check(self, namespace: str) -> None:
+        if not NAMESPACE.match(namespace):
+            raise ValueError(f"Invalid memory namespace {namespace!r}")
+        if namespace in self.namespaces:
+            return
+        with self.lock:
+            imported = self.connection.execute("SELECT 1 FROM imported WHERE namespace = ?", (namespace,)).fetchone()
+        # The namespace only counts as imported once the import has worked, so a failed one is tried again next time;
+        # importing twice does no harm, as entities, observations and relations are only ever added once
+        if not imported and not self.import_libsql(namespace, os.path.join(os.path.dirname(self.path), f"{namespace}.db")):
+            return
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO imported (namespace) VALUES (?)", (namespace,))
+        self.namespaces.add(namespace)
+
+    def import_libsql(self, namespace: str, path: str) -> bool:
+        """
+        Bring in a trader's graph from the per-trader databases written by mcp-memory-libsql, the first time.
+        Return whether there is nothing left to import.
+        """
+        if not os.path.exists(path):
+            return True
+        try:
+            source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+            entities = source.execute("SELECT name, entity_type FROM entities").fetchall()
+            observations = source.execute("SELECT entity_name, content FROM observations ORDER BY id").fetchall()
+            relations = source.execute("SELECT source, target, relation_type FROM relations").fetchall()
+            source.close()
+        except sqlite3.Error as e:
+            print(f"Was not able to import memory for {namespace} from {path}: {e}")
+            return False
+        grouped = {name: {"name": name, "entityType": entity_type, "observations": []} for name, entity_type in entities}
+        for entity, content in observations:
+            if entity in grouped:
+                grouped[entity]["observations"].append(content)
+        self._create_entities(namespace, list(grouped.values()))
+        self._create_relations(
+            namespace, [{"source": s, "target": t, "type": relation_type} for s, t, relation_type in relations]
+        )
+        return True
+
+    def create_entities(self, namespace: str, entities: list[dict]) -> int:
+        """Create or update entities, adding any new observations to existing ones"""
+        self._check(namespace)
+        return self._create_entities(namespace, entities)
+
+    def _create_entities(self, namespace: str, entities: list[dict]) -> int:
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self.lock, self.connection:
+            for entity in entities:
+                self.connection.execute(
+                    """
+                    INSERT INTO entities (namespace, name, entity_type, updated_at) VALUES (?, ?, ?, ?)
+                    ON CONFLICT (namespace, name) DO UPDATE SET
+                        entity_type = excluded.entity_type, updated_at = excluded.updated_at
+                    """,
+                    (namespace, entity["name"], entity["entityType"], now),
+                )
+                self.connection.executemany(
+                    "INSERT OR IGNORE INTO observations (namespace, entity, content) VALUES (?, ?, ?)",
+                    [(namespace, entity["name"], content) for content in entity.get("observations", [])],
+                )
+        return len(entities)
+
+    def create_relations(self, namespace: str, relations: list[dict]) -> int:
+        self._check(namespace)
+        return self._create_relations(namespace, relations)
+
+    def _create_relations(self, namespace: str, relations: list[dict]) -> int:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                """
+                INSERT OR IGNORE INTO relations (namespace, source, target, relation_type) VALUES (?, ?, ?, ?)
+                """,
+                [(namespace, relation["source"], relation["target"], relation["type"]) for relation in relations],
+            )
+        return len(relations)
+
+    def delete_entity(self, namespace: str, name: str) -> bool:
+        """Delete an entity with its observations and every relation to or from it"""
+        self._check(namespace)
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM entities WHERE namespace = ? AND name = ?", (namespace, name)
+            )
+            self.connection.execute("DELETE FROM observations WHERE namespace = ? AND entity = ?", (namespace, name))
+            self.connection.execute(
+                "DELETE FROM relations WHERE namespace = ? AND (source = ? OR target = ?)", (namespace, name, name)
+            )
+        return cursor.rowcount > 0
+
+    def delete_relation(self, namespace: str, source: str, target: str, relation_type: str) -> bool:
+        self._check(namespace)
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                """
+                DELETE FROM relations WHERE namespace = ? AND source = ? AND target = ? AND relation_type = ?
+                """,
+                (namespace, source, target, relation_type),
+            )
+        return cursor.rowcount > 0
+
+    def open_nodes(self, namespace: str, names: list[str]) -> dict:
+        """The named entities with their observations, and every relation touching them"""
+        self._check(namespace)
+        names = list(dict.fromkeys(names))
+        if not names:
+            return {"entities": [], "relations": []}
+        placeholders = ",".join("?" * len(names))
+        with self.lock:
+            entities = self.connection.execute(
+                SELECT_ENTITIES.format(names=placeholders), (namespace, *names)
+            ).fetchall()
+            observations = self.connection.execute(
+                SELECT_OBSERVATIONS.format(names=placeholders), (namespace, *names)
+            ).fetchall()
+            relations = self.connection.execute(
+                SELECT_RELATIONS.format(names=placeholders), (namespace, *names, namespace, *names)
+            ).fetchall()
+        found = {name: {"name": name, "entityType": entity_type, "observations": []} for name, entity_type in entities}
+        for entity, content in observations:
+            if entity in found:
+                found[entity]["observations"].append(content)
+        return {
+            "entities": [found[name] for name in names if name in found],
+            "relations": [{"source": s, "target": t, "type": relation_type} for s, t, relation_type in relations],
+        }
+
+    def search_nodes(self, namespace: str, query: str, limit: int = MEMORY_SEARCH_LIMIT) -> dict:
+        """Entities whose observations match the query's words, best matches first, then any whose name or type does"""
+        self._check(namespace)
+        names = []
+        expression = search_expression(query)
+        with self.lock:
+            if expression:
+                names += [row[0] for row in self.connection.execute(SEARCH_OBSERVATIONS, (expression, namespace, limit * 4))]
+            pattern = like_pattern(query)
+            names += [row[0] for row in self.connection.execute(SEARCH_ENTITIES, (namespace, pattern, pattern, limit))]
+        return self.open_nodes(namespace, list(dict.fromkeys(names))[:limit])
+
+    def read_graph(self, namespace: str, limit: int = MEMORY_GRAPH_LIMIT) -> dict:
+        """The most recently updated entities and the relations between them and anything else"""
+        self._check(namespace)
+        with self.lock:
+            names = [
+                row[0]
+                for row in self.connection.execute(
+                    "SELECT name FROM entities WHERE namespace = ? ORDER BY updated_at DESC LIMIT ?", (namespace, limit)
+                )
+            ]
+        return self.open_nodes(namespace, names)
@@ -0,0 +1,142 @@
+import argparse
+import os
+from contextvars import ContextVar
+from pydantic import BaseModel, Field
+from mcp.server.fastmcp import FastMCP
+from memory_graph import KnowledgeGraph
+
+MEMORY_SERVER_HOST = os.getenv("MEMORY_SERVER_HOST", "127.0.0.1")
+MEMORY_SERVER_PORT = int(os.getenv("MEMORY_SERVER_PORT", "8765"))
+
+mcp = FastMCP("memory_server")
+graph = KnowledgeGraph()
+
+# The trader whose graph the current session reads and writes: fixed with --namespace over stdio,
+# or taken from the /{namespace}/sse path when one process serves every trader over SSE
+
+namespace: ContextVar[str] = ContextVar("namespace", default="default")
+
+
+class Entity(BaseModel):
+    name: str = Field(description="The unique name of the entity")
+    entityType: str = Field(description="The type of the entity, such as company, person or market")
+    observations: list[str] = Field(default=[], description="Facts about the entity")
+
+
+class Relation(BaseModel):
+    source: str = Field(description="The name of the entity the relation starts from")
+    target: str = Field(description="The name of the entity the relation points to")
+    type: str = Field(description="The type of the relation, in active voice, such as competes_with")
+
+
+@mcp.tool()
+def create_entities(entities: list[Entity]) -> str:
+    """Create new entities in the knowledge graph, or add observations to existing ones.
+
+    Args:
+        entities: the entities with their types and observations
+    """
+    count = graph.create_entities(namespace.get(), [entity.model_dump() for entity in entities])
+    return f"Created or updated {count} entities"
+
+
+@mcp.tool()
+def search_nodes(query: str) -> dict:
+    """Search the knowledge graph for entities whose observations, names or types match the query.
+
+    Args:
+        query: words to search for
+    """
+    return graph.search_nodes(namespace.get(), query)
+
+
+@mcp.tool()
+def open_nodes(names: list[str]) -> dict:
+    """Retrieve specific entities by name, with their observations and relations.
+
+    Args:
+        names: the names of the entities
+    """
+    return graph.open_nodes(namespace.get(), names)
+
+
+@mcp.tool()
+def read_graph() -> dict:
+    """Read the most recently updated entities in the knowledge graph, with their relations."""
+    return graph.read_graph(namespace.get())
+
+
+@mcp.tool()
+def create_relations(relations: list[Relation]) -> str:
+    """Create relations between entities in the knowledge graph.
+
+    Args:
+        relations: the relations to create
+    """
+    count = graph.create_relations(namespace.get(), [relation.model_dump() for relation in relations])
+    return f"Created {count} relations"
+
+
+@mcp.tool()
+def delete_entity(name: str) -> str:
+    """Delete an entity, with its observations and relations, from the knowledge graph.
+
+    Args:
+        name: the name of the entity
+    """
+    deleted = graph.delete_entity(namespace.get(), name)
+    return f"Deleted entity {name}" if deleted else f"No entity named {name}"
+
+
+@mcp.tool()
+def delete_relation(source: str, target: str, type: str) -> str:
+    """Delete a relation from the knowledge graph.
+
+    Args:
+        source: the name of the entity the relation starts from
+        target: the name of the entity the relation points to
+        type: the type of the relation
+    """
+    deleted = graph.delete_relation(namespace.get(), source, target, type)
+    return "Deleted relation" if deleted else "No such relation"
+
+
+def sse_app():
+    """
+    One Starlette app serving every trader: a client connects to /{namespace}/sse, and the namespace is set
+    for the session's task, which every request on that session is handled within.
+    """
+    from mcp.server.sse import SseServerTransport
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.routing import Mount, Route
+
+    transport = SseServerTransport("/messages/")
+    server = mcp._mcp_server
+
+    async def handle_sse(request):
+        namespace.set(request.path_params["namespace"])
+        async with transport.connect_sse(request.scope, request.receive, request._send) as (read, write):
+            await server.run(read, write, server.create_initialization_options())
+        return Response()
+
+    return Starlette(
+        routes=[
+            Route("/{namespace}/sse", endpoint=handle_sse),
+            Mount("/messages/", app=transport.handle_post_message),
+        ]
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Knowledge graph memory for the traders")
+    parser.add_argument("--namespace", help="Serve this one trader's graph over stdio")
+    parser.add_argument("--port", type=int, default=MEMORY_SERVER_PORT, help="Otherwise serve every trader over SSE")
+    args = parser.parse_args()
+    if args.namespace:
+        namespace.set(args.namespace)
+        mcp.run(transport="stdio")
+    else:
+        import uvicorn
+
+        uvicorn.run(sse_app(), host=MEMORY_SERVER_HOST, port=args.port, log_level="warning")
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+# Requests per minute allowed to each model provider and external API, shared by every trader in the process
+# Set a limit to 0 to turn it off; the burst is how many requests may go out at once after an idle period
+
+RATE_LIMIT_DEFAULTS = {
+    "openai": 500,
+    "deepseek": 60,
+    "gemini": 15,
+    "grok": 60,
+    "openrouter": 20,
+    "brave": 60,
+}
+
+# Polygon's free plan allows 5 calls a minute; the paid plans are unmetered, but Polygon asks to stay under 100 a second
+
+POLYGON_PLAN_RATE_LIMITS = {"paid": 6000, "realtime": 6000}
+RATE_LIMIT_DEFAULTS["polygon"] = POLYGON_PLAN_RATE_LIMITS.get(os.getenv("POLYGON_PLAN"), 5)
+RATE_LIMIT_BURST = int(os.getenv("RATE_LIMIT_BURST", "2"))
+
+
+class TokenBucket:
+    """
+    A token bucket refilled at rate_per_minute, holding up to burst tokens.
+    Callers reserve a token and then wait until it is due, so waiters are served in order
+    without polling; the same bucket can be used from threads (acquire) or from asyncio tasks (wait).
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int = RATE_LIMIT_BURST):
+        self.rate = rate_per_minute / 60
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.waited_seconds = 0.0
+
+    def _reserve(self) -> float:
+        """Take a token, possibly on credit, and return how long to wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            self.requests += 1
+            self.waited_seconds += delay
+            return delay
+
+    def acquire(self) -> None:
+        """Wait for a token by blocking the calling thread; from a coroutine, await wait() instead"""
+        delay = self._reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def wait(self) -> None:
+        delay = self._reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate_per_minute": self.rate * 60,
+                "requests": self.requests,
+                "average_wait_seconds": self.waited_seconds / self.requests if self.requests else 0.0,
+            }
+
+
+_limiters: dict[str, TokenBucket | None] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name: str) -> TokenBucket | None:
+    """The process-wide bucket for a provider or API, or None if it is not rate limited"""
+    with _limiters_lock:
+        if name not in _limiters:
+            rate = float(os.getenv(f"RATE_LIMIT_{name.upper()}_PER_MINUTE", RATE_LIMIT_DEFAULTS.get(name, 0)))
+            _limiters[name] = TokenBucket(rate) if rate > 0 else None
+        return _limiters[name]
+
+
+def get_rate_limit_stats() -> dict:
+    with _limiters_lock:
+        return {name: limiter.stats() for name, limiter in _limiters.items() if limiter}
@@ -0,0 +1,112 @@
+"""
+Historical prices and a simulated clock that market.py can be pointed at, in place of Polygon and the real time.
+See backtest.py for running the traders against them.
+"""
+
+import bisect
+import csv
+import os
+from datetime import datetime
+import market
+
+TIMESTAMP_COLUMNS = ["timestamp", "datetime", "date", "time"]
+SYMBOL_COLUMNS = ["symbol", "ticker"]
+CLOSE_COLUMNS = ["close", "price"]
+
+
+def _column(columns, candidates: list[str]) -> str:
+    lowered = {column.lower(): column for column in columns}
+    for candidate in candidates:
+        if candidate in lowered:
+            return lowered[candidate]
+    raise ValueError(f"Price file needs one of the columns {candidates}, found {list(columns)}")
+
+
+def _timestamp(value) -> str:
+    """Normalize a date or datetime to the format used throughout the database"""
+    return datetime.fromisoformat(str(value).replace("T", " ").rstrip("Z")).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class PriceReplay:
+    """
+    Historical closes by symbol, looked up as of a point in time: the price of a symbol at t
+    is its last close at or before t, or 0.0 (an unrecognized symbol) if it has no bar yet.
+    """
+
+    def __init__(self, rows):
+        bars = {}
+        for timestamp, symbol, close in rows:
+            bars.setdefault(symbol, []).append((timestamp, close))
+        self.series = {}
+        times = set()
+        for symbol, points in bars.items():
+            points.sort()
+            self.series[symbol] = ([t for t, _ in points], [close for _, close in points])
+            times.update(t for t, _ in points)
+        self.times = sorted(times)
+        self.symbols = sorted(self.series)
+
+    @classmethod
+    def load(cls, path: str) -> "PriceReplay":
+        if path.endswith(".parquet"):
+            try:
+                import pandas as pd
+            except ImportError:
+                raise ValueError("Reading Parquet price files needs pandas; convert the file to CSV or install pandas")
+            frame = pd.read_parquet(path)
+            columns = [_column(frame.columns, names) for names in (TIMESTAMP_COLUMNS, SYMBOL_COLUMNS, CLOSE_COLUMNS)]
+            records = frame[columns].itertuples(index=False)
+        else:
+            with open(path, newline="") as f:
+                reader = csv.DictReader(f)
+                columns = [_column(reader.fieldnames, names) for names in (TIMESTAMP_COLUMNS, SYMBOL_COLUMNS, CLOSE_COLUMNS)]
+                records = [tuple(row[column] for column in columns) for row in reader]
+        return cls((_timestamp(t), str(symbol).upper(), float(close)) for t, symbol, close in records)
+
+    def prices_at(self, timestamp: str, symbols: list[str]) -> dict[str, float]:
+        prices = {}
+        for symbol in symbols:
+            times, closes = self.series.get(symbol, ([], []))
+            index = bisect.bisect_right(times, timestamp)
+            prices[symbol] = closes[index - 1] if index else 0.0
+        return prices
+
+
+class ReplayClock:
+    """
+    The simulated time of a replay. With a path, the time is also written to that file,
+    so that MCP server processes started by the replay can follow it; they re-read it only when it changes.
+    """
+
+    def __init__(self, path: str | None = None, timestamp: str | None = None):
+        self.path = path
+        self.timestamp = timestamp
+        self._version = None
+
+    def set(self, timestamp: str) -> None:
+        self.timestamp = timestamp
+        if self.path:
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w") as f:
+                f.write(timestamp)
+            os.replace(temporary, self.path)
+
+    def now(self) -> datetime:
+        if self.path:
+            stat = os.stat(self.path)
+            version = (stat.st_ino, stat.st_mtime_ns)
+            if version != self._version:
+                with open(self.path) as f:
+                    self.timestamp = f.read().strip()
+                self._version = version
+        return datetime.fromisoformat(self.timestamp)
+
+
+def install_replay(replay: PriceReplay, clock: ReplayClock) -> None:
+    """Point market.py at the replay's prices and clock"""
+    market.set_replay(lambda symbols: replay.prices_at(clock.now().strftime("%Y-%m-%d %H:%M:%S"), symbols), clock.now)
+
+
+def install_replay_from_env() -> None:
+    """Called by market.py in server processes that a replay started with REPLAY_PRICES_FILE and REPLAY_CLOCK_FILE"""
+    install_replay(PriceReplay.load(os.environ["REPLAY_PRICES_FILE"]), ReplayClock(os.environ["REPLAY_CLOCK_FILE"]))
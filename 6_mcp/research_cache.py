@@ -0,0 +1,145 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from dotenv import load_dotenv
+from mcp.types import CallToolResult
+from database import read_tool_result, write_tool_result
+
+load_dotenv(override=True)
+
+RESEARCH_CACHE_TTL_SECONDS = float(os.getenv("RESEARCH_CACHE_TTL_SECONDS", "1800"))
+RESEARCH_CACHE_MAX_RESULT_BYTES = int(os.getenv("RESEARCH_CACHE_MAX_RESULT_BYTES", str(512 * 1024)))
+RESEARCH_CACHE_MAX_BYTES = int(os.getenv("RESEARCH_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+TRACKING_PARAMETERS = re.compile(r"^(utm_\w+|fbclid|gclid|mc_cid|mc_eid)$", re.IGNORECASE)
+
+
+def normalize_url(url: str) -> str:
+    """The same page whatever the case of its host, its fragment or its tracking parameters"""
+    parts = urlsplit(url.strip())
+    query = sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True) if not TRACKING_PARAMETERS.match(k))
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, urlencode(query), ""))
+
+
+def normalize(key: str, value):
+    if isinstance(value, str):
+        if key == "url":
+            return normalize_url(value)
+        if key in ("query", "q"):
+            return " ".join(value.lower().split())
+        return value.strip()
+    if isinstance(value, dict):
+        return {k: normalize(k, v) for k, v in value.items() if v is not None}
+    if isinstance(value, list):
+        return [normalize(key, v) for v in value]
+    return value
+
+
+def cache_key(tool: str, arguments: dict | None) -> str:
+    """A key for a tool call on its tool name and its arguments, normalized so that equivalent calls share it"""
+    payload = json.dumps([tool, normalize("", arguments or {})], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LeaderCancelled(Exception):
+    """Passed to the callers waiting on a coalesced call when the caller making it is cancelled"""
+
+
+class ToolResultCache:
+    """
+    Results of research tool calls, kept in the tool_cache table of the database for `ttl` seconds
+    and evicted least recently used first once they exceed `max_bytes`.
+    Concurrent calls with the same key are coalesced: one caller makes the call and the others wait for its result.
+    If that caller is cancelled, the waiters are not: one of them makes the call instead.
+    Errors and results larger than `max_result_bytes` are passed through without being cached.
+    """
+
+    def __init__(self, ttl: float, max_result_bytes: int, max_bytes: int):
+        self.ttl = ttl
+        self.max_result_bytes = max_result_bytes
+        self.max_bytes = max_bytes
+        self._inflight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.uncached = 0
+        self.evictions = 0
+        self.call_seconds = 0.0
+
+    def _read(self, key: str) -> CallToolResult | None:
+        cached = read_tool_result(key)
+        if cached and time.time() - cached[1] < self.ttl:
+            return CallToolResult.model_validate_json(cached[0])
+        return None
+
+    def _write(self, key: str, tool: str, result: CallToolResult) -> None:
+        serialized = result.model_dump_json()
+        if result.isError or len(serialized) > self.max_result_bytes:
+            self.uncached += 1
+            return
+        self.evictions += write_tool_result(key, tool, serialized, time.time(), self.max_bytes)
+
+    async def call(self, tool: str, arguments: dict | None, call) -> CallToolResult:
+        """The cached result for this call if fresh, or the result of awaiting call() otherwise"""
+        key = cache_key(tool, arguments)
+        if key in self._inflight:
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(self._inflight[key])
+            except LeaderCancelled:
+                self.coalesced -= 1
+                return await self.call(tool, arguments, call)
+        cached = self._read(key)
+        if cached:
+            self.hits += 1
+            return cached
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        self.misses += 1
+        start = time.perf_counter()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.set_exception(LeaderCancelled())
+            future.exception()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            try:
+                self._write(key, tool, result)
+            except Exception as e:
+                print(f"Was not able to cache the result of {tool}: {e}")
+            return result
+        finally:
+            self.call_seconds += time.perf_counter() - start
+            self._inflight.pop(key, None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            "uncached": self.uncached,
+            "evictions": self.evictions,
+            "average_call_ms": 1000 * self.call_seconds / self.misses if self.misses else 0.0,
+        }
+
+
+research_cache = ToolResultCache(RESEARCH_CACHE_TTL_SECONDS, RESEARCH_CACHE_MAX_RESULT_BYTES, RESEARCH_CACHE_MAX_BYTES)
+
+
+def get_research_cache_stats() -> dict:
+    """Hit, miss and eviction counters for this process's research tool cache"""
+    return research_cache.stats()
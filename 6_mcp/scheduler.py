@@ -0,0 +1,85 @@
+import asyncio
+import os
+import random
+from datetime import datetime
+from dotenv import load_dotenv
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+from database import write_trader_run, write_log, latest_account_event_id
+from server_pool import MCPServerPool
+
+load_dotenv(override=True)
+
+MAX_CONCURRENT_TRADERS = int(os.getenv("MAX_CONCURRENT_TRADERS", "4"))
+START_JITTER_SECONDS = float(os.getenv("START_JITTER_SECONDS", "30"))
+MAX_RUN_ATTEMPTS = int(os.getenv("MAX_RUN_ATTEMPTS", "3"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("RETRY_BACKOFF_SECONDS", "20"))
+
+# Errors worth retrying the whole run for: the provider was overloaded or unreachable, not the request wrong.
+# A run is only retried if it changed nothing in the account, so that a retry can't repeat a trade
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class TraderScheduler:
+    """
+    Runs one cycle of traders at a time without letting them all start at once.
+    Each trader starts after a random offset within the jitter window, at most max_concurrent run together,
+    and a run that fails with a transient provider error before trading is retried with exponential backoff,
+    waiting without holding a slot so other traders can run meanwhile.
+    The outcome of every run is written to the trader_runs table.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = MAX_CONCURRENT_TRADERS,
+        jitter: float = START_JITTER_SECONDS,
+        max_attempts: int = MAX_RUN_ATTEMPTS,
+        backoff: float = RETRY_BACKOFF_SECONDS,
+    ):
+        self.semaphore = asyncio.Semaphore(max(max_concurrent, 1))
+        self.jitter = jitter
+        self.max_attempts = max(max_attempts, 1)
+        self.backoff = backoff
+
+    def delay_before_retry(self, attempt: int) -> float:
+        return self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+
+    async def run_trader(self, trader, pool: MCPServerPool | None = None) -> str:
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        mode = "trading" if trader.do_trade else "rebalancing"
+        started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        status, error, attempt = "failed", None, 0
+        while attempt < self.max_attempts:
+            attempt += 1
+            retry = False
+            async with self.semaphore:
+                last_event = latest_account_event_id(trader.name)
+                try:
+                    await trader.run_with_trace(pool)
+                    status, error = "succeeded", None
+                except RETRYABLE_ERRORS as e:
+                    error = f"{type(e).__name__}: {e}"
+                    if latest_account_event_id(trader.name) != last_event:
+                        write_log(trader.name, "trace", f"Not retrying after {type(e).__name__}: the account already changed")
+                    else:
+                        retry = attempt < self.max_attempts
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                    print(f"Error running trader {trader.name}: {e}")
+            if not retry:
+                break
+            delay = self.delay_before_retry(attempt)
+            write_log(trader.name, "trace", f"Retrying in {delay:.0f}s after {error.split(':')[0]}")
+            await asyncio.sleep(delay)
+        trader.do_trade = not trader.do_trade
+        ended = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            write_trader_run(trader.name, mode, started, ended, status, attempt, error)
+        except Exception as e:
+            print(f"Was not able to record the run of {trader.name} due to {e}")
+        return status
+
+    async def run_cycle(self, traders, pool: MCPServerPool | None = None) -> dict[str, str]:
+        """Run every trader once and return each one's outcome"""
+        outcomes = await asyncio.gather(*[self.run_trader(trader, pool) for trader in traders])
+        return {trader.name: outcome for trader, outcome in zip(traders, outcomes)}
@@ -0,0 +1,183 @@
+import asyncio
+import os
+from agents.mcp import MCPServer, MCPServerSse, MCPServerStdio
+from dotenv import load_dotenv
+from mcp_params import (
+    trader_mcp_server_params,
+    researcher_shared_mcp_server_params,
+    memory_server_process_params,
+    memory_server_port,
+    shared_memory_mcp_server_params,
+    rate_limit_name,
+    is_research_server,
+)
+from ratelimit import TokenBucket, get_limiter
+from research_cache import ToolResultCache, research_cache
+
+load_dotenv(override=True)
+
+CLIENT_SESSION_TIMEOUT_SECONDS = 120
+HEALTH_CHECK_TIMEOUT_SECONDS = float(os.getenv("MCP_HEALTH_CHECK_TIMEOUT_SECONDS", "10"))
+MEMORY_SERVER_STARTUP_SECONDS = float(os.getenv("MEMORY_SERVER_STARTUP_SECONDS", "30"))
+
+
+class RateLimitedMCPServerStdio(MCPServerStdio):
+    """An MCP server whose tool calls wait for a token from a shared rate limiter, for servers wrapping a metered API"""
+
+    def __init__(self, params, limiter: TokenBucket, **kwargs):
+        super().__init__(params, **kwargs)
+        self.limiter = limiter
+
+    async def call_tool(self, *args, **kwargs):
+        await self.limiter.wait()
+        return await super().call_tool(*args, **kwargs)
+
+
+class CachedMCPServerStdio(MCPServerStdio):
+    """
+    An MCP server whose tool results are served from a cache shared by every trader when fresh,
+    so only a miss reaches the server, and its rate limiter if it has one
+    """
+
+    def __init__(self, params, cache: ToolResultCache, limiter: TokenBucket | None = None, **kwargs):
+        super().__init__(params, **kwargs)
+        self.cache = cache
+        self.limiter = limiter
+
+    async def call_tool(self, tool_name: str, arguments: dict | None):
+        async def call():
+            if self.limiter:
+                await self.limiter.wait()
+            return await super(CachedMCPServerStdio, self).call_tool(tool_name, arguments)
+
+        return await self.cache.call(f"{self.name}:{tool_name}", arguments, call)
+
+
+class MCPServerPool:
+    """
+    Long-lived MCP servers for the trading floor, started once rather than on every run.
+    The stateless servers (accounts, push, market, fetch and brave) are shared by all traders.
+    One memory server process holds every trader's knowledge graph, and each trader connects to it over SSE
+    with its own namespace. Servers are started and restarted from the task that owns the pool,
+    because an MCP client must be closed from the task that opened it.
+    """
+
+    def __init__(self, trader_names: list[str]):
+        self.params = {}
+        for index, params in enumerate(trader_mcp_server_params):
+            self.params[("trader", index)] = params
+        for index, params in enumerate(researcher_shared_mcp_server_params):
+            self.params[("researcher", index)] = params
+        for name in trader_names:
+            self.params[("memory", name)] = shared_memory_mcp_server_params(name)
+        self.servers: dict[tuple, MCPServer] = {}
+        self.memory_process: asyncio.subprocess.Process | None = None
+
+    async def _start_memory_process(self) -> None:
+        """Launch the shared memory server and wait until it accepts connections"""
+        params = memory_server_process_params
+        self.memory_process = await asyncio.create_subprocess_exec(params["command"], *params["args"])
+        deadline = asyncio.get_running_loop().time() + MEMORY_SERVER_STARTUP_SECONDS
+        while True:
+            if self.memory_process.returncode is not None:
+                raise RuntimeError(f"Memory server exited with code {self.memory_process.returncode}")
+            try:
+                _, writer = await asyncio.open_connection("127.0.0.1", memory_server_port)
+                writer.close()
+                return
+            except OSError:
+                if asyncio.get_running_loop().time() > deadline:
+                    raise RuntimeError(f"Memory server did not start within {MEMORY_SERVER_STARTUP_SECONDS}s")
+                await asyncio.sleep(0.1)
+
+    async def _stop_memory_process(self) -> None:
+        process, self.memory_process = self.memory_process, None
+        if process and process.returncode is None:
+            process.terminate()
+            try:
+                await asyncio.wait_for(process.wait(), timeout=HEALTH_CHECK_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                process.kill()
+
+    async def _start(self, key) -> MCPServer:
+        params = self.params[key]
+        kwargs = {"client_session_timeout_seconds": CLIENT_SESSION_TIMEOUT_SECONDS, "cache_tools_list": True}
+        limit = rate_limit_name(params)
+        limiter = get_limiter(limit) if limit else None
+        if "url" in params:
+            server = MCPServerSse(params, **kwargs)
+        elif is_research_server(params):
+            server = CachedMCPServerStdio(params, research_cache, limiter, **kwargs)
+        elif limiter:
+            server = RateLimitedMCPServerStdio(params, limiter, **kwargs)
+        else:
+            server = MCPServerStdio(params, **kwargs)
+        await server.connect()
+        self.servers[key] = server
+        return server
+
+    async def _stop(self, key) -> None:
+        server = self.servers.pop(key, None)
+        if server:
+            try:
+                await server.cleanup()
+            except Exception as e:
+                print(f"Error stopping MCP server {server.name}: {e}")
+
+    async def _is_healthy(self, server: MCPServer) -> bool:
+        if not server.session:
+            return False
+        try:
+            await asyncio.wait_for(server.session.send_ping(), timeout=HEALTH_CHECK_TIMEOUT_SECONDS)
+            return True
+        except Exception:
+            return False
+
+    async def start(self) -> None:
+        await self._start_memory_process()
+        for key in self.params:
+            await self._start(key)
+
+    async def ensure_healthy(self) -> None:
+        """Ping every server, and restart any that has crashed or stopped responding"""
+        if not self.memory_process or self.memory_process.returncode is not None:
+            print("Restarting the memory server")
+            await self._stop_memory_process()
+            try:
+                await self._start_memory_process()
+            except Exception as e:
+                print(f"Error restarting the memory server: {e}")
+        for key in self.params:
+            server = self.servers.get(key)
+            if server and await self._is_healthy(server):
+                continue
+            print(f"Restarting MCP server {key}")
+            await self._stop(key)
+            try:
+                await self._start(key)
+            except Exception as e:
+                print(f"Error restarting MCP server {key}: {e}")
+
+    def trader_servers(self) -> list[MCPServer]:
+        return [server for (kind, _), server in self.servers.items() if kind == "trader"]
+
+    def researcher_servers(self, name: str) -> list[MCPServer]:
+        shared = [server for (kind, _), server in self.servers.items() if kind == "researcher"]
+        memory = self.servers.get(("memory", name))
+        return shared + [memory] if memory else shared
+
+    async def close(self) -> None:
+        for key in reversed(list(self.servers)):
+            await self._stop(key)
+        await self._stop_memory_process()
+
+    async def __aenter__(self):
+        try:
+            await self.start()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.close()
@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# The accounts tests write to a throwaway database, never the trading floor's
+os.environ["ACCOUNTS_DB"] = os.path.join(tempfile.mkdtemp(prefix="tests"), "accounts.db")
@@ -0,0 +1,68 @@
+import json
+from datetime import datetime, timedelta
+import market
+from accounts import Account, REPORT_TRANSACTIONS
+from context import AccountContext, TransactionSummary
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA"]
+PRICES = {"AAPL": 100.0, "MSFT": 200.0, "NVDA": 50.0}
+
+
+def setup_module():
+    start = datetime(2025, 1, 6, 10)
+    clock = iter(start + timedelta(minutes=minute) for minute in range(100_000))
+    market.set_replay(lambda symbols: {symbol: PRICES[symbol] for symbol in symbols}, lambda: next(clock))
+
+
+def teardown_module():
+    market.set_replay(None, None)
+
+
+def trade(account: Account, index: int) -> None:
+    symbol = SYMBOLS[index % len(SYMBOLS)]
+    if index % 4 == 3:
+        account.sell_shares(symbol, 1, f"Trade {index}")
+    else:
+        account.buy_shares(symbol, 2, f"Trade {index}")
+
+
+def expected_summary(transactions: list[dict]) -> dict:
+    summary = TransactionSummary()
+    for transaction in transactions:
+        summary.add(transaction)
+    return summary.describe()
+
+
+def test_summary_covers_the_history_before_the_report_page():
+    account = Account.get("contexttest")
+    account.reset("Test")
+    account.balance = 1e9
+    account.save()
+    trades = REPORT_TRANSACTIONS * 3
+    for index in range(trades):
+        trade(account, index)
+
+    context = AccountContext(budget=100_000, recent=12)
+    payload = json.loads(context.build(json.loads(account.report())))
+    history = account.list_transactions()
+    assert len(history) == trades
+    assert payload["earlier_transactions_summary"] == expected_summary(history[: trades - 12])
+    assert payload["recent_transactions"] == history[trades - 12 :]
+
+    # A later run only folds in the transactions that aged out of the recent window, on the same summary
+    summary = context.summary
+    for index in range(trades, trades + 5):
+        trade(account, index)
+    payload = json.loads(context.build(json.loads(account.report())))
+    history = account.list_transactions()
+    assert context.summary is summary
+    assert payload["earlier_transactions_summary"] == expected_summary(history[: len(history) - 12])
+
+    # After a reset the summary starts over
+    account.reset("Test")
+    account.balance = 1e9
+    account.save()
+    for index in range(20):
+        trade(account, index)
+    payload = json.loads(context.build(json.loads(account.report())))
+    assert payload["earlier_transactions_summary"] == expected_summary(account.list_transactions()[:8])
@@ -0,0 +1,22 @@
+import sqlite3
+from memory_graph import KnowledgeGraph
+
+
+def test_failed_import_is_retried(tmp_path):
+    """A trader's old mcp-memory-libsql database that cannot be read yet is imported on a later use"""
+    graph = KnowledgeGraph(str(tmp_path / "memory.db"))
+    old = sqlite3.connect(tmp_path / "alice.db")
+    old.execute("CREATE TABLE entities (name TEXT, entity_type TEXT)")
+    old.execute("INSERT INTO entities VALUES ('AAPL', 'company')")
+    old.commit()
+
+    assert graph.read_graph("alice")["entities"] == []
+
+    old.execute("CREATE TABLE observations (id INTEGER PRIMARY KEY, entity_name TEXT, content TEXT)")
+    old.execute("CREATE TABLE relations (source TEXT, target TEXT, relation_type TEXT)")
+    old.execute("INSERT INTO observations (entity_name, content) VALUES ('AAPL', 'Bought 10 shares')")
+    old.commit()
+    old.close()
+
+    entities = graph.read_graph("alice")["entities"]
+    assert entities == [{"name": "AAPL", "entityType": "company", "observations": ["Bought 10 shares"]}]
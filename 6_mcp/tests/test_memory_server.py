@@ -0,0 +1,63 @@
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import mcp
+from mcp.client.sse import sse_client
+
+SERVER_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(tmp_path, port: int) -> subprocess.Popen:
+    """memory_server.py serving every trader over SSE, as MCPServerPool runs it, on its own memory database"""
+    env = {**os.environ, "MEMORY_DB": str(tmp_path / "memory.db")}
+    process = subprocess.Popen(
+        [sys.executable, "memory_server.py", "--port", str(port)], cwd=SERVER_DIRECTORY, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError(f"Memory server exited with {process.returncode}")
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError("Memory server did not start")
+
+
+async def call_tool(port: int, name: str, tool: str, arguments: dict) -> dict | str:
+    async with sse_client(f"http://127.0.0.1:{port}/{name}/sse") as streams:
+        async with mcp.ClientSession(*streams) as session:
+            await session.initialize()
+            result = await session.call_tool(tool, arguments)
+            assert not result.isError, result.content
+            text = result.content[0].text
+            return json.loads(text) if text.startswith("{") else text
+
+
+def test_sse_sessions_use_the_namespace_in_their_path(tmp_path):
+    port = free_port()
+    process = start_server(tmp_path, port)
+    try:
+        entity = {"name": "AAPL", "entityType": "company", "observations": ["Bought 10 shares"]}
+        created = asyncio.run(call_tool(port, "alice", "create_entities", {"entities": [entity]}))
+        assert created == "Created or updated 1 entities"
+
+        alice = asyncio.run(call_tool(port, "alice", "search_nodes", {"query": "shares"}))
+        assert alice["entities"] == [entity]
+        bob = asyncio.run(call_tool(port, "bob", "read_graph", {}))
+        assert bob["entities"] == []
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
@@ -1,7 +1,8 @@
 from agents import TracingProcessor, Trace, Span
-from database import write_log
+from database import write_log, write_span_metric, flush_logs
 import secrets
 import string
+import time
 
 ALPHANUM = string.ascii_lowercase + string.digits 
 
@@ -16,6 +17,14 @@ def make_trace_id(tag: str) -> str:
     return f"trace_{tag}{random_suffix}"
 
 class LogTracer(TracingProcessor):
+    """
+    Writes trace and span events to the logs, and the duration of every span to span_metrics.
+    Nothing here touches the database directly: rows go onto the log writer's queue and are
+    committed in batches by its background thread, so the agent's event loop never waits on SQLite.
+    """
+
+    def __init__(self):
+        self.started: dict[str, float] = {}
 
     def get_name(self, trace_or_span: Trace | Span) -> str | None:
         trace_id = trace_or_span.trace_id
@@ -35,41 +44,51 @@ class LogTracer(TracingProcessor):
         if name:
             write_log(name, "trace", f"Ended: {trace.name}")
 
+    def describe(self, span, prefix: str) -> str:
+        message = prefix
+        if span.span_data:
+            if span.span_data.type:
+                message += f" {span.span_data.type}"
+            if hasattr(span.span_data, "name") and span.span_data.name:
+                message += f" {span.span_data.name}"
+            if hasattr(span.span_data, "server") and span.span_data.server:
+                message += f" {span.span_data.server}"
+        if span.error:
+            message += f" {span.error}"
+        return message
+
+    def get_label(self, span) -> str | None:
+        """The tool, model or MCP server that a span's latency should be attributed to"""
+        data = span.span_data
+        if getattr(data, "server", None):
+            return data.server
+        if getattr(data, "model", None):
+            return data.model
+        response = getattr(data, "response", None)
+        if response is not None and getattr(response, "model", None):
+            return response.model
+        return getattr(data, "name", None)
+
     def on_span_start(self, span) -> None:
+        self.started[span.span_id] = time.perf_counter()
         name = self.get_name(span)
         type = span.span_data.type if span.span_data else "span"
         if name:
-            message = "Started"
-            if span.span_data:
-                if span.span_data.type:
-                    message += f" {span.span_data.type}"
-                if hasattr(span.span_data, "name") and span.span_data.name:
-                    message += f" {span.span_data.name}"
-                if hasattr(span.span_data, "server") and span.span_data.server:
-                    message += f" {span.span_data.server}"
-            if span.error:
-                message += f" {span.error}"
-            write_log(name, type, message)
+            write_log(name, type, self.describe(span, "Started"))
 
     def on_span_end(self, span) -> None:
+        started = self.started.pop(span.span_id, None)
         name = self.get_name(span)
         type = span.span_data.type if span.span_data else "span"
+        if started is not None:
+            duration_ms = 1000 * (time.perf_counter() - started)
+            write_span_metric(name, type, self.get_label(span), duration_ms, bool(span.error))
         if name:
-            message = "Ended"
-            if span.span_data:
-                if span.span_data.type:
-                    
-                    message += f" {span.span_data.type}"
-                if hasattr(span.span_data, "name") and span.span_data.name:
-                    message += f" {span.span_data.name}"
-                if hasattr(span.span_data, "server") and span.span_data.server:
-                    message += f" {span.span_data.server}"
-            if span.error:
-                message += f" {span.error}"
-            write_log(name, type, message)
+            write_log(name, type, self.describe(span, "Ended"))
 
     def force_flush(self) -> None:
-        pass
+        flush_logs()
 
     def shutdown(self) -> None:
-        pass
\ No newline at end of file
+        self.started.clear()
+        flush_logs()
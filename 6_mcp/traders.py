@@ -1,8 +1,9 @@
 from contextlib import AsyncExitStack
 from accounts_client import read_accounts_resource, read_strategy_resource
 from tracers import make_trace_id
-from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, trace
-from openai import AsyncOpenAI
+from context import AccountContext
+from agents import Agent, Tool, Runner, OpenAIChatCompletionsModel, OpenAIResponsesModel, trace
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
 from dotenv import load_dotenv
 import os
 import json
@@ -15,6 +16,8 @@ from templates import (
     research_tool,
 )
 from mcp_params import trader_mcp_server_params, researcher_mcp_server_params
+from server_pool import MCPServerPool
+from ratelimit import get_limiter
 
 load_dotenv(override=True)
 
@@ -30,10 +33,38 @@ OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 
 MAX_TURNS = 30
 
-openrouter_client = AsyncOpenAI(base_url=OPENROUTER_BASE_URL, api_key=openrouter_api_key)
-deepseek_client = AsyncOpenAI(base_url=DEEPSEEK_BASE_URL, api_key=deepseek_api_key)
-grok_client = AsyncOpenAI(base_url=GROK_BASE_URL, api_key=grok_api_key)
-gemini_client = AsyncOpenAI(base_url=GEMINI_BASE_URL, api_key=google_api_key)
+
+def rate_limited_http_client(provider: str):
+    """An HTTP client whose every request, retries included, waits for the provider's shared rate limit"""
+    limiter = get_limiter(provider)
+    if not limiter:
+        return None
+
+    async def throttle(request):
+        await limiter.wait()
+
+    return DefaultAsyncHttpxClient(event_hooks={"request": [throttle]})
+
+
+openrouter_client = AsyncOpenAI(
+    base_url=OPENROUTER_BASE_URL, api_key=openrouter_api_key, http_client=rate_limited_http_client("openrouter")
+)
+deepseek_client = AsyncOpenAI(
+    base_url=DEEPSEEK_BASE_URL, api_key=deepseek_api_key, http_client=rate_limited_http_client("deepseek")
+)
+grok_client = AsyncOpenAI(base_url=GROK_BASE_URL, api_key=grok_api_key, http_client=rate_limited_http_client("grok"))
+gemini_client = AsyncOpenAI(
+    base_url=GEMINI_BASE_URL, api_key=google_api_key, http_client=rate_limited_http_client("gemini")
+)
+openai_client = None
+
+
+def get_openai_client() -> AsyncOpenAI:
+    """Created on first use, as it needs OPENAI_API_KEY only when an OpenAI model is actually used"""
+    global openai_client
+    if openai_client is None:
+        openai_client = AsyncOpenAI(http_client=rate_limited_http_client("openai"))
+    return openai_client
 
 
 def get_model(model_name: str):
@@ -46,7 +77,7 @@ def get_model(model_name: str):
     elif "gemini" in model_name:
         return OpenAIChatCompletionsModel(model=model_name, openai_client=gemini_client)
     else:
-        return model_name
+        return OpenAIResponsesModel(model=model_name, openai_client=get_openai_client())
 
 
 async def get_researcher(mcp_servers, model_name) -> Agent:
@@ -71,6 +102,7 @@ class Trader:
         self.agent = None
         self.model_name = model_name
         self.do_trade = True
+        self.context = AccountContext()
 
     async def create_agent(self, trader_mcp_servers, researcher_mcp_servers) -> Agent:
         tool = await get_researcher_tool(researcher_mcp_servers, self.model_name)
@@ -84,10 +116,9 @@ class Trader:
         return self.agent
 
     async def get_account_report(self) -> str:
+        """The account for the prompt, with older transactions summarized and the whole within the token budget"""
         account = await read_accounts_resource(self.name)
-        account_json = json.loads(account)
-        account_json.pop("portfolio_value_time_series", None)
-        return json.dumps(account_json)
+        return self.context.build(json.loads(account))
 
     async def run_agent(self, trader_mcp_servers, researcher_mcp_servers):
         self.agent = await self.create_agent(trader_mcp_servers, researcher_mcp_servers)
@@ -117,15 +148,21 @@ class Trader:
                 ]
                 await self.run_agent(trader_mcp_servers, researcher_mcp_servers)
 
-    async def run_with_trace(self):
+    async def run_with_server_pool(self, pool: MCPServerPool):
+        await self.run_agent(pool.trader_servers(), pool.researcher_servers(self.name))
+
+    async def run_with_trace(self, pool: MCPServerPool | None = None):
         trace_name = f"{self.name}-trading" if self.do_trade else f"{self.name}-rebalancing"
         trace_id = make_trace_id(f"{self.name.lower()}")
         with trace(trace_name, trace_id=trace_id):
-            await self.run_with_mcp_servers()
+            if pool:
+                await self.run_with_server_pool(pool)
+            else:
+                await self.run_with_mcp_servers()
 
-    async def run(self):
+    async def run(self, pool: MCPServerPool | None = None):
         try:
-            await self.run_with_trace()
+            await self.run_with_trace(pool)
         except Exception as e:
             print(f"Error running trader {self.name}: {e}")
         self.do_trade = not self.do_trade
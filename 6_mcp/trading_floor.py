@@ -2,8 +2,13 @@ from traders import Trader
 from typing import List
 import asyncio
 from tracers import LogTracer
+from server_pool import MCPServerPool
+from scheduler import TraderScheduler
+from accounts_client import close_accounts_client
 from agents import add_trace_processor
 from market import is_market_open
+from research_cache import get_research_cache_stats
+from ratelimit import get_rate_limit_stats
 from dotenv import load_dotenv
 import os
 
@@ -41,12 +46,21 @@ def create_traders() -> List[Trader]:
 async def run_every_n_minutes():
     add_trace_processor(LogTracer())
     traders = create_traders()
-    while True:
-        if RUN_EVEN_WHEN_MARKET_IS_CLOSED or is_market_open():
-            await asyncio.gather(*[trader.run() for trader in traders])
-        else:
-            print("Market is closed, skipping run")
-        await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+    scheduler = TraderScheduler()
+    try:
+        async with MCPServerPool([trader.name for trader in traders]) as pool:
+            while True:
+                if RUN_EVEN_WHEN_MARKET_IS_CLOSED or await asyncio.to_thread(is_market_open):
+                    await pool.ensure_healthy()
+                    outcomes = await scheduler.run_cycle(traders, pool)
+                    print(f"Completed run: {outcomes}")
+                    print(f"Research cache: {get_research_cache_stats()}")
+                    print(f"Rate limits: {get_rate_limit_stats()}")
+                else:
+                    print("Market is closed, skipping run")
+                await asyncio.sleep(RUN_EVERY_N_MINUTES * 60)
+    finally:
+        await close_accounts_client()
 
 
 if __name__ == "__main__":
@@ -1,9 +1,274 @@
 # Import necessary libraries
 import sqlite3
-from datetime import datetime
+import bisect
+import math
+import re
+import queue
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 from langchain_community.vectorstores import Qdrant
 import os
 
+DB_POOL_SIZE = int(os.getenv("BROOMBOT_DB_POOL_SIZE", "4"))
+OPEN_HOUR = int(os.getenv("BROOMBOT_OPEN_HOUR", "8"))
+CLOSE_HOUR = int(os.getenv("BROOMBOT_CLOSE_HOUR", "17"))
+SLOT_STEP_MINUTES = int(os.getenv("BROOMBOT_SLOT_STEP_MINUTES", "30"))
+SLOT_SEARCH_DAYS = int(os.getenv("BROOMBOT_SLOT_SEARCH_DAYS", "14"))
+DEALER_SEARCH_LIMIT = int(os.getenv("BROOMBOT_DEALER_SEARCH_LIMIT", "5"))
+DEALER_SEARCH_MAX_LIMIT = 20
+# Location filters from the broadest to the most specific, relaxed from the end when nothing matches
+DEALER_LOCATION_FIELDS = ["province", "city", "district", "village"]
+# Size in degrees of the grid cells dealers are indexed by for nearest dealer searches (about 28km at the equator)
+GRID_DEGREES = 0.25
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def grid_cell_sql(column):
+    """SQL for the grid cell of a TEXT coordinate column: floor(value / GRID_DEGREES), written out as SQLite may lack floor()."""
+    value = f"(CAST(TRIM({column}) AS REAL) / {GRID_DEGREES})"
+    return f"(CAST({value} AS INTEGER) - ({value} < CAST({value} AS INTEGER)))"
+
+
+def haversine_km(latitude1, longitude1, latitude2, longitude2):
+    """Great-circle distance in kilometres between two points given in degrees."""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(longitude2 - longitude1)
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class ConnectionPool:
+    """
+    A fixed set of SQLite connections to one database file, shared by every chat session,
+    along with the availability index of that database.
+
+    Connections are opened once in WAL mode, so readers never wait for a booking being written,
+    and with foreign keys enforced. A call borrows a connection and gives it back when done.
+    """
+
+    def __init__(self, db_name: str, size: int = DB_POOL_SIZE):
+        self.db_name = db_name
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(self._connect())
+        self.availability = AvailabilityIndex()
+
+    def _connect(self):
+        # isolation_level=None leaves transactions to transaction(), so reads never hold a lock
+        connection = sqlite3.connect(self.db_name, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode = WAL")
+        connection.execute("PRAGMA synchronous = NORMAL")
+        connection.execute("PRAGMA busy_timeout = 5000")
+        connection.execute("PRAGMA foreign_keys = ON")
+        return connection
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for reads."""
+        connection = self.connections.get()
+        try:
+            yield connection
+        finally:
+            self.connections.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        """Borrow a connection and run everything on its cursor as one transaction, committed at the end."""
+        with self.connection() as connection:
+            # BEGIN IMMEDIATE takes the write lock up front, so the transaction never fails halfway on a busy database
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection.cursor()
+                connection.execute("COMMIT")
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+
+
+class TechnicianSchedule:
+    """
+    One technician's bookings sorted by start time, with the latest end time up to each booking.
+
+    A slot is free when every booking starting before the slot ends has also ended by the time it starts,
+    which is one bisect and one lookup, even if old bookings overlap each other.
+    """
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.max_ends = []
+
+    def add(self, start_time, end_time):
+        """Add a booking, with times as 'YYYY-MM-DD HH:MM:SS' text, which sorts in time order."""
+        i = bisect.bisect_right(self.starts, start_time)
+        self.starts.insert(i, start_time)
+        self.ends.insert(i, end_time)
+        self.max_ends.insert(i, max(self.max_ends[i - 1], end_time) if i else end_time)
+        # Carry the new end time forward until it no longer changes the running maximum
+        for j in range(i + 1, len(self.max_ends)):
+            latest = max(self.max_ends[j - 1], self.ends[j])
+            if latest == self.max_ends[j]:
+                break
+            self.max_ends[j] = latest
+
+    def remove(self, start_time, end_time):
+        """Remove a booking added with the same start and end time."""
+        i = bisect.bisect_left(self.starts, start_time)
+        while self.ends[i] != end_time:
+            i += 1
+        del self.starts[i], self.ends[i], self.max_ends[i]
+        # Work the running maximum out again from the removed booking until it no longer changes
+        for j in range(i, len(self.max_ends)):
+            latest = max(self.max_ends[j - 1], self.ends[j]) if j else self.ends[j]
+            if latest == self.max_ends[j]:
+                break
+            self.max_ends[j] = latest
+
+    def is_free(self, start_time, end_time):
+        """Whether the technician has no booking overlapping start_time to end_time."""
+        i = bisect.bisect_left(self.starts, end_time)
+        return i == 0 or self.max_ends[i - 1] <= start_time
+
+
+class AvailabilityIndex:
+    """
+    The schedule of every technician, grouped by dealer, kept in memory beside the database.
+
+    The index stays in step with other sessions and processes by reading just the rows with an id
+    above the last one it has seen, plus the bookings logged in BOOKING_CHANGES since the last refresh,
+    so a booking that is cancelled, rescheduled or deleted frees its slot.
+    Bookings that ended before the index was first loaded are left out, as no slot can be booked in the past.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.last_booking_id = 0
+        self.last_change = 0
+        self.last_technician_id = 0
+        self.technicians = {}  # id_dealer -> {id_technician: name}, in id order
+        self.schedules = {}  # id_technician -> TechnicianSchedule
+        self.bookings = {}  # id_booking -> (id_technician, start_time, end_time), for the bookings in schedules
+
+    def refresh(self, cursor):
+        """Bring in the technicians and bookings added, and the bookings changed, since the last refresh."""
+        with self.lock:
+            rows = cursor.execute(
+                "SELECT id, name, id_dealer FROM TECHNICIANS WHERE id > ? ORDER BY id", (self.last_technician_id,)
+            ).fetchall()
+            for id_technician, name, id_dealer in rows:
+                self.technicians.setdefault(id_dealer, {})[id_technician] = name
+                self.last_technician_id = id_technician
+
+            if not self.loaded:
+                # The first load skips bookings that are already over, then keeps up by id and by the change log.
+                # Changes logged while it loads are read again on the next refresh, which does no harm
+                cutoff = (datetime.now() - timedelta(days=1)).strftime(TIME_FORMAT)
+                self.last_change = cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM BOOKING_CHANGES").fetchone()[0]
+                self.last_booking_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM BOOKINGS").fetchone()[0]
+                rows = cursor.execute(
+                    "SELECT id, id_technician, start_time, end_time, status FROM BOOKINGS WHERE end_time > ? AND id <= ?",
+                    (cutoff, self.last_booking_id),
+                ).fetchall()
+                self.loaded = True
+                changed = set()
+            else:
+                rows = cursor.execute(
+                    "SELECT id, id_technician, start_time, end_time, status FROM BOOKINGS WHERE id > ? ORDER BY id",
+                    (self.last_booking_id,),
+                ).fetchall()
+                changes = cursor.execute(
+                    "SELECT seq, id_booking FROM BOOKING_CHANGES WHERE seq > ? ORDER BY seq", (self.last_change,)
+                ).fetchall()
+                changed = {id_booking for _, id_booking in changes}
+                if changes:
+                    # A deleted booking has no row left, so it is only taken out below
+                    rows += cursor.execute(
+                        "SELECT id, id_technician, start_time, end_time, status FROM BOOKINGS "
+                        "WHERE id IN (SELECT id_booking FROM BOOKING_CHANGES WHERE seq > ?)",
+                        (self.last_change,),
+                    ).fetchall()
+                    self.last_change = changes[-1][0]
+
+            # Take changed bookings out of their old slots before adding them back as they are now
+            for id_booking in changed:
+                booking = self.bookings.pop(id_booking, None)
+                if booking:
+                    self.schedules[booking[0]].remove(booking[1], booking[2])
+            for id_booking, id_technician, start_time, end_time, status in rows:
+                self.last_booking_id = max(self.last_booking_id, id_booking)
+                # A new booking changed since it was made comes back from both queries, and is added once
+                if status != "Cancelled" and id_booking not in self.bookings:
+                    self.bookings[id_booking] = (id_technician, str(start_time), str(end_time))
+                    self.schedules.setdefault(id_technician, TechnicianSchedule()).add(str(start_time), str(end_time))
+
+    def _is_free(self, id_technician, start_time, end_time):
+        schedule = self.schedules.get(id_technician)
+        return schedule is None or schedule.is_free(start_time, end_time)
+
+    def is_free(self, id_technician, start_time, end_time):
+        """Whether one technician has nothing booked between start_time and end_time."""
+        with self.lock:
+            return self._is_free(id_technician, start_time, end_time)
+
+    def free_technicians(self, id_dealer, start_time, end_time):
+        """Names of the dealer's technicians with nothing booked between start_time and end_time."""
+        with self.lock:
+            return [
+                name
+                for id_technician, name in self.technicians.get(id_dealer, {}).items()
+                if self._is_free(id_technician, start_time, end_time)
+            ]
+
+    def next_free_slots(self, id_dealer, after, duration_minutes, count):
+        """
+        The first count slots from after, within working hours, when at least one of the dealer's technicians is free,
+        each as (start_time, end_time, technician names).
+        """
+        step = timedelta(minutes=SLOT_STEP_MINUTES)
+        duration = timedelta(minutes=duration_minutes)
+        # Start from the first step boundary at or after the requested time
+        start = after.replace(second=0, microsecond=0)
+        start += timedelta(minutes=-start.minute % SLOT_STEP_MINUTES)
+        last = after + timedelta(days=SLOT_SEARCH_DAYS)
+        slots = []
+        while start < last and len(slots) < count:
+            day_open = start.replace(hour=OPEN_HOUR, minute=0)
+            day_close = start.replace(hour=CLOSE_HOUR, minute=0)
+            if start < day_open:
+                start = day_open
+                continue
+            if start + duration > day_close:
+                start = day_open + timedelta(days=1)
+                continue
+            start_time = start.strftime(TIME_FORMAT)
+            end_time = (start + duration).strftime(TIME_FORMAT)
+            free = self.free_technicians(id_dealer, start_time, end_time)
+            if free:
+                slots.append((start_time, end_time, free))
+            start += step
+        return slots
+
+
+# One pool per database file, shared by every BroomBotDatabase, so a new chat session opens no connections
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_name: str) -> tuple[ConnectionPool, bool]:
+    """Return the pool for a database file, and whether it was just created."""
+    with _pools_lock:
+        if db_name in _pools:
+            return _pools[db_name], False
+        _pools[db_name] = ConnectionPool(db_name)
+        return _pools[db_name], True
+
 
 class BroomBotDatabase:
     """Database handler for BroomBot motorcycle service booking system."""
@@ -18,14 +283,29 @@ class BroomBotDatabase:
         # Get the path to the same folder as this file (broom-bot folder)
         current_dir = os.path.dirname(os.path.abspath(__file__))
         self.db_name = os.path.join(current_dir, db_name)
-        self.create_table()
+        self.pool, created = get_pool(self.db_name)
+        # Tables and indexes only need creating once per process
+        if created:
+            self.create_table()
+        self.availability = self.pool.availability
+
+    def connection(self):
+        """Borrow a pooled connection for reads."""
+        return self.pool.connection()
+
+    def transaction(self):
+        """Borrow a pooled connection's cursor for one transaction."""
+        return self.pool.transaction()
 
     def create_table(self):
-        """Create necessary database tables if they don't exist."""
-        # Connect to SQLite database (it will create the file if it doesn't exist)
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+        """Create necessary database tables and indexes if they don't exist."""
+        with self.transaction() as cursor:
+            self._create_tables(cursor)
+
+        print("Table created")
 
+    def _create_tables(self, cursor):
+        """Create the tables and indexes on the caller's transaction."""
         # Create 'dealers' table
         create_table_dealers = '''
             CREATE TABLE IF NOT EXISTS DEALERS (
@@ -44,7 +324,6 @@ class BroomBotDatabase:
             )
         '''
         cursor.execute(create_table_dealers)
-        conn.commit()
 
         # Create 'techincians' table
         create_table_technicians = '''
@@ -59,7 +338,6 @@ class BroomBotDatabase:
             )
         '''
         cursor.execute(create_table_technicians)
-        conn.commit()
 
         # Create 'bookings' table
         create_table_boookings = '''
@@ -82,167 +360,332 @@ class BroomBotDatabase:
             )
         '''
         cursor.execute(create_table_boookings)
-        conn.commit()
-
-        conn.close()
 
-        print("Table created")
+        # Log of bookings updated or deleted after they were made, so the availability index can catch up on them
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS BOOKING_CHANGES (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id_booking INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS bookings_change_update
+            AFTER UPDATE OF start_time, end_time, status, id_technician ON BOOKINGS BEGIN
+                INSERT INTO BOOKING_CHANGES (id_booking) VALUES (new.id);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS bookings_change_delete AFTER DELETE ON BOOKINGS BEGIN
+                INSERT INTO BOOKING_CHANGES (id_booking) VALUES (old.id);
+            END
+        ''')
+
+        # Indexes for the tool queries: dealer and technician lookups by name,
+        # and bookings by dealer or technician over a time range
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_dealers_name ON DEALERS (name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_technicians_dealer_name ON TECHNICIANS (id_dealer, name)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookings_dealer_time ON BOOKINGS (id_dealer, start_time, end_time)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_bookings_technician_time ON BOOKINGS (id_technician, start_time, end_time)")
+
+        # Full-text index over the dealers' location fields, kept in step with DEALERS by triggers
+        has_dealer_search = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'DEALERS_FTS'").fetchone()
+        cursor.execute('''
+            CREATE VIRTUAL TABLE IF NOT EXISTS DEALERS_FTS USING fts5(
+                name, address, service, province, city, district, village,
+                content='DEALERS', content_rowid='id'
+            )
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS dealers_fts_insert AFTER INSERT ON DEALERS BEGIN
+                INSERT INTO DEALERS_FTS (rowid, name, address, service, province, city, district, village)
+                VALUES (new.id, new.name, new.address, new.service, new.province, new.city, new.district, new.village);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS dealers_fts_delete AFTER DELETE ON DEALERS BEGIN
+                INSERT INTO DEALERS_FTS (DEALERS_FTS, rowid, name, address, service, province, city, district, village)
+                VALUES ('delete', old.id, old.name, old.address, old.service, old.province, old.city, old.district, old.village);
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS dealers_fts_update AFTER UPDATE ON DEALERS BEGIN
+                INSERT INTO DEALERS_FTS (DEALERS_FTS, rowid, name, address, service, province, city, district, village)
+                VALUES ('delete', old.id, old.name, old.address, old.service, old.province, old.city, old.district, old.village);
+                INSERT INTO DEALERS_FTS (rowid, name, address, service, province, city, district, village)
+                VALUES (new.id, new.name, new.address, new.service, new.province, new.city, new.district, new.village);
+            END
+        ''')
+        if not has_dealer_search:
+            # Index the dealers that were added before the search index existed
+            cursor.execute("INSERT INTO DEALERS_FTS (DEALERS_FTS) VALUES ('rebuild')")
+
+        # Grid cells of the dealers' coordinates, for nearest dealer searches, kept up to date by triggers
+        dealer_columns = [row[1] for row in cursor.execute("PRAGMA table_info(DEALERS)")]
+        if "lat_cell" not in dealer_columns:
+            cursor.execute("ALTER TABLE DEALERS ADD COLUMN lat_cell INTEGER")
+            cursor.execute("ALTER TABLE DEALERS ADD COLUMN lon_cell INTEGER")
+            cursor.execute(f"UPDATE DEALERS SET lat_cell = {grid_cell_sql('latitude')}, lon_cell = {grid_cell_sql('longitude')}")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_dealers_grid ON DEALERS (lat_cell, lon_cell)")
+        set_grid_cells = f'''
+            UPDATE DEALERS SET lat_cell = {grid_cell_sql('new.latitude')}, lon_cell = {grid_cell_sql('new.longitude')}
+            WHERE id = new.id;
+        '''
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS dealers_grid_insert AFTER INSERT ON DEALERS BEGIN {set_grid_cells} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS dealers_grid_update AFTER UPDATE OF latitude, longitude ON DEALERS BEGIN {set_grid_cells} END")
 
     def insert_dealer(self, name, address, post_code, phone, service, province, city, district, village, latitude, longitude):
         """Insert a new dealer into the database."""
-        connection = sqlite3.connect(self.db_name)
-        cursor = connection.cursor()
         insert_dealer_sql = 'INSERT INTO dealers (name, address, post_code, phone, service, province, city, district, village, latitude, longitude) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)'
-        cursor.execute(insert_dealer_sql, (name, address, post_code, phone, service, province, city, district, village, latitude, longitude))
-        connection.commit()
-        connection.close()
+        with self.transaction() as cursor:
+            cursor.execute(insert_dealer_sql, (name, address, post_code, phone, service, province, city, district, village, latitude, longitude))
         print("Dealer successfully added")
 
     def insert_technician(self, name, status, id_dealer):
         """Insert a new technician into the database."""
-        connection = sqlite3.connect(self.db_name)
-        cursor = connection.cursor()
-        # Enable foreign key constraint
-        connection.execute("PRAGMA foreign_keys = ON")
         insert_dealers_sql = 'INSERT INTO technicians (name, status, id_dealer) VALUES (?, ?, ?)'
-        cursor.execute(insert_dealers_sql, (name, status, id_dealer,))
-        connection.commit()
-        connection.close()
+        with self.transaction() as cursor:
+            cursor.execute(insert_dealers_sql, (name, status, id_dealer,))
         print("Technician successfully added")
 
-    def insert_booking(self, customer_name, customer_plate_number, start_time, end_time, status, id_technician, id_dealer):
-        """Insert a new booking into the database."""
-        connection = sqlite3.connect(self.db_name)
-        cursor = connection.cursor()
-        # Enable foreign key constraint
-        connection.execute("PRAGMA foreign_keys = ON")
+    def _insert_booking(self, cursor, customer_name, customer_plate_number, start_time, end_time, status, id_technician, id_dealer):
+        """Insert a booking and give it its booking code, on the caller's transaction."""
         insert_booking_sql = 'INSERT INTO bookings (customer_name, customer_plate_number, start_time, end_time, status, id_technician, id_dealer) VALUES (?, ?, ?, ?, ?, ?, ?)'
         cursor.execute(insert_booking_sql, (customer_name, customer_plate_number, start_time, end_time, status, id_technician, id_dealer))
         booking_id = cursor.lastrowid
         booking_code = self.generate_booking_code(customer_plate_number, booking_id)
         cursor.execute("UPDATE bookings SET booking_code = ? WHERE id = ?", (booking_code, booking_id,))
-        connection.commit()
-        connection.close()
+        return booking_code
+
+    def insert_booking(self, customer_name, customer_plate_number, start_time, end_time, status, id_technician, id_dealer):
+        """Insert a new booking into the database."""
+        with self.transaction() as cursor:
+            booking_code = self._insert_booking(cursor, customer_name, customer_plate_number, start_time, end_time, status, id_technician, id_dealer)
         print(f"Booking successfully added with booking code {booking_code}")
         return f"Booking successfully added with booking code {booking_code}"
 
     def insert_booking_from_tool(self, customer_name, customer_plate_number, technician_name, dealer_name, start_time, end_time):
-        """Insert a booking from tool with dealer and technician names."""
-        connection = sqlite3.connect(self.db_name)
-        cursor = connection.cursor()
+        """
+        Insert a booking from tool with dealer and technician names, in a single transaction.
 
-        # Cari dealer_id berdasarkan nama dealer
-        id_dealer = self.get_dealer_id_by_name(dealer_name)
+        The technician is checked to be free inside the transaction, which holds the database's write lock,
+        so two sessions can never book the same technician for overlapping times.
+        """
+        start_time = datetime.strptime(start_time, TIME_FORMAT).strftime(TIME_FORMAT)
+        end_time = datetime.strptime(end_time, TIME_FORMAT).strftime(TIME_FORMAT)
+        if end_time <= start_time:
+            return "The end time must be after the start time"
 
-        if not id_dealer:
-            return f"Dealer '{dealer_name}' not found"
+        with self.transaction() as cursor:
+            # Cari dealer_id berdasarkan nama dealer
+            id_dealer = self.get_dealer_id_by_name(dealer_name, cursor)
 
-        # Cari id_technician
-        id_technician = self.get_technician_id_by_name(id_dealer, technician_name)
+            if not id_dealer:
+                return f"Dealer '{dealer_name}' not found"
 
-        if not id_technician:
-            return f"Technician '{technician_name}' not found"
+            # Cari id_technician
+            id_technician = self.get_technician_id_by_name(id_dealer, technician_name, cursor)
 
-        # Enable foreign key constraint
-        connection.execute("PRAGMA foreign_keys = ON")
-        insert_booking_sql = 'INSERT INTO bookings (customer_name, customer_plate_number, start_time, end_time, status, id_technician, id_dealer) VALUES (?, ?, ?, ?, ?, ?, ?)'
-        status = "Scheduled"
-        cursor.execute(insert_booking_sql, (customer_name, customer_plate_number, start_time, end_time, status, id_technician, id_dealer))
-        booking_id = cursor.lastrowid
-        booking_code = self.generate_booking_code(customer_plate_number, booking_id)
-        cursor.execute("UPDATE bookings SET booking_code = ? WHERE id = ?", (booking_code, booking_id,))
-        connection.commit()
-        connection.close()
+            if not id_technician:
+                return f"Technician '{technician_name}' not found"
+
+            self.availability.refresh(cursor)
+            if not self.availability.is_free(id_technician, start_time, end_time):
+                return f"Technician '{technician_name}' is already booked between {start_time} and {end_time}"
+
+            booking_code = self._insert_booking(cursor, customer_name, customer_plate_number, start_time, end_time, "Scheduled", id_technician, id_dealer)
         print(f"Booking successfully added with booking code {booking_code}")
         return f"Booking successfully added with booking code {booking_code}"
 
-    def get_dealer_id_by_name(self, dealer_name):
-        """Get dealer ID by dealer name."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+    def get_dealer_id_by_name(self, dealer_name, cursor=None):
+        """Get dealer ID by dealer name, on the given cursor's transaction if there is one."""
+        if cursor is None:
+            with self.connection() as connection:
+                return self.get_dealer_id_by_name(dealer_name, connection.cursor())
 
         # Query untuk mencari dealer_id berdasarkan nama dealer
         cursor.execute("SELECT id FROM DEALERS WHERE name = ?", (dealer_name,))
         dealer_id = cursor.fetchone()
 
-        conn.close()
-
         if dealer_id:
             return dealer_id[0]
         else:
             return None  # Jika dealer tidak ditemukan
 
-    def get_technician_id_by_name(self, id_dealer, technician_name):
-        """Get technician ID by name and dealer ID."""
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+    def get_technician_id_by_name(self, id_dealer, technician_name, cursor=None):
+        """Get technician ID by name and dealer ID, on the given cursor's transaction if there is one."""
+        if cursor is None:
+            with self.connection() as connection:
+                return self.get_technician_id_by_name(id_dealer, technician_name, connection.cursor())
 
         # Query untuk mencari dealer_id berdasarkan nama dealer
         cursor.execute("SELECT id FROM TECHNICIANS WHERE name = ? AND id_dealer = ?", (technician_name, id_dealer,))
         technician_id = cursor.fetchone()
 
-        conn.close()
-
         if technician_id:
             return technician_id[0]
         else:
             return None  # Jika dealer tidak ditemukan
 
     def check_available_technicians(self, dealer_name, start_time, end_time):
-        """Check available technicians for a given time slot."""
-        # Cari dealer_id berdasarkan nama dealer
-        dealer_id = self.get_dealer_id_by_name(dealer_name)
-
-        if not dealer_id:
-            return f"Dealer '{dealer_name}' not found"
+        """Check which of the dealer's technicians are available for a given time slot."""
+        # Konversi waktu string ke format datetime, to validate them, then back to the stored text format
+        start_time = datetime.strptime(start_time, TIME_FORMAT).strftime(TIME_FORMAT)
+        end_time = datetime.strptime(end_time, TIME_FORMAT).strftime(TIME_FORMAT)
 
-        # Konversi waktu string ke format datetime
-        start_time = datetime.strptime(start_time, '%Y-%m-%d %H:%M:%S')
-        end_time = datetime.strptime(end_time, '%Y-%m-%d %H:%M:%S')
+        with self.connection() as connection:
+            cursor = connection.cursor()
 
-        # Koneksi ke database SQLite
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
+            # Cari dealer_id berdasarkan nama dealer
+            dealer_id = self.get_dealer_id_by_name(dealer_name, cursor)
 
-        # Query untuk mencari teknisi yang tidak terjadwal pada waktu yang dipilih
-        query = '''
-            SELECT t.id, t.name
-            FROM TECHNICIANS t
-            WHERE t.id NOT IN (
-                SELECT b.id_technician
-                FROM BOOKINGS b
-                WHERE b.id_dealer = ?
-                AND (
-                    (b.start_time < ? AND b.end_time > ?)   -- Tumpang tindih 1: Booking dimulai sebelum dan berakhir setelah
-                    OR (b.start_time < ? AND b.end_time > ?) -- Tumpang tindih 2: Booking dimulai sebelum dan berakhir setelah
-                    OR (b.start_time >= ? AND b.end_time <= ?) -- Tumpang tindih 3: Booking dimulai dan berakhir di dalam rentang waktu
-                    OR (b.start_time <= ? AND b.end_time >= ?)   -- Tumpang tindih 4: Booking dimulai sebelum dan berakhir di dalam rentang waktu
-                )
-            )
-        '''
+            if not dealer_id:
+                return f"Dealer '{dealer_name}' not found"
 
-        # Eksekusi query untuk mencari teknisi yang tersedia
-        cursor.execute(query, (dealer_id, start_time, start_time, end_time, end_time, start_time, end_time, start_time, end_time))
-        available_technicians = cursor.fetchall()
+            self.availability.refresh(cursor)
 
-        conn.close()
+        # Teknisi dealer ini yang tidak terjadwal pada waktu yang dipilih
+        technician_names = self.availability.free_technicians(dealer_id, start_time, end_time)
 
         # Menyusun hasil dalam satu teks
-        if available_technicians:
-            technician_names = [technician[1] for technician in available_technicians]
+        if technician_names:
             return "Available Technicians: " + ", ".join(technician_names)  # Gabungkan nama teknisi dalam satu teks
         else:
             return "No technicians available"  # Tidak ada teknisi yang tersedia
 
+    def find_free_slots(self, dealer_name, after, duration_minutes=60, count=5):
+        """Find the next free slots at a dealer from a given time, with the technicians free in each."""
+        after = datetime.strptime(after, TIME_FORMAT)
+
+        with self.connection() as connection:
+            cursor = connection.cursor()
+
+            # Cari dealer_id berdasarkan nama dealer
+            dealer_id = self.get_dealer_id_by_name(dealer_name, cursor)
+
+            if not dealer_id:
+                return f"Dealer '{dealer_name}' not found"
+
+            self.availability.refresh(cursor)
+
+        slots = self.availability.next_free_slots(dealer_id, after, duration_minutes, count)
+        if not slots:
+            return f"No free slots in the next {SLOT_SEARCH_DAYS} days"
+        return "Free Slots:\n" + "\n".join(
+            f"{i}. {start_time} - {end_time}: {', '.join(names)}" for i, (start_time, end_time, names) in enumerate(slots, 1)
+        )
+
+    @staticmethod
+    def dealer_search_terms(text, prefix=False):
+        """Quote each word of the input as a term, so user input can never break the FTS5 query syntax."""
+        return [f'"{word}"*' if prefix else f'"{word}"' for word in re.findall(r"\w+", text or "")]
+
+    def search_dealers(self, province=None, city=None, district=None, village=None, text=None, limit=DEALER_SEARCH_LIMIT):
+        """
+        Search dealers by location and free text through the DEALERS_FTS index, best matches first.
+
+        Every word of each location field must match in that column; any word of the free text may match in any column.
+        If nothing matches, the most specific location fields are dropped one at a time until something does.
+
+        Args:
+            province: Province (Provinsi)
+            city: City or regency (Kota/Kabupaten)
+            district: District (Kecamatan)
+            village: Village (Kelurahan/Desa)
+            text: Free text, such as a dealer name, street or service
+            limit: Maximum number of dealers to return
+
+        Returns:
+            tuple: (list of dealer dicts, list of the location fields that were used)
+        """
+        locations = {"province": province, "city": city, "district": district, "village": village}
+        used = [field for field in DEALER_LOCATION_FIELDS if self.dealer_search_terms(locations[field])]
+        # Location names are matched as whole words; free text words also match as prefixes
+        text_terms = self.dealer_search_terms(text, prefix=True)
+        limit = max(1, min(int(limit), DEALER_SEARCH_MAX_LIMIT))
+
+        query = '''
+            SELECT d.name, d.address, d.phone, d.service, d.province, d.city, d.district, d.village
+            FROM DEALERS_FTS
+            JOIN DEALERS d ON d.id = DEALERS_FTS.rowid
+            WHERE DEALERS_FTS MATCH ?
+            ORDER BY DEALERS_FTS.rank
+            LIMIT ?
+        '''
+        columns = ["name", "address", "phone", "service", "province", "city", "district", "village"]
+
+        with self.connection() as connection:
+            while True:
+                clauses = [f"{field} : ({' AND '.join(self.dealer_search_terms(locations[field]))})" for field in used]
+                if text_terms:
+                    clauses.append(f"({' OR '.join(text_terms)})")
+                if not clauses:
+                    return [], used
+                rows = connection.execute(query, (" AND ".join(clauses), limit)).fetchall()
+                if rows or not used:
+                    return [dict(zip(columns, row)) for row in rows], used
+                # Nothing matched: relax the most specific location field and try again
+                used = used[:-1]
+
+    def nearest_dealers(self, latitude, longitude, k=5, service=None):
+        """
+        Find the k dealers nearest to a point, optionally only those offering a service.
+
+        Dealers are looked up by grid cell in a square around the point that doubles in size until it holds k dealers
+        and the k-th nearest is closer than anything outside the square could be; they are then ranked by haversine distance.
+
+        Args:
+            latitude: Latitude in degrees
+            longitude: Longitude in degrees
+            k: Number of dealers to return
+            service: Only dealers whose service contains this text (e.g. "penjualan"), if given
+
+        Returns:
+            list: Dealer dicts, nearest first, each with its distance_km
+        """
+        latitude, longitude = float(latitude), float(longitude)
+        k = max(1, min(int(k), DEALER_SEARCH_MAX_LIMIT))
+        lat_cell = math.floor(latitude / GRID_DEGREES)
+        lon_cell = math.floor(longitude / GRID_DEGREES)
+
+        query = '''
+            SELECT name, address, phone, service, province, city, district, village, latitude, longitude
+            FROM DEALERS
+            WHERE lat_cell BETWEEN ? AND ? AND lon_cell BETWEEN ? AND ?
+            AND (? IS NULL OR instr(lower(service), lower(?)) > 0)
+        '''
+        columns = ["name", "address", "phone", "service", "province", "city", "district", "village"]
+        service = service.strip() if service and service.strip() else None
+
+        radius = 1
+        with self.connection() as connection:
+            while True:
+                rows = connection.execute(
+                    query, (lat_cell - radius, lat_cell + radius, lon_cell - radius, lon_cell + radius, service, service)
+                ).fetchall()
+                dealers = []
+                for row in rows:
+                    try:
+                        distance = haversine_km(latitude, longitude, float(row[8]), float(row[9]))
+                    except ValueError:
+                        continue  # Koordinat tidak valid
+                    dealers.append({**dict(zip(columns, row)), "distance_km": round(distance, 2)})
+                dealers.sort(key=lambda dealer: dealer["distance_km"])
+
+                # Anything outside the square is at least `radius` cells away along one axis;
+                # a degree of longitude is shortest at the square's edge furthest from the equator
+                edge_latitude = min(90.0, abs(latitude) + (radius + 1) * GRID_DEGREES)
+                outside_km = radius * GRID_DEGREES * KM_PER_DEGREE * math.cos(math.radians(edge_latitude))
+                if len(dealers) >= k and dealers[k - 1]["distance_km"] <= outside_km:
+                    return dealers[:k]
+                if radius * GRID_DEGREES >= 360:
+                    return dealers[:k]
+                radius *= 2
+
     def get_booking(self, booking_code):
         """Get booking details by booking code."""
         # booking code upper
         booking_code = booking_code.upper()
 
-        # Koneksi ke database
-        conn = sqlite3.connect(self.db_name)
-        cursor = conn.cursor()
-
         # Query untuk mendapatkan booking terbaru dengan JOIN untuk mendapatkan nama technician dan dealer
         query = '''
             SELECT
@@ -260,16 +703,14 @@ class BroomBotDatabase:
             FROM BOOKINGS b
             JOIN TECHNICIANS t ON b.id_technician = t.id
             JOIN DEALERS d ON b.id_dealer = d.id
-            WHERE UPPER(b.booking_code) = ?
+            WHERE b.booking_code = ?
             ORDER BY b.id DESC
             LIMIT 1
         '''
 
-        # Eksekusi query
-        cursor.execute(query, (booking_code,))
-        booking = cursor.fetchone()
-
-        conn.close()
+        # Booking codes are generated in upper case, so comparing directly uses the booking_code unique index
+        with self.connection() as connection:
+            booking = connection.execute(query, (booking_code,)).fetchone()
 
         # Return hasil booking
         if booking:
@@ -290,16 +731,11 @@ class BroomBotDatabase:
 
     def drop_all_tables(self):
         """Drop all tables from the database."""
-        connection = sqlite3.connect(self.db_name)
-        cursor = connection.cursor()
-
-        # Menjalankan perintah DROP TABLE untuk setiap tabel
-        cursor.execute("DROP TABLE IF EXISTS BOOKINGS")
-        cursor.execute("DROP TABLE IF EXISTS TECHNICIANS")
-        cursor.execute("DROP TABLE IF EXISTS DEALERS")
-
-        connection.commit()
-        connection.close()
+        with self.transaction() as cursor:
+            # Menjalankan perintah DROP TABLE untuk setiap tabel
+            cursor.execute("DROP TABLE IF EXISTS BOOKINGS")
+            cursor.execute("DROP TABLE IF EXISTS TECHNICIANS")
+            cursor.execute("DROP TABLE IF EXISTS DEALERS")
 
         print("All tables have been dropped.")
 
@@ -1,5 +1,4 @@
 from google.adk.agents import LlmAgent, SequentialAgent
-from google.adk.tools import agent_tool
 from google.adk.tools.function_tool import FunctionTool
 from dotenv import load_dotenv
 from .tool_broombot import BroomBotTools
@@ -23,7 +22,7 @@ class BroomBotAgent:
 
         # Initialize the 4 main agents
         # Note: booking_agent creates its own sub-agents:
-        #   - dealer_location_agent (with sql_agent)
+        #   - dealer_location_agent
         #   - appointment_agent
         #   - check_booking_agent
         # Note: lead_analysis_agent is a SequentialAgent workflow with 4 phases:
@@ -81,42 +80,6 @@ class BroomBotAgent:
             model=self.model
         )
     
-    def _create_sql_agent(self) -> LlmAgent:
-        """Create and return the SQL Agent."""
-        return LlmAgent(
-            name="sql_agent",
-            instruction=(
-                "You are a SQL Agent for Broom Bot Inc. Your task is to generate and execute SQL queries to find dealer locations.\n\n"
-                "Database Schema:\n"
-                "DEALERS(\n"
-                "  id INTEGER PRIMARY KEY,\n"
-                "  name TEXT,\n"
-                "  address TEXT,\n"
-                "  post_code INTEGER,\n"
-                "  phone TEXT,\n"
-                "  service TEXT,\n"
-                "  province TEXT,\n"
-                "  city TEXT,\n"
-                "  district TEXT,\n"
-                "  village TEXT,\n"
-                "  latitude TEXT,\n"
-                "  longitude TEXT\n"
-                ")\n\n"
-                "Process:\n"
-                "1. Use rag_sql_tool to get few-shot SQL examples\n"
-                "2. Generate a SELECT query based on user's location input (province, city, district)\n"
-                "3. Execute the query using find_dealer_location_tool\n"
-                "4. Return the dealer list\n\n"
-                "Rules:\n"
-                "- Only use SELECT statements\n"
-                "- Use LIKE for partial matching (e.g., WHERE city LIKE '%Jakarta%')\n"
-                "- No explanations, just execute and return results"
-            ),
-            tools=[self.broombot_tools.rag_sql_tool, self.broombot_tools.find_dealer_location_tool],
-            description="SQL Agent generates and executes SQL queries to find dealer locations.",
-            model=self.model
-        )
-
     def _create_dealer_location_agent(self) -> LlmAgent:
         """Create and return the Dealer Location Agent."""
         return LlmAgent(
@@ -126,7 +89,11 @@ class BroomBotAgent:
                 "Process:\n"
                 "1. Ask the user for their location: province (Provinsi), city/district (Kota/Kabupaten), and subdistrict (Kecamatan)\n"
                 "2. If user provides partial information, ask for missing details\n"
-                "3. Once you have the location, use the SQL Agent to find matching dealers\n"
+                "3. Once you have the location, call find_dealer_location_tool with the province, city, district\n"
+                "   and village (pass only what the user gave, and any dealer name or service as text)\n"
+                "   - If the user shares coordinates, or asks for the nearest dealer, or the location search\n"
+                "     finds nothing for their area, call nearest_dealers_tool with the latitude and longitude\n"
+                "     of their location (estimate them from the place names if needed) and show the distances\n"
                 "4. Present the dealer options to the user with:\n"
                 "   - Dealer name\n"
                 "   - Address\n"
@@ -138,7 +105,7 @@ class BroomBotAgent:
                 "- Clear and concise\n"
                 "- Guide users step by step"
             ),
-            tools=[agent_tool.AgentTool(agent=self._create_sql_agent())],
+            tools=[self.broombot_tools.find_dealer_location_tool, self.broombot_tools.nearest_dealers_tool],
             description="Dealer Location Agent helps customers find and select a dealer location.",
             model=self.model
         )
@@ -159,6 +126,8 @@ class BroomBotAgent:
                 "   - Do NOT mention conversion to user, just do it silently\n"
                 "3. Verify working hours (08:00 - 17:00). If outside, ask for a valid time\n"
                 "4. Check technician availability using check_technician_availability_tool\n"
+                "   - If nobody is free then, or the customer has no preferred time, call find_free_slots_tool\n"
+                "     from the preferred time and offer the slots it returns, instead of guessing other times\n"
                 "5. Show available technicians and ask user to select one (or choose randomly if they don't mind)\n"
                 "6. Collect customer information:\n"
                 "   - Full name\n"
@@ -182,11 +151,12 @@ class BroomBotAgent:
                 "- If tool execution fails or user cancels, say 'Booking dibatalkan'\n"
                 "- Don't say 'Let me check' or 'I will convert' - just do it silently\n"
                 "- Be natural and conversational\n"
-                "- If no technicians available, suggest alternative times"
+                "- If no technicians available, suggest the alternative times from find_free_slots_tool"
             ),
             tools=[
                 self.broombot_tools.get_today_date_tool,
                 self.broombot_tools.check_technician_availability_tool,
+                self.broombot_tools.find_free_slots_tool,
                 FunctionTool(self.broombot_tools.book_service_tool, require_confirmation=True)
             ],
             description="Appointment Agent handles scheduling and booking confirmation.",
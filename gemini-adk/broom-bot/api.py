@@ -14,7 +14,7 @@ import asyncio
 import uuid
 from contextlib import asynccontextmanager
 
-from .agent import BroomBotAgent
+from .agent import BroomBotAgent, broombot_agent
 
 
 # ============================================================================
@@ -69,13 +69,21 @@ class SessionManager:
     def __init__(self):
         self.sessions: Dict[str, Dict[str, Any]] = {}
         self.agents: Dict[str, BroomBotAgent] = {}
+        # One agent system per model, shared by every session using that model
+        self.model_agents: Dict[str, BroomBotAgent] = {broombot_agent.model: broombot_agent}
+
+    def get_model_agent(self, model: str) -> BroomBotAgent:
+        """Get the shared agent system for a model, creating it on first use"""
+        if model not in self.model_agents:
+            self.model_agents[model] = BroomBotAgent(model=model)
+        return self.model_agents[model]
 
     def create_session(self, model: str = "gemini-2.5-pro") -> str:
         """Create a new session and return session ID"""
         session_id = str(uuid.uuid4())
 
-        # Create agent instance for this session
-        agent = BroomBotAgent(model=model)
+        # Agents hold no conversation state, so sessions share the agent system for their model
+        agent = self.get_model_agent(model)
 
         self.sessions[session_id] = {
             "created_at": datetime.utcnow(),
@@ -103,7 +111,7 @@ class SessionManager:
             self.sessions[session_id]["message_count"] += 1
 
     def delete_session(self, session_id: str) -> bool:
-        """Delete a session and cleanup resources"""
+        """Delete a session (the shared agent system stays loaded)"""
         if session_id in self.sessions:
             del self.sessions[session_id]
             if session_id in self.agents:
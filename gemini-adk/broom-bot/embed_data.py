@@ -7,9 +7,74 @@ from langchain_core.documents import Document
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from dotenv import load_dotenv
 from uuid import uuid4
+import threading
 import os
 
 
+# Registry untuk seluruh proses: satu QdrantClient per folder penyimpanan, satu client embedding per model
+# dan satu QdrantEmbedGemini per collection, dipakai bersama oleh semua session.
+# Qdrant lokal mengunci folder penyimpanannya, jadi client kedua pada folder yang sama akan gagal dibuka.
+_registry_lock = threading.Lock()
+_qdrant_clients = {}
+_embeddings = {}
+_collections = {}
+
+
+def get_qdrant_client(path: str):
+    """
+    Get the process-wide embedded Qdrant client for a storage folder, opening it on first use.
+
+    Args:
+        path: Folder of the local Qdrant storage
+
+    Returns:
+        tuple: (QdrantClient, lock to hold while using the client)
+    """
+    path = os.path.abspath(path)
+    with _registry_lock:
+        if path not in _qdrant_clients:
+            # Qdrant lokal tidak thread-safe, akses ke satu folder diserialkan dengan lock ini
+            _qdrant_clients[path] = (QdrantClient(path=path), threading.RLock())
+        return _qdrant_clients[path]
+
+
+def get_embeddings(model: str = None):
+    """
+    Get the process-wide Gemini embeddings client for a model.
+
+    Args:
+        model: Embedding model name (default: EMBEDDING_MODEL or "models/gemini-embedding-001")
+
+    Returns:
+        GoogleGenerativeAIEmbeddings: Shared embeddings client
+    """
+    load_dotenv()
+    model = model or os.getenv("EMBEDDING_MODEL", "models/gemini-embedding-001")
+    with _registry_lock:
+        if model not in _embeddings:
+            _embeddings[model] = GoogleGenerativeAIEmbeddings(model=model)
+        return _embeddings[model]
+
+
+def get_collection(collection_name: str) -> "QdrantEmbedGemini":
+    """
+    Get the process-wide QdrantEmbedGemini for a collection, creating it on first use.
+
+    Args:
+        collection_name: Name of the Qdrant collection
+
+    Returns:
+        QdrantEmbedGemini: Shared instance for the collection
+    """
+    with _registry_lock:
+        collection = _collections.get(collection_name)
+    if collection is None:
+        collection = QdrantEmbedGemini(collection_name)
+        with _registry_lock:
+            collection = _collections.setdefault(collection_name, collection)
+    return collection
+
+
 class QdrantEmbedGemini:
     def __init__(self, collection_name: str):
         load_dotenv()
@@ -17,15 +82,14 @@ class QdrantEmbedGemini:
         abspath = os.path.dirname(os.path.abspath(__file__))
         self.collection_name = collection_name
         qdrant_path = os.path.join(abspath, "vector-database", self.collection_name)
-        self.qdrant = QdrantClient(path=qdrant_path)
+        self.qdrant, self.lock = get_qdrant_client(qdrant_path)
 
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model=os.getenv("EMBEDDING_MODEL", "models/gemini-embedding-001")
-        )
+        self.embeddings = get_embeddings()
 
         # cek apakah collection sudah ada
         try:
-            self.qdrant.get_collection(self.collection_name)
+            with self.lock:
+                self.qdrant.get_collection(self.collection_name)
             # kalau ada, langsung buat vector_store
             self.vector_store = QdrantVectorStore(
                 client=self.qdrant,
@@ -39,10 +103,11 @@ class QdrantEmbedGemini:
             print(f"Collection '{self.collection_name}' belum ada, silakan create_collection() dulu.")
 
     def create_collection(self):
-        self.qdrant.create_collection(
-            collection_name=self.collection_name,
-            vectors_config=VectorParams(size=3072, distance=Distance.COSINE)
-        )
+        with self.lock:
+            self.qdrant.create_collection(
+                collection_name=self.collection_name,
+                vectors_config=VectorParams(size=3072, distance=Distance.COSINE)
+            )
         self.vector_store = QdrantVectorStore(
             client=self.qdrant,
             collection_name=self.collection_name,
@@ -61,7 +126,8 @@ class QdrantEmbedGemini:
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=40)
         docs = text_splitter.split_documents(data)
         uuids = [str(uuid4()) for _ in range(len(docs))]
-        self.vector_store.add_documents(documents=docs, ids=uuids)
+        with self.lock:
+            self.vector_store.add_documents(documents=docs, ids=uuids)
         print("Embed success")
 
     def embedding_data_product(self):
@@ -75,7 +141,8 @@ class QdrantEmbedGemini:
         text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=40)
         docs = text_splitter.split_documents(data)
         uuids = [str(uuid4()) for _ in range(len(docs))]
-        self.vector_store.add_documents(documents=docs, ids=uuids)
+        with self.lock:
+            self.vector_store.add_documents(documents=docs, ids=uuids)
         print("Embed success")
 
     def fewshot_embed(self):
@@ -95,7 +162,8 @@ class QdrantEmbedGemini:
             Document(page_content="Request: Saya di kota Denpasar, apakah ada dealer yang menyediakan servis motor? \nSQL: SELECT * FROM Dealers WHERE city LIKE '%Denpasar%';")
         ]
         uuids = [str(uuid4()) for _ in range(len(docs))]
-        self.vector_store.add_documents(documents=docs, ids=uuids)
+        with self.lock:
+            self.vector_store.add_documents(documents=docs, ids=uuids)
 
         print("Few Shot Successfully Embed")
 
@@ -103,7 +171,10 @@ class QdrantEmbedGemini:
         if self.vector_store is None:
             raise ValueError("Vector store belum siap. Jalankan create_collection() dulu!")
 
-        results = self.vector_store.similarity_search(query, k=k)
+        # Embedding query dilakukan di luar lock, hanya pencarian di Qdrant lokal yang diserialkan
+        embedding = self.embeddings.embed_query(query)
+        with self.lock:
+            results = self.vector_store.similarity_search_by_vector(embedding, k=k)
         for res in results:
             print(f"* {res.page_content} [{res.metadata}]")
         return results
@@ -1,4 +1,4 @@
-from .embed_data import QdrantEmbedGemini
+from .embed_data import get_collection
 from .Database import BroomBotDatabase
 from .LeadDatabase import LeadAnalysisDatabase
 from google.adk.tools.tool_context import ToolContext
@@ -7,9 +7,9 @@ class BroomBotTools:
     """Class to manage BroomBot tools for product and service searches."""
 
     def __init__(self):
-        """Initialize Qdrant embedding instances for service and product collections."""
-        self.qdrant_service = QdrantEmbedGemini(collection_name="qdrant_data_service")
-        self.qdrant_product = QdrantEmbedGemini(collection_name="qdrant_data_product")
+        """Get the shared Qdrant embedding instances for the service and product collections."""
+        self.qdrant_service = get_collection("qdrant_data_service")
+        self.qdrant_product = get_collection("qdrant_data_product")
         self.database = BroomBotDatabase()
         self.lead_database = LeadAnalysisDatabase()  # New: Lead Analysis Database
 
@@ -67,76 +67,78 @@ class BroomBotTools:
         except Exception as e:
             return f"Error searching service database: {str(e)}"
         
-    def rag_sql_tool(self, question: str) -> str:
+    def find_dealer_location_tool(self, province: str = "", city: str = "", district: str = "", village: str = "", text: str = "", limit: int = 5) -> str:
         """
-        Search for the few shot query from question.
+        Find dealer locations by province, city, district, village and free text.
 
         Args:
-            question: The input from user
+            province: Province (Provinsi), e.g. "Riau"
+            city: City or regency (Kota/Kabupaten), e.g. "Indragiri Hulu"
+            district: District (Kecamatan), e.g. "Rengat"
+            village: Village (Kelurahan/Desa), e.g. "Pematang Reba"
+            text: Free text such as a dealer name, street or service, e.g. "bengkel"
+            limit: Maximum number of dealers to return (default: 5)
 
         Returns:
-            str: Few shot SQL query matching the question
+            str: The best matching dealers with their address, phone and service
         """
-
         try:
-            results = self.qdrant_service.search(question, k=3)
+            dealers, used = self.database.search_dealers(province, city, district, village, text, limit)
 
-            if not results:
-                return "No dealer information found for your question."
+            if not dealers:
+                return "No dealer locations found matching your query."
 
-            # Format the results
+            # Say which location filters matched when the most specific ones had to be dropped
+            requested = [field for field, value in [("province", province), ("city", city), ("district", district), ("village", village)] if value and value.strip()]
             formatted_results = []
-            for i, res in enumerate(results, 1):
-                formatted_results.append(f"{i}. {res.page_content}")
+            if len(used) < len(requested):
+                dropped = ", ".join(field for field in requested if field not in used)
+                formatted_results.append(f"No dealers found for the given {dropped}; showing the nearest matches instead.\n")
 
-            return "\n\n".join(formatted_results)
+            # Format the results
+            for i, dealer in enumerate(dealers, 1):
+                dealer_info = f"Dealer {i}:\n"
+                for col_name, value in dealer.items():
+                    dealer_info += f"  {col_name}: {value}\n"
+                formatted_results.append(dealer_info)
+
+            return "\n".join(formatted_results)
 
         except Exception as e:
-            return f"Error searching dealer database: {str(e)}"
+            return f"Error searching dealers: {str(e)}"
 
-    def find_dealer_location_tool(self, sql_query: str) -> str:
+    def nearest_dealers_tool(self, latitude: float, longitude: float, k: int = 5, service: str = "") -> str:
         """
-        Find dealer locations based on the provided SQL query.
+        Find the dealers nearest to a location by distance.
 
         Args:
-            sql_query: The SQL query to find dealer locations (e.g., "SELECT * FROM Dealers WHERE city LIKE '%Jakarta%'")
-            ctx: Tool context from the agent
+            latitude: Latitude of the customer's location in degrees, e.g. -0.3711
+            longitude: Longitude of the customer's location in degrees, e.g. 102.5434
+            k: Number of dealers to return (default: 5)
+            service: Only dealers offering this service, e.g. "penjualan" (default: any)
+
         Returns:
-            str: Dealer locations matching the SQL query
+            str: The nearest dealers with their distance, address, phone and service
         """
         try:
-            import sqlite3
-
-            # Connect to the database
-            conn = sqlite3.connect(self.database.db_name)
-            cursor = conn.cursor()
-
-            # Execute the SQL query
-            cursor.execute(sql_query)
-            results = cursor.fetchall()
-
-            # Get column names
-            column_names = [description[0] for description in cursor.description]
-
-            conn.close()
+            dealers = self.database.nearest_dealers(latitude, longitude, k, service)
 
-            if not results:
-                return "No dealer locations found matching your query."
+            if not dealers:
+                return "No dealers found near this location."
 
             # Format the results
             formatted_results = []
-            for i, row in enumerate(results, 1):
-                dealer_info = f"Dealer {i}:\n"
-                for col_name, value in zip(column_names, row):
-                    dealer_info += f"  {col_name}: {value}\n"
+            for i, dealer in enumerate(dealers, 1):
+                dealer_info = f"Dealer {i} ({dealer['distance_km']} km away):\n"
+                for col_name, value in dealer.items():
+                    if col_name != "distance_km":
+                        dealer_info += f"  {col_name}: {value}\n"
                 formatted_results.append(dealer_info)
 
             return "\n".join(formatted_results)
 
-        except sqlite3.Error as e:
-            return f"Database error: {str(e)}"
         except Exception as e:
-            return f"Error executing query: {str(e)}"
+            return f"Error finding nearest dealers: {str(e)}"
 
     def get_today_date_tool(self) -> str:
         """
@@ -166,6 +168,24 @@ class BroomBotTools:
         except Exception as e:
             return f"Error checking technician availability: {str(e)}"
 
+    def find_free_slots_tool(self, dealer_name: str, from_time: str, count: int = 5) -> str:
+        """
+        Find the next free 1 hour service slots at a dealer, with the technicians free in each.
+
+        Args:
+            dealer_name: Name of the dealer
+            from_time: Earliest start time wanted, in YYYY-MM-DD HH:MM:SS format
+            count: How many slots to return (default: 5)
+
+        Returns:
+            str: The next free slots within working hours, each with its available technicians
+        """
+        try:
+            result = self.database.find_free_slots(dealer_name, from_time, duration_minutes=60, count=count)
+            return result
+        except Exception as e:
+            return f"Error finding free slots: {str(e)}"
+
     def book_service_tool(self, customer_name: str, customer_plate_number: str, technician_name: str, dealer_name: str, start_time: str, end_time: str, tool_context: ToolContext) -> str:
         """
         Book a service appointment.
@@ -331,7 +351,7 @@ Common Queries:
             str: Similar SQL query examples
         """
         try:
-            # Using rag_sql_tool logic for few-shot examples
+            # Search the service collection for few-shot examples
             results = self.qdrant_service.search(query_description, k=2)
 
             if not results: